@@ -30,6 +30,57 @@ CREATE TABLE IF NOT EXISTS control_log (
     FOREIGN KEY (id_config) REFERENCES config_log(id_config)
 );
 
+-- Số đo từng bước của mỗi lần chạy job (wall time, throughput, bytes, peak RSS)
+CREATE TABLE IF NOT EXISTS stage_metrics (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    id_config INT,
+    run_name VARCHAR(64) NOT NULL,
+    stage VARCHAR(64) NOT NULL,
+    status VARCHAR(16),
+    started_at DATETIME,
+    wall_seconds DOUBLE,
+    items INT,
+    items_per_sec DOUBLE,
+    bytes_written BIGINT,
+    peak_rss_bytes BIGINT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_stage_metrics_stage (stage, started_at),
+    FOREIGN KEY (id_config) REFERENCES config_log(id_config)
+);
+
+-- Work unit (hashtag) cho nhiều crawler device: nhận bằng lease theo dòng (FOR UPDATE SKIP LOCKED)
+CREATE TABLE IF NOT EXISTS crawl_work_unit (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    hashtag VARCHAR(255) NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE,
+    lease_owner VARCHAR(128) NULL,
+    lease_expires_at DATETIME NULL,
+    last_crawled_at DATETIME NULL,
+    last_status VARCHAR(64),
+    attempts INT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    update_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_crawl_work_unit_hashtag (hashtag),
+    INDEX idx_crawl_work_unit_owner (lease_owner)
+);
+
+-- Trạng thái từng file storage đã load vào staging (incremental ingestion)
+CREATE TABLE IF NOT EXISTS file_log (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    id_config INT,
+    file_name VARCHAR(255) NOT NULL,
+    file_size BIGINT,
+    file_mtime DOUBLE,
+    content_hash CHAR(64),
+    status VARCHAR(64),
+    total_record INT,
+    loaded_at DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    update_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_file_log_name (file_name),
+    FOREIGN KEY (id_config) REFERENCES config_log(id_config)
+);
+
 -- staging
 USE staging_tiktok;
 
@@ -41,7 +92,9 @@ CREATE TABLE IF NOT EXISTS staging_raw (
     raw_json JSON NOT NULL,
     file_path VARCHAR(1024) NULL,
     processed BOOLEAN DEFAULT FALSE,
-    UNIQUE KEY (apify_run_id, id)
+    UNIQUE KEY (apify_run_id, id),
+    INDEX idx_staging_raw_file (file_path(255)),
+    INDEX idx_staging_raw_processed (processed, id)
 );
 
 -- warehouse
@@ -87,9 +140,87 @@ CREATE TABLE IF NOT EXISTS fact_videos (
     FOREIGN KEY (dateKey) REFERENCES dim_date(dateKey)
 );
 
+-- Snapshot counters theo ngày crawl, chỉ append: một dòng mỗi (ngày crawl, video).
+-- Partition RANGE theo tháng của snapshotDateKey; transformer/snapshots.py tách pmax thành
+-- partition tháng mới và bỏ/archive partition cũ. Bảng partition không có FOREIGN KEY.
+CREATE TABLE IF NOT EXISTS fact_video_snapshot (
+    snapshotDateKey INT NOT NULL,
+    videoID BIGINT NOT NULL,
+    authorID BIGINT,
+    dateKey INT,
+    diggCount BIGINT,
+    shareCount BIGINT,
+    playCount BIGINT,
+    commentCount BIGINT,
+    collectCount BIGINT,
+    capturedAt DATETIME,
+    PRIMARY KEY (snapshotDateKey, videoID),
+    INDEX idx_fact_video_snapshot_video (videoID, snapshotDateKey)
+)
+PARTITION BY RANGE (snapshotDateKey) (
+    PARTITION p_start VALUES LESS THAN (20260101),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Hashtag chuẩn hoá (lower-case) + bảng nối video <-> hashtag (transformer/hashtags.py)
+-- Nâng cấp warehouse cũ: transform tự dựng bridge từ dim_videos.hashtagList ở lần chạy đầu
+-- (bridge rỗng), hoặc chạy thủ công: python transform_stage.py --backfill-hashtags
+CREATE TABLE IF NOT EXISTS dim_hashtag (
+    hashtagID INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY uq_dim_hashtag_name (name)
+);
+
+CREATE TABLE IF NOT EXISTS bridge_video_hashtag (
+    hashtagID INT NOT NULL,
+    videoID BIGINT NOT NULL,
+    PRIMARY KEY (hashtagID, videoID),
+    INDEX idx_bridge_video_hashtag_video (videoID, hashtagID),
+    FOREIGN KEY (hashtagID) REFERENCES dim_hashtag(hashtagID),
+    FOREIGN KEY (videoID) REFERENCES dim_videos(videoID)
+);
+
+-- Rollup theo ngày (dateKey = ngày đăng video): counters của snapshot mới nhất mỗi video.
+-- Được tính lại incremental cho các dateKey trong agg_dirty_date (transformer/rollups.py).
+CREATE TABLE IF NOT EXISTS agg_author_daily (
+    dateKey INT NOT NULL,
+    authorID BIGINT NOT NULL,
+    videoCount INT NOT NULL DEFAULT 0,
+    diggCount BIGINT NOT NULL DEFAULT 0,
+    shareCount BIGINT NOT NULL DEFAULT 0,
+    playCount BIGINT NOT NULL DEFAULT 0,
+    commentCount BIGINT NOT NULL DEFAULT 0,
+    collectCount BIGINT NOT NULL DEFAULT 0,
+    refreshedAt DATETIME,
+    PRIMARY KEY (dateKey, authorID),
+    INDEX idx_agg_author_daily_author (authorID, dateKey, playCount, diggCount, shareCount, commentCount, collectCount)
+);
+
+CREATE TABLE IF NOT EXISTS agg_hashtag_daily (
+    dateKey INT NOT NULL,
+    hashtag VARCHAR(255) NOT NULL,
+    videoCount INT NOT NULL DEFAULT 0,
+    diggCount BIGINT NOT NULL DEFAULT 0,
+    shareCount BIGINT NOT NULL DEFAULT 0,
+    playCount BIGINT NOT NULL DEFAULT 0,
+    commentCount BIGINT NOT NULL DEFAULT 0,
+    collectCount BIGINT NOT NULL DEFAULT 0,
+    refreshedAt DATETIME,
+    PRIMARY KEY (dateKey, hashtag),
+    INDEX idx_agg_hashtag_daily_hashtag (hashtag, dateKey, playCount, diggCount, shareCount, commentCount, collectCount)
+);
+
+-- dateKey có fact mới, chờ refresh rollup (ghi cùng transaction với fact_videos)
+CREATE TABLE IF NOT EXISTS agg_dirty_date (
+    dateKey INT PRIMARY KEY,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE INDEX idx_fact_videos_date ON fact_videos(dateKey);
 CREATE INDEX idx_fact_videos_author ON fact_videos(authorID);
 CREATE INDEX idx_dim_videos_author ON dim_videos(authorID);
+-- Snapshot mới nhất theo video trong một khoảng dateKey (refresh rollup)
+CREATE INDEX idx_fact_videos_date_video ON fact_videos(dateKey, videoID);
 
 -- ------------------------------
 -- Staging schema for raw TikTok entities (Authors, Videos, Interactions)
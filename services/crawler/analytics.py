@@ -0,0 +1,206 @@
+# analytics.py
+"""
+Phân tích tăng trưởng của video từ các file crawl trong STORAGE_PATH (không cần DB).
+Mỗi file là một snapshot counters tại thời điểm crawl; lịch sử được nạp thành ma trận
+NumPy (video x snapshot), ô video không có trong snapshot là NaN.
+
+    python analytics.py --metric playCount --rank acceleration --top 20
+    python analytics.py --since-hours 48 --rank velocity --json
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import numpy as np
+import config
+from logging_setup import logger
+import loader
+import storage
+
+COUNTER_COLUMNS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+RANKINGS = ("gain", "velocity", "acceleration")
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _snapshot_time(fpath):
+    _, _, fetched_at = storage.parse_filename(fpath)
+    if fetched_at is None:
+        fetched_at = datetime.fromtimestamp(os.path.getmtime(fpath))
+    return np.datetime64(fetched_at, "s")
+
+class SnapshotHistory:
+    """
+    Lịch sử counters theo video:
+    - video_ids: int64 (n,) đã sort; author_ids: int64 (n,), -1 nếu không rõ
+    - times: datetime64[s] (s,) đã sort, mỗi thời điểm crawl một cột
+    - values[metric]: float64 (n, s), NaN = video không xuất hiện trong snapshot đó
+    """
+
+    def __init__(self, video_ids, author_ids, times, values):
+        self.video_ids = video_ids
+        self.author_ids = author_ids
+        self.times = times
+        self.values = values
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    @classmethod
+    def load(cls, files, metrics=("playCount",)):
+        """Đọc các file storage (chỉ parse id, authorMeta.id và các counter cần dùng)."""
+        fields = ["id", "authorMeta.id"] + list(metrics)
+        file_times, file_ids, file_authors = [], [], []
+        file_values = {m: [] for m in metrics}
+        for fpath in files:
+            ids, authors = [], []
+            values = {m: [] for m in metrics}
+            for item in storage.iter_items(fpath, fields=fields):
+                video_id = _to_int(item["id"])
+                if video_id is None:
+                    continue
+                ids.append(video_id)
+                author_id = _to_int(item["authorMeta.id"])
+                authors.append(-1 if author_id is None else author_id)
+                for m in metrics:
+                    v = _to_int(item[m])
+                    values[m].append(np.nan if v is None else v)
+            file_times.append(_snapshot_time(fpath))
+            file_ids.append(np.array(ids, dtype=np.int64))
+            file_authors.append(np.array(authors, dtype=np.int64))
+            for m in metrics:
+                file_values[m].append(np.array(values[m], dtype=np.float64))
+
+        times, file_col = np.unique(np.array(file_times, dtype="datetime64[s]"), return_inverse=True)
+        all_ids = np.concatenate(file_ids) if file_ids else np.empty(0, dtype=np.int64)
+        video_ids, row = np.unique(all_ids, return_inverse=True)
+        col = np.repeat(file_col.reshape(-1), [len(ids) for ids in file_ids])
+        # File sau (theo thứ tự files) ghi đè nếu trùng (video, thời điểm)
+        author_ids = np.full(len(video_ids), -1, dtype=np.int64)
+        authors = np.concatenate(file_authors) if file_authors else np.empty(0, dtype=np.int64)
+        known = authors != -1
+        author_ids[row[known]] = authors[known]
+        values = {}
+        for m in metrics:
+            matrix = np.full((len(video_ids), len(times)), np.nan)
+            if len(all_ids):
+                matrix[row, col] = np.concatenate(file_values[m])
+            values[m] = matrix
+        logger.info("Loaded %d snapshots, %d videos from %d files", len(times), len(video_ids), len(files))
+        return cls(video_ids, author_ids, times, values)
+
+    def window(self, since=None):
+        """Bản chỉ gồm các snapshot có thời điểm >= since (datetime64)."""
+        if since is None:
+            return self
+        keep = self.times >= since
+        return SnapshotHistory(self.video_ids, self.author_ids, self.times[keep],
+                               {m: v[:, keep] for m, v in self.values.items()})
+
+    def deltas(self, metric):
+        """Chênh lệch giữa hai snapshot liên tiếp (n, s-1); NaN nếu thiếu một đầu."""
+        return np.diff(self.values[metric], axis=1)
+
+    def hourly_velocity(self, metric):
+        """Tốc độ tăng mỗi giờ giữa hai snapshot liên tiếp (n, s-1)."""
+        hours = np.diff(self.times).astype("timedelta64[s]").astype(np.float64) / 3600
+        return self.deltas(metric) / hours
+
+    def trend(self, metric):
+        """
+        Số đo xu hướng cho mỗi video, từ các snapshot video có mặt (vectorized, không lặp theo video):
+        - current: giá trị ở lần xuất hiện cuối
+        - gain: cuối - đầu
+        - velocity: gain / số giờ giữa lần đầu và lần cuối
+        - acceleration: tốc độ ở khoảng cuối (hai lần xuất hiện cuối) - tốc độ trước đó
+        Video chỉ xuất hiện một lần -> NaN (acceleration cần ít nhất ba lần).
+        """
+        matrix = self.values[metric]
+        n, s = matrix.shape
+        rows = np.arange(n)
+        seen = ~np.isnan(matrix)
+        count = seen.sum(axis=1)
+        if s == 0:
+            empty = np.full(n, np.nan)
+            return {"current": empty, "gain": empty, "velocity": empty, "acceleration": empty, "observations": count}
+        hours = (self.times - self.times[0]).astype("timedelta64[s]").astype(np.float64) / 3600
+
+        first = seen.argmax(axis=1)
+        last = s - 1 - seen[:, ::-1].argmax(axis=1)
+        before_last_seen = seen.copy()
+        before_last_seen[rows, last] = False
+        prev = s - 1 - before_last_seen[:, ::-1].argmax(axis=1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            current = matrix[rows, last]
+            gain = current - matrix[rows, first]
+            velocity = gain / (hours[last] - hours[first])
+            recent = (current - matrix[rows, prev]) / (hours[last] - hours[prev])
+            earlier = (matrix[rows, prev] - matrix[rows, first]) / (hours[prev] - hours[first])
+        velocity[count < 2] = np.nan
+        gain[count < 2] = np.nan
+        acceleration = recent - earlier
+        acceleration[count < 3] = np.nan
+        return {"current": current, "gain": gain, "velocity": velocity,
+                "acceleration": acceleration, "observations": count}
+
+def top_k(scores, k):
+    """Chỉ số k phần tử lớn nhất (giảm dần), bỏ NaN: argpartition O(n) rồi chỉ sort k phần tử."""
+    valid = np.flatnonzero(~np.isnan(scores))
+    if len(valid) == 0 or k <= 0:
+        return valid[:0]
+    k = min(k, len(valid))
+    part = valid[np.argpartition(-scores[valid], k - 1)[:k]]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+def trending(history, metric="playCount", rank="velocity", k=20):
+    """Top-k video theo rank (gain / velocity / acceleration). Trả về list dict."""
+    trend = history.trend(metric)
+    idx = top_k(trend[rank], k)
+    return [{
+        "videoID": int(history.video_ids[i]),
+        "authorID": int(history.author_ids[i]) if history.author_ids[i] != -1 else None,
+        "current": float(trend["current"][i]),
+        "gain": float(trend["gain"][i]),
+        "velocity": float(trend["velocity"][i]),
+        "acceleration": None if np.isnan(trend["acceleration"][i]) else float(trend["acceleration"][i]),
+        "observations": int(trend["observations"][i]),
+    } for i in idx.tolist()]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metric", default="playCount", choices=COUNTER_COLUMNS)
+    parser.add_argument("--rank", default="velocity", choices=RANKINGS,
+                        help="gain: tăng tuyệt đối, velocity: tăng mỗi giờ, acceleration: tốc độ đang tăng")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--since-hours", type=float, default=None, help="Chỉ dùng snapshot trong N giờ gần nhất")
+    parser.add_argument("--storage-path", default=None, help="Mặc định config.STORAGE_PATH")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    files = loader.discover_files(args.storage_path)
+    if not files:
+        logger.warning("No storage files found in %s", args.storage_path or config.STORAGE_PATH)
+        return
+    history = SnapshotHistory.load(files, metrics=(args.metric,))
+    if args.since_hours is not None and len(history.times):
+        since = history.times[-1] - np.timedelta64(int(args.since_hours * 3600), "s")
+        history = history.window(since)
+    rows = trending(history, args.metric, args.rank, args.top)
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return
+    print(f"{'videoID':>20} {'authorID':>20} {'current':>14} {'gain':>12} {'per hour':>12} {'accel':>12} obs")
+    for r in rows:
+        accel = "-" if r["acceleration"] is None else f"{r['acceleration']:.1f}"
+        print(f"{r['videoID']:>20} {str(r['authorID'] or '-'):>20} {r['current']:>14.0f} {r['gain']:>12.0f} "
+              f"{r['velocity']:>12.1f} {accel:>12} {r['observations']}")
+
+if __name__ == "__main__":
+    main()
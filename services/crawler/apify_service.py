@@ -5,15 +5,63 @@ from logging_setup import logger
 def run_actor(actor_id, apify_token, run_input):
     """
     Gọi Apify actor và trả về (run_id, dataset_id, results).
+    Giữ lại cho tương thích; pipeline chính dùng run_actor_streaming.
+    """
+    run_id, dataset_id, pages = run_actor_streaming(actor_id, apify_token, run_input)
+    results = [item for page in pages for item in page]
+    return run_id, dataset_id, results
+
+def run_actor_streaming(actor_id, apify_token, run_input, page_size=500, max_items=None):
+    """
+    Gọi Apify actor và trả về (run_id, dataset_id, pages).
+    `pages` là generator, mỗi lần yield một list item (tối đa page_size phần tử),
+    nên RAM chỉ giữ một trang tại một thời điểm.
     """
-    logger.info("Calling Apify actor: %s", actor_id)
     client = ApifyClient(apify_token)
-    run = client.actor(actor_id).call(run_input=run_input)
-    
-    dataset_id = run.get("defaultDatasetId")
-    run_id = run.get("id")
-    
-    logger.info("Fetching results from dataset: %s", dataset_id)
-    results = [item for item in client.dataset(dataset_id).iterate_items()]
-    
-    return run_id, dataset_id, results
\ No newline at end of file
+    run_id, dataset_id = start_run(client, actor_id, run_input)
+
+    logger.info("Streaming results from dataset: %s (page_size=%d)", dataset_id, page_size)
+    return run_id, dataset_id, iter_dataset_pages(client, dataset_id, page_size, max_items=max_items)
+
+def start_run(client, actor_id, run_input, on_started=None):
+    """
+    Chạy actor (blocking tới khi run kết thúc), trả về (run_id, dataset_id).
+    on_started(run_id, dataset_id) được gọi ngay khi run được tạo, trước khi chờ,
+    để caller checkpoint run đang chạy và gắn lại vào nó nếu process bị restart.
+    """
+    logger.info("Calling Apify actor: %s", actor_id)
+    run = client.actor(actor_id).start(run_input=run_input)
+    if on_started is not None:
+        on_started(run.get("id"), run.get("defaultDatasetId"))
+    return wait_for_run(client, run.get("id"))
+
+def wait_for_run(client, run_id):
+    """Chờ một run (đang chạy hoặc đã xong) kết thúc, trả về (run_id, dataset_id)."""
+    run = client.run(run_id).wait_for_finish()
+    if run is None:
+        raise RuntimeError(f"Apify run {run_id} not found")
+    if run.get("status") != "SUCCEEDED":
+        logger.warning("Apify run %s finished with status %s", run_id, run.get("status"))
+    return run.get("id"), run.get("defaultDatasetId")
+
+def iter_dataset_pages(client, dataset_id, page_size=500, offset=0, max_items=None):
+    """
+    Tải dataset theo từng trang bằng list_items(offset, limit).
+    Dừng khi trang rỗng hoặc đã đủ max_items.
+    """
+    fetched = 0
+    while True:
+        limit = page_size
+        if max_items is not None:
+            limit = min(limit, max_items - fetched)
+            if limit <= 0:
+                return
+        page = client.dataset(dataset_id).list_items(offset=offset, limit=limit)
+        items = page.items
+        if not items:
+            return
+        yield items
+        offset += len(items)
+        fetched += len(items)
+        if len(items) < limit:
+            return
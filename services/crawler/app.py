@@ -1,14 +1,163 @@
 # app.py
+import threading
 from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.events import (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MAX_INSTANCES,
+                                EVENT_JOB_MISSED, EVENT_SCHEDULER_STARTED)
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.memory import MemoryJobStore
 import config
 from logging_setup import logger
 from main_job import job  # Import a-giai-đoạn-job chính
+import loader
+import transform_stage
+import metrics
+
+try:
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+except ImportError:  # SQLAlchemy là tuỳ chọn: không có thì trạng thái job chỉ nằm trong RAM
+    SQLAlchemyJobStore = None
+
+# Chu kỳ (giây) kiểm tra schedule.cron trong config.yml để đổi lịch crawl không cần restart
+CONFIG_WATCH_SECONDS = 30
+
+def watch_cron(sched, job_id, cron_expr, watch_jobstore="default"):
+    """
+    Thêm job nền theo dõi config.SCHEDULE_CRON (config.yml được reload theo mtime):
+    cron đổi -> reschedule job_id ngay trên scheduler đang chạy.
+    """
+    state = {"cron": cron_expr}
+
+    def check():
+        new_cron = config.SCHEDULE_CRON
+        if not new_cron or new_cron == state["cron"]:
+            return
+        state["cron"] = new_cron
+        try:
+            trigger = CronTrigger.from_crontab(new_cron, timezone=config.SCHEDULE_TIMEZONE)
+        except ValueError:
+            logger.error("Invalid cron format in reloaded config: %s. Keeping current schedule.", new_cron)
+            return
+        sched.reschedule_job(job_id, trigger=trigger)
+        logger.info("Config changed: rescheduled %s with cron: %s", job_id, new_cron)
+
+    sched.add_job(check, "interval", seconds=CONFIG_WATCH_SECONDS, id="config_watch",
+                  jobstore=watch_jobstore, replace_existing=True)
+
+# DAG của chế độ pipeline: job_id -> (hàm, job_id kế tiếp)
+# Bước sau chỉ được kích hoạt khi bước trước trả về giá trị truthy
+# (crawl: True khi lưu file xong, stage_load: số dòng đã load, transform: stats).
+PIPELINE = {
+    "crawl": (job, "stage_load"),
+    "stage_load": (loader.run_loader, "transform"),
+    "transform": (transform_stage.run_transform, None),
+}
+
+class PipelineScheduler:
+    """
+    Scheduler chế độ pipeline: crawl chạy theo cron, stage-load và transform được kích hoạt
+    bằng EVENT_JOB_EXECUTED của bước trước. Các bước chạy trong pool executor nên crawl
+    của tick sau chạy song song với load/transform của tick trước.
+    - max_instances / coalesce / misfire_grace_time áp dụng cho mọi job.
+    - Job lưu trong SQLite (SQLAlchemyJobStore): restart không làm mất lần crawl bị lỡ
+      (trong misfire_grace_time) hay bước load/transform đã được kích hoạt nhưng chưa chạy.
+    - Bước đang chạy mà bị kích hoạt lại (max_instances) thì được đánh dấu và chạy lại
+      ngay sau khi instance hiện tại xong (loader/transform đều incremental).
+    """
+
+    def __init__(self, cron_expr):
+        self.cron_expr = cron_expr
+        self._rerun = set()
+        self._lock = threading.Lock()
+        jobstores = {"memory": MemoryJobStore()}  # job nội bộ (theo dõi config) không cần lưu
+        if SQLAlchemyJobStore is not None:
+            jobstores["default"] = SQLAlchemyJobStore(url=f"sqlite:///{config.SCHEDULE_JOBSTORE_PATH}")
+        else:
+            logger.warning("SQLAlchemy not installed: scheduler job state is kept in memory only.")
+        if config.SCHEDULE_EXECUTOR == "process":
+            executor = ProcessPoolExecutor(config.SCHEDULE_MAX_WORKERS)
+        else:
+            executor = ThreadPoolExecutor(config.SCHEDULE_MAX_WORKERS)
+        self.sched = BlockingScheduler(
+            timezone=config.SCHEDULE_TIMEZONE,
+            jobstores=jobstores,
+            executors={"default": executor},
+            job_defaults={
+                "max_instances": config.SCHEDULE_MAX_INSTANCES,
+                "coalesce": config.SCHEDULE_COALESCE,
+                "misfire_grace_time": config.SCHEDULE_MISFIRE_GRACE_TIME,
+            },
+        )
+        self.sched.add_listener(self._on_started, EVENT_SCHEDULER_STARTED)
+        self.sched.add_listener(self._on_done, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        self.sched.add_listener(self._on_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+    def _on_started(self, event):
+        # Jobstore đã mở: chỉ thay job crawl khi cron đổi, để giữ next_run_time đã lưu
+        # (lần chạy bị lỡ trong lúc container tắt vẫn được misfire/coalesce xử lý).
+        trigger = CronTrigger.from_crontab(self.cron_expr, timezone=config.SCHEDULE_TIMEZONE)
+        existing = self.sched.get_job("crawl")
+        if existing is None or str(existing.trigger) != str(trigger):
+            self.sched.add_job(job, trigger, id="crawl", name="crawl", replace_existing=True)
+            logger.info("Scheduled crawl with cron: %s", self.cron_expr)
+        else:
+            logger.info("Resumed persisted crawl schedule, next run at %s", existing.next_run_time)
+        watch_cron(self.sched, "crawl", self.cron_expr, watch_jobstore="memory")
+
+    def trigger(self, job_id):
+        """Chạy một bước của DAG ngay (job one-shot, cũng được lưu trong jobstore)."""
+        func, _ = PIPELINE[job_id]
+        self.sched.add_job(func, "date", id=job_id, name=job_id, replace_existing=True)
+
+    def _on_done(self, event):
+        if event.job_id not in PIPELINE:
+            return
+        with self._lock:
+            rerun = event.job_id in self._rerun
+            self._rerun.discard(event.job_id)
+        if rerun:
+            logger.info("Re-running %s (triggered while it was running)", event.job_id)
+            self.trigger(event.job_id)
+        _, downstream = PIPELINE[event.job_id]
+        if event.exception is not None:
+            logger.error("Pipeline step %s failed: %s", event.job_id, event.exception)
+        elif downstream and event.retval:
+            logger.info("Pipeline step %s done -> triggering %s", event.job_id, downstream)
+            self.trigger(downstream)
+
+    def _on_skipped(self, event):
+        if event.job_id in PIPELINE and event.job_id != "crawl":
+            logger.info("Pipeline step %s still running, will run again when it finishes", event.job_id)
+            with self._lock:
+                self._rerun.add(event.job_id)
+        else:
+            logger.warning("Job %s skipped (still running or misfired)", event.job_id)
+
+    def start(self):
+        try:
+            logger.info("Pipeline scheduler started (%s executor, %d workers). Press Ctrl+C to exit.",
+                        config.SCHEDULE_EXECUTOR, config.SCHEDULE_MAX_WORKERS)
+            self.sched.start()
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Scheduler stopped.")
 
 def start_scheduler():
     """Initializes and starts the job scheduler."""
-    sched = BlockingScheduler(timezone=config.SCHEDULE_TIMEZONE)
+    metrics.start_http_server(config.METRICS_PORT, config.METRICS_HOST)
     cron_expr = config.SCHEDULE_CRON
 
+    if config.SCHEDULE_ENABLED and cron_expr and config.SCHEDULE_MODE == "pipeline":
+        try:
+            CronTrigger.from_crontab(cron_expr)
+        except ValueError:
+            logger.error("Invalid cron format: %s. Running once.", cron_expr)
+            job() # Chạy 1 lần nếu cron sai
+            return
+        PipelineScheduler(cron_expr).start()
+        return
+
+    sched = BlockingScheduler(timezone=config.SCHEDULE_TIMEZONE)
+
     if config.SCHEDULE_ENABLED and cron_expr:
         try:
             parts = cron_expr.split()
@@ -17,6 +166,7 @@ def start_scheduler():
                 sched.add_job(job, 'cron', minute=minute, hour=hour, day=day,
                               month=month, day_of_week=day_of_week, id="apify_job")
                 logger.info("Scheduled job with cron: %s", cron_expr)
+                watch_cron(sched, "apify_job", cron_expr)
             else:
                 logger.warning("Invalid cron expression '%s', running once immediately.", cron_expr)
                 job() # Chạy 1 lần nếu cron sai
@@ -36,4 +186,4 @@ def start_scheduler():
         logger.info("Scheduler stopped.")
 
 if __name__ == "__main__":
-    start_scheduler()
\ No newline at end of file
+    start_scheduler()
@@ -0,0 +1,267 @@
+# backfill.py
+"""
+Dựng lại warehouse từ toàn bộ file trong STORAGE_PATH (sau khi đổi logic transform).
+
+    python backfill.py --workers 8
+    python backfill.py --restart          # bỏ cursor cũ, chạy lại từ đầu
+
+- Worker (ProcessPoolExecutor, mỗi task một file): parse JSON + flatten thành
+  flatten.ColumnBatch (cột NumPy, pickle gọn) và các dòng staging.
+- Một writer duy nhất (process chính): mỗi file một transaction gồm warehouse
+  (TransformEngine.load_batch) + staging_raw (processed = TRUE, thay dòng chưa processed của file).
+- Trước khi replay (chỉ ở lần chạy đầu của một cursor), rebuild_warehouse() xoá fact_videos,
+  rollup và staging_raw của các file được replay, nên backfill thay thế chứ không nhân đôi fact.
+  Fact của file không còn trong STORAGE_PATH cũng mất theo. Dimension và fact_video_snapshot
+  được upsert nên giữ nguyên.
+- Cursor JSON (ghi atomic) lưu file đã xong; chạy lại chỉ xử lý file còn thiếu. File đang ghi dở
+  lúc dừng được kiểm tra trong staging_raw để biết transaction đã commit hay chưa.
+- File lỗi (đọc / parse / ghi) được ghi vào cursor ("failed") rồi bỏ qua; backfill chạy tiếp file khác,
+  báo lỗi ở cuối và lần chạy sau thử lại các file này.
+Nên dừng scheduler trong lúc backfill (loader/transform thường cũng ghi staging/warehouse).
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import config
+from logging_setup import logger
+import db
+import loader
+from transform_stage import transformer
+from transformer import flatten, models
+
+STAGING_TABLE = loader.STAGING_TABLE
+# Bảng warehouse được làm rỗng trước khi replay (fact không có khoá tự nhiên để upsert)
+REBUILD_TABLES = ("warehouse_tiktok.fact_videos", "warehouse_tiktok.agg_author_daily",
+                  "warehouse_tiktok.agg_hashtag_daily", transformer.rollups.DIRTY_TABLE)
+
+class BackfillCursor:
+    """Tiến độ backfill: file đã xong, file lỗi, file đang ghi (pending), id staging lớn nhất lúc bắt đầu."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+
+    @classmethod
+    def load(cls, path, restart=False):
+        if not restart:
+            try:
+                with open(path, encoding="utf-8") as fr:
+                    data = json.load(fr)
+                # Cursor cũ (chưa có bước rebuild) đã replay một phần: không xoá lại fact của file đã xong
+                data.setdefault("rebuilt", bool(data.get("done")))
+                data.setdefault("failed", {})
+                return cls(path, data)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable backfill cursor %s: %s", path, e)
+        return cls(path, {"started_at": time.time(), "staging_start_id": None, "rebuilt": False,
+                          "done": {}, "failed": {}, "pending": None, "items": 0})
+
+    @property
+    def done(self):
+        return self.data["done"]
+
+    @property
+    def failed(self):
+        return self.data["failed"]
+
+    def begin_file(self, name):
+        self.data["pending"] = name
+        self.save()
+
+    def finish_file(self, name, items):
+        self.data["done"][name] = items
+        self.data["items"] += items
+        self.data["failed"].pop(name, None)
+        self.data["pending"] = None
+        self.save()
+
+    def fail_file(self, name, error):
+        self.data["failed"][name] = error
+        self.data["pending"] = None
+        self.save()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fw:
+            json.dump(self.data, fw)
+        os.replace(tmp, self.path)
+
+def parse_file(fpath, with_staging=True):
+    """
+    (Chạy trong worker) đọc + flatten một file. Trả về dict nhỏ gửi về writer:
+    batch (ColumnBatch), staging (list tuple hoặc None), items, seconds.
+    """
+    start = time.perf_counter()
+    staging_rows = list(loader.iter_staging_rows(fpath))
+    items = [models.decode(row[3]) for row in staging_rows]
+    fetched_at = staging_rows[0][2] if staging_rows else None
+    batch = flatten.flatten_items(items, fetched_at=fetched_at)
+    return {
+        "fpath": fpath,
+        "batch": batch,
+        "staging": staging_rows if with_staging else None,
+        "items": len(items),
+        "seconds": time.perf_counter() - start,
+    }
+
+def _staging_writer(fpath, rows, batch_size):
+    """Ghi staging của file trong transaction warehouse: thay dòng chưa processed, đánh dấu processed."""
+    def write(cur):
+        cur.execute(f"DELETE FROM {STAGING_TABLE} WHERE file_path = %s AND processed = FALSE", (fpath,))
+        loader.insert_batches(cur, rows, batch_size)
+        cur.execute(f"UPDATE {STAGING_TABLE} SET processed = TRUE WHERE file_path = %s AND processed = FALSE",
+                    (fpath,))
+    return write
+
+def rebuild_warehouse(conn, files, with_staging=True):
+    """
+    Chuẩn bị replay: TRUNCATE REBUILD_TABLES rồi xoá staging_raw của các file sẽ replay
+    (with_staging=False: giữ staging, chỉ đánh dấu processed để transform thường không nạp lại).
+    Chạy lại an toàn nếu bị dừng giữa chừng.
+    """
+    with conn.cursor() as cur:
+        for table in REBUILD_TABLES:
+            cur.execute(f"TRUNCATE TABLE {table}")
+    conn.begin()
+    try:
+        with conn.cursor() as cur:
+            for fpath in files:
+                if with_staging:
+                    cur.execute(f"DELETE FROM {STAGING_TABLE} WHERE file_path = %s", (fpath,))
+                else:
+                    cur.execute(f"UPDATE {STAGING_TABLE} SET processed = TRUE WHERE file_path = %s", (fpath,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info("Warehouse cleared for rebuild: %s; staging rows of %d files %s",
+                ", ".join(REBUILD_TABLES), len(files), "deleted" if with_staging else "marked processed")
+
+def _committed(conn, fpath, staging_start_id):
+    """File pending đã được commit chưa: có dòng staging của lần backfill này (id > staging_start_id)."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT 1 AS found FROM {STAGING_TABLE} WHERE file_path = %s AND id > %s LIMIT 1",
+                    (fpath, staging_start_id or 0))
+        return cur.fetchone() is not None
+
+def run_backfill(files=None, workers=None, cursor_path=None, restart=False, with_staging=True,
+                 batch_size=None):
+    """
+    Backfill các file storage vào staging + warehouse. Trả về stats của TransformEngine
+    (thêm failed_files: số file lỗi ở lần chạy này, chi tiết trong cursor).
+    """
+    files = loader.discover_files() if files is None else files
+    workers = workers or config.BACKFILL_WORKERS or os.cpu_count() or 1
+    batch_size = batch_size or config.LOADER_BATCH_SIZE
+    cursor = BackfillCursor.load(cursor_path or config.BACKFILL_CURSOR_PATH, restart)
+    by_name = {os.path.basename(f): f for f in files}
+
+    with db.connection() as conn:
+        if not cursor.data.get("rebuilt"):
+            rebuild_warehouse(conn, files, with_staging)
+            cursor.data["rebuilt"] = True
+            cursor.save()
+        if cursor.data["staging_start_id"] is None:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT MAX(id) AS max_id FROM {STAGING_TABLE}")
+                row = cur.fetchone()
+            cursor.data["staging_start_id"] = (row["max_id"] if isinstance(row, dict) else row[0]) or 0
+            cursor.save()
+        pending = cursor.data["pending"]
+        if pending and pending in by_name:
+            if with_staging and _committed(conn, by_name[pending], cursor.data["staging_start_id"]):
+                logger.info("Pending file %s was committed before the restart", pending)
+                cursor.finish_file(pending, 0)
+            elif not with_staging:
+                logger.warning("Re-processing pending file %s; its facts may be duplicated "
+                               "(--no-staging leaves no staging rows to check)", pending)
+
+        todo = [f for f in files if os.path.basename(f) not in cursor.done]
+        retried = sum(1 for f in todo if os.path.basename(f) in cursor.failed)
+        logger.info("Backfill: %d/%d files to process with %d workers (%d already done, %d failed before)",
+                    len(todo), len(files), workers, len(files) - len(todo), retried)
+        inserted = transformer.dates.populate_dim_date(conn, config.DIM_DATE_START_YEAR, config.DIM_DATE_END_YEAR)
+        if inserted:
+            logger.info("dim_date pre-filled: %d rows", inserted)
+        engine = transformer.TransformEngine(
+            conn, cache_size=config.TRANSFORM_CACHE_SIZE,
+            date_range=(config.DIM_DATE_START_YEAR, config.DIM_DATE_END_YEAR), refresh_rollups=False)
+
+        start = time.perf_counter()
+        items = files_done = 0
+        failed = []
+        parse_seconds = 0.0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            queue = iter(todo)
+            running = {}
+            # Giữ tối đa 2 task mỗi worker đang chờ để giới hạn RAM của kết quả chưa ghi
+            for fpath in queue:
+                running[pool.submit(parse_file, fpath, with_staging)] = fpath
+                if len(running) >= workers * 2:
+                    break
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    fpath = running.pop(future)
+                    name = os.path.basename(fpath)
+                    try:
+                        result = future.result()
+                        cursor.begin_file(name)
+                        before_commit = None
+                        if result["staging"] is not None:
+                            before_commit = _staging_writer(fpath, result["staging"], batch_size)
+                        engine.load_batch(result["batch"], rows=result["items"], before_commit=before_commit)
+                    except Exception as e:
+                        # load_batch đã rollback: file không ghi gì, lần chạy sau thử lại
+                        logger.exception("Backfill failed for %s", name)
+                        cursor.fail_file(name, str(e))
+                        failed.append(name)
+                    else:
+                        cursor.finish_file(name, result["items"])
+                        files_done += 1
+                        items += result["items"]
+                        parse_seconds += result["seconds"]
+                        elapsed = time.perf_counter() - start
+                        rate = items / elapsed if elapsed else 0
+                        processed = files_done + len(failed)
+                        eta = (len(todo) - processed) * elapsed / processed
+                        logger.info("[%d/%d] %s: %d items | %.0f items/s | ETA %.0fs",
+                                    processed, len(todo), name, result["items"], rate, eta)
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        running[pool.submit(parse_file, nxt, with_staging)] = nxt
+
+        if config.TRANSFORM_REFRESH_ROLLUPS:
+            engine.stats["rollup_dates"] = transformer.rollups.refresh(conn)
+    elapsed = time.perf_counter() - start
+    logger.info("Backfill finished: %d files, %d items in %.1fs (%.0f items/s, worker parse %.1fs); %s",
+                files_done, items, elapsed, items / elapsed if elapsed else 0, parse_seconds, engine.stats)
+    if failed:
+        logger.error("Backfill: %d file(s) failed and will be retried on the next run: %s",
+                     len(failed), ", ".join(failed))
+    engine.stats["failed_files"] = len(failed)
+    return engine.stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="Số process parse (mặc định số CPU)")
+    parser.add_argument("--cursor", default=None, help="File cursor (mặc định backfill.cursor_path)")
+    parser.add_argument("--restart", action="store_true", help="Bỏ cursor cũ, xử lý lại mọi file")
+    parser.add_argument("--no-staging", action="store_true", help="Chỉ ghi warehouse, không ghi staging_raw")
+    parser.add_argument("--storage-path", default=None, help="Mặc định config.STORAGE_PATH")
+    args = parser.parse_args()
+
+    logger.info(">>> BACKFILL STARTED <<<")
+    stats = run_backfill(loader.discover_files(args.storage_path), workers=args.workers, cursor_path=args.cursor,
+                         restart=args.restart, with_staging=not args.no_staging)
+    if stats["failed_files"]:
+        logger.error(">>> BACKFILL FINISHED WITH %d FAILED FILE(S) <<<", stats["failed_files"])
+        raise SystemExit(1)
+    logger.info(">>> BACKFILL FINISHED <<<")
+
+if __name__ == "__main__":
+    main()
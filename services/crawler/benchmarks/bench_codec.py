@@ -0,0 +1,70 @@
+# benchmarks/bench_codec.py
+"""
+So sánh các JSON codec (codec.CODECS: stdlib json, orjson nếu đã cài) trên file mẫu trong
+STORAGE_PATH, theo đúng các thao tác pipeline dùng:
+- encode: item -> bytes (StorageWriter.write_page)
+- decode_items: text JSON từng item -> dict (NDJSON, staging raw_json trong transform/backfill)
+- decode_file: cả file JSON array -> list (storage.iter_items với file nhỏ)
+
+    python benchmarks/bench_codec.py --repeat 5
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import codec  # noqa: E402
+import loader  # noqa: E402
+import storage  # noqa: E402
+
+def best_of(repeat, fn):
+    """Thời gian nhỏ nhất trong `repeat` lần chạy (ít nhiễu hơn trung bình)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--storage-path", default=None, help="Mặc định config.STORAGE_PATH")
+    args = parser.parse_args()
+
+    files = [f for f in loader.discover_files(args.storage_path) if storage.detect_format(f) == "json"]
+    if not files:
+        raise SystemExit(f"No JSON array sample files found in {args.storage_path or config.STORAGE_PATH}")
+    blobs = []
+    for fpath in files:
+        with open(fpath, "rb") as fr:
+            blobs.append(fr.read())
+    raws = [raw for f in files for raw in storage.iter_raw_items(f)]
+    items = [json.loads(raw) for raw in raws]
+    nbytes = sum(len(b) for b in blobs)
+
+    results = []
+    for name, impl in codec.CODECS.items():
+        timings = {
+            "encode": best_of(args.repeat, lambda: [impl.dumps(item) for item in items]),
+            "decode_items": best_of(args.repeat, lambda: [impl.loads(raw) for raw in raws]),
+            "decode_file": best_of(args.repeat, lambda: [impl.loads(blob) for blob in blobs]),
+        }
+        for op, elapsed in timings.items():
+            results.append({"codec": name, "op": op, "items": len(items), "seconds": round(elapsed, 4),
+                            "items_per_sec": round(len(items) / elapsed), "mb_per_sec": round(nbytes / elapsed / 1e6, 1)})
+
+    baseline = {r["op"]: r["seconds"] for r in results if r["codec"] == "json"}
+    for r in results:
+        r["speedup_vs_json"] = round(baseline[r["op"]] / r["seconds"], 2)
+    print(f"{len(files)} files, {len(items)} items, {nbytes} bytes (default codec: {codec.default.name})",
+          file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_loader.py
+"""
+So sánh insert từng dòng với insert theo lô (executemany) vào staging_raw.
+Chạy trên MySQL thật (cấu hình như crawler), ghi vào TEMPORARY TABLE nên không để lại dữ liệu.
+
+    python benchmarks/bench_loader.py --rows 20000 --batch-sizes 100,1000,5000
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import db  # noqa: E402
+import loader  # noqa: E402
+import storage  # noqa: E402
+
+BENCH_TABLE = "staging_tiktok.bench_staging_raw"
+
+def sample_rows(n):
+    """Nhân bản item mẫu trong STORAGE_PATH thành n dòng staging."""
+    files = loader.discover_files()
+    raws = [raw for f in files for raw in storage.iter_raw_items(f)]
+    if not raws:
+        raise SystemExit(f"No sample items found in {config.STORAGE_PATH}")
+    fetched_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    return [("bench", None, fetched_at, raws[i % len(raws)], "bench.json") for i in range(n)]
+
+def timed(conn, fn):
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE TABLE {BENCH_TABLE}")
+    conn.begin()
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        fn(cur)
+    conn.commit()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-sizes", default="100,1000,5000")
+    parser.add_argument("--skip-single", action="store_true", help="Bỏ qua chế độ từng dòng (chậm)")
+    args = parser.parse_args()
+
+    rows = sample_rows(args.rows)
+    results = []
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMPORARY TABLE {BENCH_TABLE} LIKE {loader.STAGING_TABLE}")
+
+        if not args.skip_single:
+            sql = f"""
+                INSERT INTO {BENCH_TABLE} (device_id, apify_run_id, fetched_at, raw_json, file_path)
+                VALUES (%s, %s, %s, %s, %s)
+            """
+            elapsed = timed(conn, lambda cur: [cur.execute(sql, r) for r in rows])
+            results.append({"mode": "row-at-a-time", "rows": len(rows), "seconds": round(elapsed, 3),
+                            "rows_per_sec": round(len(rows) / elapsed)})
+
+        for size in (int(s) for s in args.batch_sizes.split(",")):
+            elapsed = timed(conn, lambda cur: loader.insert_batches(cur, rows, size, table=BENCH_TABLE))
+            results.append({"mode": f"executemany batch={size}", "rows": len(rows), "seconds": round(elapsed, 3),
+                            "rows_per_sec": round(len(rows) / elapsed)})
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TEMPORARY TABLE {BENCH_TABLE}")
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
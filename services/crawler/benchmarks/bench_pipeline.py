@@ -0,0 +1,206 @@
+# benchmarks/bench_pipeline.py
+"""
+Benchmark end-to-end offline: Apify giả lập (fakes.FakeApifyServer) -> file storage
+-> staging_raw -> warehouse, trên SQLite (sqlite_standin) thay cho MySQL.
+Đo từng bước fetch / save / stage / transform và ghi báo cáo JSON để so sánh giữa các lần chạy.
+
+    python benchmarks/bench_pipeline.py --items 100000 --format ndjson.gz
+    python benchmarks/bench_pipeline.py --compare results/a.json results/b.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import crawl_fanout  # noqa: E402
+import loader  # noqa: E402
+import metrics  # noqa: E402
+import storage  # noqa: E402
+from transform_stage import transformer  # noqa: E402
+from fakes import FakeApifyServer, ItemGenerator  # noqa: E402
+from sqlite_standin import SQLiteConnection  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+STAGES = ("fetch", "save", "stage", "transform")
+
+class TimedWriter:
+    """Bọc StorageWriter, cộng dồn thời gian ghi để tách 'save' khỏi 'fetch' (hai bước đan xen)."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.seconds = 0.0
+
+    def write_page(self, items):
+        start = time.perf_counter()
+        try:
+            return self.writer.write_page(items)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        self.writer.close()
+        self.seconds += time.perf_counter() - start
+
+    def abort(self):
+        self.writer.abort()
+
+    @property
+    def count(self):
+        return self.writer.count
+
+    @property
+    def bytes_written(self):
+        return self.writer.bytes_written
+
+def _stage(seconds, items=None, nbytes=None):
+    return {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "items_per_sec": round(items / seconds, 1) if items and seconds > 0 else None,
+        "bytes": nbytes,
+    }
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def run_benchmark(args):
+    shards = max(1, args.shards)
+    items_per_run = max(1, args.items // shards)
+    server = FakeApifyServer(
+        items_per_run,
+        generator=ItemGenerator(args.seed, args.authors or max(1, args.items // 20)),
+        run_latency=args.run_latency, page_latency=args.page_latency,
+    )
+    hashtags = [f"tag{i}" for i in range(shards * args.shard_size)]
+    crawl_fanout.ApifyClient = server.client_factory()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    db_dir = None if args.db_memory else workdir
+    conn = SQLiteConnection(db_dir)
+    report_stages = {}
+    try:
+        # --- fetch + save (đan xen: mỗi trang tải về được ghi ngay) ---
+        ts = datetime.now().strftime("%d%m%YT%H%M%SZ")
+        fpath = os.path.join(workdir, storage.build_filename("bench", ts, args.format))
+        writer = TimedWriter(storage.StorageWriter(fpath, args.format))
+        start = time.perf_counter()
+        crawl_fanout.crawl_hashtags("fake/actor", "fake-token", hashtags, writer,
+                                    results_per_page=items_per_run, shard_size=args.shard_size,
+                                    max_concurrency=args.concurrency, page_size=args.page_size)
+        writer.close()
+        total = time.perf_counter() - start
+        size = os.path.getsize(fpath)
+        report_stages["fetch"] = _stage(total - writer.seconds, writer.count)
+        report_stages["save"] = _stage(writer.seconds, writer.count, size)
+
+        # --- stage: file -> staging_raw ---
+        st = os.stat(fpath)
+        file_state = {"file_size": st.st_size, "file_mtime": st.st_mtime, "content_hash": loader.file_hash(fpath)}
+        start = time.perf_counter()
+        staged = loader.load_file(conn, fpath, batch_size=args.batch_size, file_state=file_state)
+        report_stages["stage"] = _stage(time.perf_counter() - start, staged)
+
+        # --- transform: staging_raw -> warehouse ---
+        start = time.perf_counter()
+        stats = transformer.run_transform(conn, chunk_size=args.chunk_size, cache_size=args.cache_size,
+                                          date_range=(config.DIM_DATE_START_YEAR, config.DIM_DATE_END_YEAR))
+        report_stages["transform"] = _stage(time.perf_counter() - start, stats["rows"])
+    finally:
+        conn.close()
+        if args.keep:
+            print(f"Kept work dir: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "pipeline",
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "items": args.items, "shards": shards, "shard_size": args.shard_size,
+            "concurrency": args.concurrency, "page_size": args.page_size, "format": args.format,
+            "batch_size": args.batch_size, "chunk_size": args.chunk_size, "cache_size": args.cache_size,
+            "authors": server.generator.n_authors, "seed": args.seed,
+            "run_latency": args.run_latency, "page_latency": args.page_latency,
+            "db": "sqlite-memory" if args.db_memory else "sqlite-file",
+        },
+        "stages": report_stages,
+        "total_seconds": round(sum(s["seconds"] for s in report_stages.values()), 4),
+        "peak_rss_bytes": metrics.peak_rss_bytes(),
+        "apify_calls": dict(server.calls),
+        "transform_stats": stats,
+    }
+
+def compare(base_path, new_path):
+    """In tỉ lệ thời gian new/base cho từng bước (< 1 là nhanh hơn)."""
+    with open(base_path, encoding="utf-8") as fr:
+        base = json.load(fr)
+    with open(new_path, encoding="utf-8") as fr:
+        new = json.load(fr)
+    if base["params"] != new["params"]:
+        print("Warning: params differ, results may not be comparable", file=sys.stderr)
+    rows = []
+    for name in STAGES + ("total",):
+        b = base["total_seconds"] if name == "total" else base["stages"][name]["seconds"]
+        n = new["total_seconds"] if name == "total" else new["stages"][name]["seconds"]
+        rows.append({"stage": name, "base_seconds": b, "new_seconds": n,
+                     "ratio": round(n / b, 3) if b else None})
+    print(json.dumps(rows, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000, help="Tổng số item (1k - 1M)")
+    parser.add_argument("--shards", type=int, default=4, help="Số actor run (shard hashtag)")
+    parser.add_argument("--shard-size", type=int, default=config.CRAWL_SHARD_SIZE)
+    parser.add_argument("--concurrency", type=int, default=config.CRAWL_MAX_CONCURRENCY)
+    parser.add_argument("--page-size", type=int, default=config.APIFY_PAGE_SIZE)
+    parser.add_argument("--format", default=config.STORAGE_FORMAT, choices=sorted(storage.FORMAT_EXTENSIONS))
+    parser.add_argument("--batch-size", type=int, default=config.LOADER_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=config.TRANSFORM_CHUNK_SIZE)
+    parser.add_argument("--cache-size", type=int, default=config.TRANSFORM_CACHE_SIZE)
+    parser.add_argument("--authors", type=int, default=None, help="Số tác giả khác nhau (mặc định items/20)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--run-latency", type=float, default=0.0, help="Giây giả lập cho mỗi actor run")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Giây giả lập cho mỗi trang dataset")
+    parser.add_argument("--db-memory", action="store_true", help="SQLite trong RAM thay vì file")
+    parser.add_argument("--label", default=None, help="Nhãn ghi vào báo cáo")
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/)")
+    parser.add_argument("--keep", action="store_true", help="Giữ thư mục làm việc tạm")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="So sánh hai báo cáo JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_benchmark(args)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"pipeline_{args.items}_{args.format}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+        output = os.path.join(RESULTS_DIR, name)
+    with open(output, "w", encoding="utf-8") as fw:
+        json.dump(report, fw, indent=2)
+    print(json.dumps(report["stages"], indent=2))
+    print(f"Report: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# benchmarks/fakes.py
+"""
+Stand-in cho Apify để benchmark offline:
+- ItemGenerator / generate_items: item TikTok tổng hợp, dựng từ item thật trong storage/
+  (giữ nguyên shape, kích thước JSON) với id / author / counters / hashtags được thay.
+- FakeApifyClient: cùng các lời gọi mà apify_service dùng (actor(id).start,
+  run(id).wait_for_finish, dataset(id).list_items(offset, limit).items), sinh item
+  theo offset nên 1M item cũng không phải giữ trong RAM.
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BASE_VIDEO_ID = 7_500_000_000_000_000_000
+BASE_AUTHOR_ID = 7_000_000_000_000_000_000
+BASE_CREATE_TIME = 1_760_000_000  # 2025-10-09
+
+HASHTAG_POOL = ["fyp", "xuhuong", "trending", "viral", "foryou", "dance", "music", "funny",
+                "food", "travel", "fashion", "beauty", "gaming", "sports", "news", "pet"]
+
+_MINIMAL_TEMPLATE = {
+    "id": "0", "text": "", "textLanguage": "un", "createTime": BASE_CREATE_TIME, "isAd": False,
+    "authorMeta": {"id": "0", "name": "", "avatar": "https://p16-sign-va.tiktokcdn.com/avatar.jpeg"},
+    "musicMeta": {"musicName": "original sound", "musicId": "0"},
+    "webVideoUrl": "", "mediaUrls": [],
+    "videoMeta": {"height": 1024, "width": 576, "duration": 15, "definition": "540p", "format": "mp4"},
+    "diggCount": 0, "shareCount": 0, "playCount": 0, "collectCount": 0, "commentCount": 0,
+    "mentions": [], "hashtags": [],
+}
+
+def load_templates(storage_path=None, limit=50):
+    """Item thật trong storage/ (tối đa limit) làm khuôn; không có thì dùng khuôn tối thiểu."""
+    if storage_path is None:
+        storage_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))), "storage")
+    templates = []
+    if os.path.isdir(storage_path):
+        for name in sorted(os.listdir(storage_path)):
+            fpath = os.path.join(storage_path, name)
+            if storage.detect_format(fpath) is None:
+                continue
+            templates.extend(itertools.islice(storage.iter_items(fpath), limit - len(templates)))
+            if len(templates) >= limit:
+                break
+    return templates or [_MINIMAL_TEMPLATE]
+
+class ItemGenerator:
+    """
+    Sinh item thứ i một cách tất định (cùng seed + i -> cùng item).
+    n_authors: số tác giả khác nhau (video được chia đều cho các tác giả).
+    """
+
+    def __init__(self, seed=42, n_authors=1000, templates=None):
+        self.seed = seed
+        self.n_authors = max(1, n_authors)
+        self.templates = templates or load_templates()
+
+    def item(self, i):
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        template = self.templates[i % len(self.templates)]
+        author_no = rnd.randrange(self.n_authors)
+        video_id = str(BASE_VIDEO_ID + i)
+        author_name = f"user{author_no}"
+        tags = rnd.sample(HASHTAG_POOL, rnd.randint(1, 5))
+
+        item = dict(template)
+        author = dict(template.get("authorMeta") or {})
+        author.update(id=str(BASE_AUTHOR_ID + author_no), name=author_name)
+        item["authorMeta"] = author
+        item["id"] = video_id
+        item["text"] = " ".join(f"#{t}" for t in tags)
+        item["createTime"] = BASE_CREATE_TIME + rnd.randrange(90 * 86400)
+        item["createTimeISO"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(item["createTime"]))
+        item["webVideoUrl"] = f"https://www.tiktok.com/@{author_name}/video/{video_id}"
+        item["hashtags"] = [{"name": t} for t in tags]
+        item["playCount"] = rnd.randrange(1, 5_000_000)
+        item["diggCount"] = item["playCount"] // rnd.randint(5, 50)
+        item["shareCount"] = item["diggCount"] // rnd.randint(5, 50)
+        item["commentCount"] = item["diggCount"] // rnd.randint(20, 200)
+        item["collectCount"] = item["diggCount"] // rnd.randint(5, 30)
+        return item
+
+    def items(self, start, stop):
+        return [self.item(i) for i in range(start, stop)]
+
+def generate_items(n, seed=42, n_authors=None):
+    """List n item tổng hợp (tiện cho benchmark nhỏ)."""
+    gen = ItemGenerator(seed, n_authors or max(1, n // 20))
+    return gen.items(0, n)
+
+class _ListPage:
+    def __init__(self, items, offset, limit, total):
+        self.items = items
+        self.offset = offset
+        self.limit = limit
+        self.count = len(items)
+        self.total = total
+
+class _Dataset:
+    def __init__(self, server, dataset_id):
+        self.server = server
+        self.dataset_id = dataset_id
+
+    def list_items(self, offset=0, limit=None, **kwargs):
+        start, total = self.server.datasets[self.dataset_id]
+        limit = total if limit is None else limit
+        begin = min(offset, total)
+        end = min(offset + limit, total)
+        self.server.sleep(self.server.page_latency)
+        items = self.server.generator.items(start + begin, start + end)
+        with self.server.lock:
+            self.server.calls["list_items"] += 1
+            self.server.items_served += len(items)
+        return _ListPage(items, offset, limit, total)
+
+class _Actor:
+    def __init__(self, server, actor_id):
+        self.server = server
+        self.actor_id = actor_id
+
+    def start(self, run_input=None, **kwargs):
+        server = self.server
+        with server.lock:
+            n = len(server.datasets)
+            run_id = f"fakeRun{n:05d}"
+            dataset_id = f"fakeDataset{n:05d}"
+            server.datasets[dataset_id] = (server.next_offset, server.items_per_run)
+            server.runs[run_id] = dataset_id
+            server.next_offset += server.items_per_run
+            server.calls["start"] += 1
+        return {"id": run_id, "defaultDatasetId": dataset_id, "status": "RUNNING"}
+
+    def call(self, run_input=None, **kwargs):
+        run = self.start(run_input)
+        return _Run(self.server, run["id"]).wait_for_finish()
+
+class _Run:
+    def __init__(self, server, run_id):
+        self.server = server
+        self.run_id = run_id
+
+    def wait_for_finish(self, wait_secs=None):
+        self.server.sleep(self.server.run_latency)
+        dataset_id = self.server.runs.get(self.run_id)
+        if dataset_id is None:
+            return None
+        return {"id": self.run_id, "defaultDatasetId": dataset_id, "status": "SUCCEEDED"}
+
+class FakeApifyServer:
+    """
+    Trạng thái dùng chung cho mọi FakeApifyClient (crawl_fanout tạo client riêng mỗi shard).
+    items_per_run: số item mỗi actor run; run_latency / page_latency: giây giả lập mạng.
+    """
+
+    def __init__(self, items_per_run, generator=None, run_latency=0.0, page_latency=0.0):
+        self.items_per_run = items_per_run
+        self.generator = generator or ItemGenerator()
+        self.run_latency = run_latency
+        self.page_latency = page_latency
+        self.lock = threading.Lock()
+        self.datasets = {}
+        self.runs = {}
+        self.next_offset = 0
+        self.items_served = 0
+        self.calls = {"start": 0, "list_items": 0}
+
+    @staticmethod
+    def sleep(seconds):
+        if seconds:
+            time.sleep(seconds)
+
+    def client_factory(self):
+        """Thay cho apify_client.ApifyClient: ApifyClient(token) -> FakeApifyClient."""
+        server = self
+
+        class FakeApifyClient:
+            def __init__(self, token=None, **kwargs):
+                self.token = token
+
+            def actor(self, actor_id):
+                return _Actor(server, actor_id)
+
+            def dataset(self, dataset_id):
+                return _Dataset(server, dataset_id)
+
+            def run(self, run_id):
+                return _Run(server, run_id)
+
+        return FakeApifyClient
+
+if __name__ == "__main__":
+    print(json.dumps(generate_items(1)[0], ensure_ascii=False, indent=2)[:2000])
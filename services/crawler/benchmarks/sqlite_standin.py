@@ -0,0 +1,220 @@
+# benchmarks/sqlite_standin.py
+"""
+SQLite thay cho MySQL khi benchmark offline.
+- Schema: dịch init_db/schema.sql sang SQLite (mỗi database MySQL là một file ATTACH
+  cùng tên, nên câu SQL kiểu metadata_tiktok.file_log chạy được nguyên vẹn).
+- SQLiteConnection: giống phần pymysql mà db / loader / transformer dùng
+  (cursor() dạng DictCursor, begin/commit/rollback, ping), dịch SQL MySQL khi execute:
+  %s -> ?, INSERT IGNORE -> INSERT OR IGNORE, ON DUPLICATE KEY UPDATE x = VALUES(x)
+  -> ON CONFLICT DO UPDATE SET x = excluded.x, TRUNCATE -> DELETE.
+Chỉ dùng để so sánh tương đối giữa các lần chạy, không thay được số đo trên MySQL thật.
+"""
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+DATABASES = ("metadata_tiktok", "staging_tiktok", "warehouse_tiktok")
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))), "init_db", "schema.sql")
+
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(" "))
+sqlite3.register_adapter(date, lambda v: v.isoformat())
+
+_VALUES_FN = re.compile(r"VALUES\s*\(\s*(\w+)\s*\)", re.IGNORECASE)
+_DUPLICATE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r"INSERT\s+IGNORE", re.IGNORECASE)
+_TRUNCATE = re.compile(r"TRUNCATE\s+TABLE", re.IGNORECASE)
+
+def translate(sql):
+    """Dịch một câu SQL MySQL (dạng pipeline dùng) sang SQLite."""
+    dup = _DUPLICATE.search(sql)
+    if dup:
+        head, tail = sql[:dup.start()], sql[dup.end():]
+        sql = head + "ON CONFLICT DO UPDATE SET" + _VALUES_FN.sub(r"excluded.\1", tail)
+    sql = _INSERT_IGNORE.sub("INSERT OR IGNORE", sql)
+    sql = _TRUNCATE.sub("DELETE FROM", sql)
+    sql = re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", sql, flags=re.IGNORECASE)
+    return sql.replace("%s", "?")
+
+# ---------- schema ----------
+_TYPE_RULES = [
+    (re.compile(r"\b(BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP", re.I), ""),
+    (re.compile(r"\bAUTO_INCREMENT\b", re.I), ""),
+    (re.compile(r"\s+(CHARACTER\s+SET|COLLATE)\s+\w+", re.I), ""),
+]
+_SKIP_LINE = re.compile(r"^\s*(INDEX|KEY|FOREIGN\s+KEY|CONSTRAINT)\b", re.I)
+_INLINE_INDEX = re.compile(r"^\s*(?:INDEX|KEY)\s+(\w+)\s*\((.*)\)\s*$", re.I | re.S)
+_PARTITION_BY = re.compile(r"\)\s*PARTITION\s+BY\b.*$", re.I | re.S)
+_PRIMARY_KEY = re.compile(r"^\s*PRIMARY\s+KEY\s*\((.*)\)", re.I | re.S)
+_FOREIGN_KEY = re.compile(r"^\s*FOREIGN\s+KEY\s*\(([\w\s,]+)\)", re.I)
+_CREATE_INDEX = re.compile(r"CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)\s*\((.*)\)\s*$", re.I | re.S)
+
+def _index(database, index_name, table, columns):
+    columns = re.sub(r"\(\d+\)", "", columns)  # bỏ prefix length kiểu file_path(255)
+    return f"CREATE INDEX IF NOT EXISTS {database}.{index_name} ON {table} ({columns})"
+_UNIQUE_KEY = re.compile(r"^\s*UNIQUE\s+KEY\s*(\w+\s*)?\(", re.I)
+
+def _create_table(stmt, database):
+    """
+    CREATE TABLE MySQL -> SQLite: bỏ FK và PARTITION BY, UNIQUE KEY -> UNIQUE, gắn tiền tố database.
+    INDEX trong thân bảng được tách thành CREATE INDEX riêng; cột FK chưa đứng đầu index nào
+    cũng được đánh index như InnoDB tự làm. Trả về list câu DDL.
+    """
+    m = re.match(r"CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+([\w.]+)\s*\(", stmt, re.I)
+    if not m:
+        return []
+    stmt = _PARTITION_BY.sub(")", stmt)
+    name = m.group(1)
+    if "." not in name:
+        name = f"{database}.{name}"
+    db_name, table = name.split(".", 1)
+    if db_name not in DATABASES:
+        return []
+    indexes = []
+    leading = set()  # cột đứng đầu PK / index trong thân bảng
+    foreign = []
+    body = stmt[m.end():stmt.rindex(")")]
+    columns = []
+    depth, current = 0, ""
+    for ch in body:
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            columns.append(current)
+            current = ""
+        else:
+            current += ch
+    columns.append(current)
+    out = []
+    for col in columns:
+        col = col.strip()
+        primary = _PRIMARY_KEY.match(col)
+        if primary:
+            leading.add(primary.group(1).split(",")[0].strip())
+        index = _INLINE_INDEX.match(col)
+        if index:
+            leading.add(index.group(2).split(",")[0].strip())
+            indexes.append(_index(db_name, index.group(1), table, index.group(2)))
+            continue
+        fk = _FOREIGN_KEY.match(col)
+        if fk:
+            foreign.append(fk.group(1).strip())
+            continue
+        if not col or _SKIP_LINE.match(col):
+            continue
+        if _UNIQUE_KEY.match(col):
+            col = _UNIQUE_KEY.sub("UNIQUE (", col)
+            col = re.sub(r"\((\d+)\)", "", col)
+        else:
+            col = re.sub(r"\s+REFERENCES\s+.*$", "", col, flags=re.I)
+            for pattern, repl in _TYPE_RULES:
+                col = pattern.sub(repl, col)
+        out.append(col)
+    for columns in foreign:
+        if columns.split(",")[0].strip() not in leading:
+            suffix = re.sub(r"\W+", "_", columns)
+            indexes.append(_index(db_name, f"fk_{table}_{suffix}", table, columns))
+    return [f"CREATE TABLE IF NOT EXISTS {name} (\n    " + ",\n    ".join(out) + "\n)"] + indexes
+
+def schema_statements(path=SCHEMA_PATH):
+    """Các câu CREATE TABLE / CREATE INDEX SQLite cho ba database pipeline dùng."""
+    with open(path, encoding="utf-8") as fr:
+        text = re.sub(r"--[^\n]*", "", fr.read())
+    database = None
+    statements = []
+    for stmt in (s.strip() for s in text.split(";")):
+        use = re.match(r"USE\s+(\w+)", stmt, re.I)
+        if use:
+            database = use.group(1)
+            continue
+        if re.match(r"CREATE\s+TABLE", stmt, re.I):
+            statements.extend(_create_table(stmt, database))
+            continue
+        index = _CREATE_INDEX.match(stmt)
+        if index and database in DATABASES:
+            statements.append(_index(database, *index.groups()))
+    return statements
+
+# ---------- kết nối ----------
+class SQLiteCursor:
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, args=None):
+        self._cur.execute(translate(sql), tuple(args) if args is not None else ())
+        return self._cur.rowcount
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(translate(sql), seq)
+        return self._cur.rowcount
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    def close(self):
+        self._cur.close()
+
+def _dict_factory(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+class SQLiteConnection:
+    """
+    Kết nối SQLite giả lập pymysql (autocommit, DictCursor).
+    directory=None -> các database nằm trong RAM; có directory -> mỗi database một file .sqlite.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._conn = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = _dict_factory
+        for name in DATABASES:
+            target = ":memory:" if directory is None else os.path.join(directory, f"{name}.sqlite")
+            self._conn.execute("ATTACH DATABASE ? AS " + name, (target,))
+            if directory is not None:
+                self._conn.execute(f"PRAGMA {name}.journal_mode=WAL")
+                self._conn.execute(f"PRAGMA {name}.synchronous=NORMAL")
+        self.create_schema()
+
+    def create_schema(self):
+        for ddl in schema_statements():
+            self._conn.execute(ddl)
+
+    def cursor(self):
+        return SQLiteCursor(self._conn)
+
+    def begin(self):
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        return True
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,58 @@
+# codec.py
+"""
+JSON encode/decode cho file storage và staging: dùng orjson nếu đã cài (nhanh hơn nhiều với
+caption Unicode dài và URL CDN), không có thì dùng json của stdlib.
+- loads(data): str hoặc bytes -> object
+- dumps(obj): object -> bytes UTF-8 (không escape Unicode, như json.dumps(ensure_ascii=False))
+Giá trị orjson không encode được (key không phải str, int > 64 bit) tự rơi về stdlib.
+Lưu ý: orjson đọc số nguyên > 64 bit thành float; id TikTok là chuỗi nên không bị ảnh hưởng.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn
+    orjson = None
+
+class JsonCodec:
+    """Codec stdlib (luôn có)."""
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+class OrjsonCodec(JsonCodec):
+    """Codec orjson, lỗi encode/decode thì thử lại bằng stdlib."""
+    name = "orjson"
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN / Infinity... stdlib đọc được; JSON hỏng thật thì stdlib raise lại
+            return json.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            return super().dumps(obj)
+
+CODECS = {"json": JsonCodec()}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+
+def get(name=None):
+    """Codec theo tên (None = nhanh nhất đã cài)."""
+    if name is None:
+        return default
+    if name not in CODECS:
+        raise ValueError(f"JSON codec {name!r} is not available (installed: {sorted(CODECS)})")
+    return CODECS[name]
+
+default = CODECS.get("orjson", CODECS["json"])
+loads = default.loads
+dumps = default.dumps
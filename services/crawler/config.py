@@ -1,4 +1,7 @@
 import os
+import re
+import time
+import threading
 import yaml
 import smtplib
 from email.mime.text import MIMEText
@@ -7,9 +10,13 @@ from dotenv import load_dotenv
 
 # 1. Thiết lập đường dẫn gốc
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_YAML_PATH = os.path.join(BASE_DIR, "config.yml")
+
+SOURCE_NAME = "tiktok"
+SOURCE_URL = "https://www.tiktok.com"
 
-# 2. Load biến môi trường từ file .env
-load_dotenv(os.path.join(BASE_DIR, ".env"))
+# Khoảng thời gian tối thiểu (giây) giữa hai lần kiểm tra mtime của config.yml
+RELOAD_CHECK_INTERVAL = 1.0
 
 # --- HÀM GỬI MAIL KHẨN CẤP (Dùng riêng cho Config) ---
 def _send_emergency_alert(error_message):
@@ -42,82 +49,292 @@ def _send_emergency_alert(error_message):
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'html'))
 
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender, password)
+        server = smtplib.SMTP(os.getenv("MAIL_SMTP_HOST", "smtp.gmail.com"),
+                              int(os.getenv("MAIL_SMTP_PORT", 587)), timeout=10)
+        if os.getenv("MAIL_USE_TLS", "True").lower() in ("true", "1", "yes", "on"):
+            server.starttls()
+        if server.has_extn("auth"):
+            server.login(sender, password)
         server.sendmail(sender, receiver, msg.as_string())
         server.quit()
         print("✅ Đã gửi email cảnh báo lỗi Config.")
     except Exception as e:
         print(f"❌ Không thể gửi email cảnh báo: {e}")
 
-# 3. Xác định đường dẫn file config.yml
-DEFAULT_YAML_PATH = os.path.join(BASE_DIR, "config.yml")
-CONFIG_PATH = os.getenv("CONFIG_PATH", DEFAULT_YAML_PATH)
+def _alert_in_background(error_message):
+    # Không chặn luồng đang đọc config bởi SMTP
+    threading.Thread(target=_send_emergency_alert, args=(error_message,), name="config-alert").start()
 
-cfg = {}
-if os.path.exists(CONFIG_PATH):
-    try:
-        with open(CONFIG_PATH, "r") as f:
-            cfg = yaml.safe_load(f) or {}
-    except Exception as e:
-        # ===> KÍCH HOẠT GỬI MAIL KHI LỖI <===
-        err_msg = f"Lỗi đọc file YAML tại {CONFIG_PATH}.\nChi tiết: {str(e)}"
-        print(f"Warning: {err_msg}")
-        _send_emergency_alert(err_msg)
-else:
-    print(f"Warning: config.yml not found at {CONFIG_PATH}. Using environment variables only.")
+# ========================================================
+# ĐỌC config.yml (LƯỜI, CÓ CACHE, TỰ RELOAD THEO MTIME)
+# ========================================================
+_PLACEHOLDER = re.compile(r"\$\{(\w+)(?::-([^}]*))?\}")
+
+def _expand(value):
+    """Thay ${VAR} / ${VAR:-default} trong giá trị YAML bằng biến môi trường."""
+    if isinstance(value, dict):
+        return {k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    if not isinstance(value, str):
+        return value
+    m = _PLACEHOLDER.fullmatch(value.strip())
+    if m and m.group(2) is None and os.getenv(m.group(1)) is None:
+        return None  # Cả giá trị là ${VAR} chưa được đặt -> coi như không cấu hình
+    return _PLACEHOLDER.sub(lambda m: os.getenv(m.group(1), m.group(2) or ""), value)
+
+class _ConfigFile:
+    """
+    Nội dung config.yml đã parse + expand, chỉ đọc lại khi mtime đổi.
+    Lần đầu được dùng mới load .env và đọc file (import config không tốn gì).
+    File lỗi: giữ cấu hình đọc được gần nhất và gửi mail cảnh báo ở thread nền.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._data = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self.path = None
+        self.version = 0
+
+    def data(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+                return self._data
+            self._checked_at = now
+            if not self._loaded:
+                # 2. Load biến môi trường từ file .env
+                load_dotenv(os.path.join(BASE_DIR, ".env"))
+                # 3. Xác định đường dẫn file config.yml
+                self.path = os.getenv("CONFIG_PATH", DEFAULT_YAML_PATH)
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            if self._loaded and mtime == self._mtime:
+                return self._data
+            first = not self._loaded
+            self._loaded = True
+            self._mtime = mtime
+            if mtime is None:
+                if first:
+                    print(f"Warning: config.yml not found at {self.path}. Using environment variables only.")
+                self._data = {}
+            else:
+                try:
+                    with open(self.path, "r") as f:
+                        self._data = _expand(yaml.safe_load(f) or {})
+                    if not first:
+                        print(f"Config reloaded from {self.path}")
+                except Exception as e:
+                    # ===> KÍCH HOẠT GỬI MAIL KHI LỖI <===
+                    err_msg = f"Lỗi đọc file YAML tại {self.path}.\nChi tiết: {str(e)}"
+                    print(f"Warning: {err_msg}")
+                    _alert_in_background(err_msg)
+            self.version += 1
+            return self._data
+
+    def force_reload(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self._mtime = object()  # khác mọi mtime -> lần data() sau đọc lại file
+        return self.data()
+
+_file = _ConfigFile()
 
 # ========================================================
 # HÀM HỖ TRỢ LẤY CONFIG
 # ========================================================
 def get_conf(env_key, yaml_section, yaml_key, default=None):
+    cfg = _file.data()
     val = os.getenv(env_key)
     if val is not None:
         return val
-    if cfg and yaml_section in cfg:
-        return cfg[yaml_section].get(yaml_key, default)
+    if cfg and isinstance(cfg.get(yaml_section), dict):
+        val = cfg[yaml_section].get(yaml_key)
+        if val is not None:
+            return val
     return default
 
+def _bool(value):
+    return str(value).lower() in ("true", "1", "yes", "on")
+
+def _hashtag_list(value):
+    if isinstance(value, str):
+        value = [h.strip() for h in value.split(",")]
+    return [h for h in value if h]
+
+def _optional_int(value):
+    return None if value in (None, "") else int(value)
+
+class Setting:
+    """
+    Một biến cấu hình: biến môi trường `env` > config.yml [section][key] > default.
+    default có thể là hàm (tính từ biến khác, vd đường dẫn nằm trong STORAGE_PATH);
+    cast chuyển giá trị thô (chuỗi env / giá trị YAML) sang đúng kiểu.
+    """
+    __slots__ = ("env", "section", "key", "default", "cast")
+
+    def __init__(self, env, section, key, default=None, cast=str):
+        self.env = env
+        self.section = section
+        self.key = key
+        self.default = default
+        self.cast = cast
+
+    def resolve(self):
+        if self.section is None:
+            value = os.getenv(self.env)
+        else:
+            value = get_conf(self.env, self.section, self.key)
+        if value is None:
+            value = self.default() if callable(self.default) else self.default
+        if value is None or self.cast is None:
+            return value
+        return self.cast(value)
+
+def _in_storage(name):
+    return lambda: os.path.join(__getattr__("STORAGE_PATH"), name)
+
 # ========================================================
-# CÁC BIẾN CẤU HÌNH (CONSTANTS)
+# CÁC BIẾN CẤU HÌNH (đọc lười qua config.<TÊN>, cache tới khi config.yml đổi)
 # ========================================================
+SETTINGS = {
+    # --- App Config ---
+    "DEVICE_ID": Setting("DEVICE_ID", "app", "device_id", "device-unknown"),
+    "STORAGE_PATH": Setting("STORAGE_PATH", "app", "storage_path", os.path.join(BASE_DIR, "storage")),
+    "STORAGE_FORMAT": Setting("STORAGE_FORMAT", "app", "storage_format", "json"),
+    "MAX_ITEMS_PER_RUN": Setting("MAX_ITEMS_PER_RUN", "app", "max_items_per_run", 1000, int),
+    "FILE_PATTERN": Setting("FILE_PATTERN", "app", "file_pattern", "*_run_*"),
+    "DATE_FORMAT": Setting("DATE_FORMAT", "app", "date_format", "%Y-%m-%d"),
 
-# --- App Config ---
-DEVICE_ID = get_conf("DEVICE_ID", "app", "device_id", "device-unknown")
+    # --- Dedup Index Config (bỏ video không đổi giữa các lần crawl) ---
+    "DEDUP_ENABLED": Setting("DEDUP_ENABLED", "dedup", "enabled", True, _bool),
+    "DEDUP_INDEX_PATH": Setting("DEDUP_INDEX_PATH", "dedup", "index_path", _in_storage(".dedup_index.sqlite")),
+    "DEDUP_MAX_AGE_DAYS": Setting("DEDUP_MAX_AGE_DAYS", "dedup", "max_age_days", 30, int),
 
-_storage_default = os.path.join(BASE_DIR, "storage")
-STORAGE_PATH = get_conf("STORAGE_PATH", "app", "storage_path", _storage_default)
+    # --- Loader Config (storage -> staging_raw) ---
+    "LOADER_BATCH_SIZE": Setting("LOADER_BATCH_SIZE", "loader", "batch_size", 1000, int),
 
-if not os.path.exists(STORAGE_PATH):
-    try:
-        os.makedirs(STORAGE_PATH, exist_ok=True)
-    except Exception as e:
-        print(f"Error creating storage path {STORAGE_PATH}: {e}")
+    # --- Transform Config (staging_raw -> warehouse) ---
+    "TRANSFORM_CHUNK_SIZE": Setting("TRANSFORM_CHUNK_SIZE", "transform", "chunk_size", 5000, int),
+    "TRANSFORM_CACHE_SIZE": Setting("TRANSFORM_CACHE_SIZE", "transform", "cache_size", 100000, int),
+    "TRANSFORM_REFRESH_ROLLUPS": Setting("TRANSFORM_REFRESH_ROLLUPS", "transform", "refresh_rollups", True, _bool),
+    "SNAPSHOT_PARTITIONS_AHEAD": Setting("SNAPSHOT_PARTITIONS_AHEAD", "snapshot", "partitions_ahead_months", 3, int),
+    "SNAPSHOT_RETENTION_MONTHS": Setting("SNAPSHOT_RETENTION_MONTHS", "snapshot", "retention_months", 0, int),
+    "SNAPSHOT_ARCHIVE": Setting("SNAPSHOT_ARCHIVE", "snapshot", "archive", True, _bool),
+    "BACKFILL_WORKERS": Setting("BACKFILL_WORKERS", "backfill", "workers", 0, int),
+    "BACKFILL_CURSOR_PATH": Setting("BACKFILL_CURSOR_PATH", "backfill", "cursor_path",
+                                    _in_storage(".backfill_cursor.json")),
+    "DIM_DATE_START_YEAR": Setting("DIM_DATE_START_YEAR", "transform", "dim_date_start_year", 2015, int),
+    "DIM_DATE_END_YEAR": Setting("DIM_DATE_END_YEAR", "transform", "dim_date_end_year", 2035, int),
 
-FILE_PATTERN = get_conf("FILE_PATTERN", "app", "file_pattern", "*.json")
-DATE_FORMAT = get_conf("DATE_FORMAT", "app", "date_format", "%Y-%m-%d")
-SOURCE_NAME = "tiktok"
-SOURCE_URL = "https://www.tiktok.com"
+    # --- Apify Config ---
+    "APIFY_TOKEN": Setting("APIFY_TOKEN", "apify", "token"),
+    "APIFY_ACTOR": Setting("APIFY_ACTOR", "apify", "actor_id"),
+    "APIFY_PAGE_SIZE": Setting("APIFY_PAGE_SIZE", "apify", "page_size", 500, int),
+
+    # --- Crawl Config (fan-out theo hashtag) ---
+    "CRAWL_HASHTAGS": Setting("CRAWL_HASHTAGS", "crawl", "hashtags", ["fyp"], _hashtag_list),
+    "CRAWL_RESULTS_PER_PAGE": Setting("CRAWL_RESULTS_PER_PAGE", "crawl", "results_per_page", 3, int),
+    "CRAWL_SHARD_SIZE": Setting("CRAWL_SHARD_SIZE", "crawl", "shard_size", 5, int),
+    "CRAWL_MAX_CONCURRENCY": Setting("CRAWL_MAX_CONCURRENCY", "crawl", "max_concurrency", 4, int),
+    "CRAWL_CHECKPOINT_ENABLED": Setting("CRAWL_CHECKPOINT_ENABLED", "crawl", "checkpoint_enabled", True, _bool),
+    "CRAWL_CHECKPOINT_PATH": Setting("CRAWL_CHECKPOINT_PATH", "crawl", "checkpoint_path",
+                                     _in_storage(".crawl_checkpoint.json")),
+    "CRAWL_CHECKPOINT_MAX_AGE_HOURS": Setting("CRAWL_CHECKPOINT_MAX_AGE_HOURS", "crawl",
+                                              "checkpoint_max_age_hours", 24, float),
+
+    # --- Coordinator Config (nhiều device chia nhau hashtag qua bảng crawl_work_unit) ---
+    "COORDINATOR_ENABLED": Setting("COORDINATOR_ENABLED", "coordinator", "enabled", False, _bool),
+    "COORDINATOR_UNITS_PER_RUN": Setting("COORDINATOR_UNITS_PER_RUN", "coordinator", "units_per_run", 10, int),
+    "COORDINATOR_LEASE_SECONDS": Setting("COORDINATOR_LEASE_SECONDS", "coordinator", "lease_seconds", 1800, int),
+    "COORDINATOR_MIN_INTERVAL_MINUTES": Setting("COORDINATOR_MIN_INTERVAL_MINUTES", "coordinator",
+                                                "min_interval_minutes", 60, float),
+
+    # --- MySQL Config ---
+    "MYSQL_HOST": Setting("MYSQL_HOST", "mysql", "host", "localhost"),
+    "MYSQL_PORT": Setting("MYSQL_PORT", "mysql", "port", 3306, int),
+    "MYSQL_USER": Setting("MYSQL_USER", "mysql", "user", "root"),
+    "MYSQL_PASSWORD": Setting("MYSQL_PASSWORD", "mysql", "password", ""),
+    "MYSQL_DB": Setting("MYSQL_DATABASE", "mysql", "database", "metadata_tiktok"),
+    "MYSQL_CONNECT_RETRIES": Setting("MYSQL_CONNECT_RETRIES", "mysql", "connect_retries", 5, int),
+    "MYSQL_CONNECT_RETRY_BACKOFF": Setting("MYSQL_CONNECT_RETRY_BACKOFF", "mysql", "connect_retry_backoff", 5, float),
+    "MYSQL_POOL_SIZE": Setting("MYSQL_POOL_SIZE", "mysql", "pool_size", 5, int),
+    "MYSQL_POOL_TIMEOUT": Setting("MYSQL_POOL_TIMEOUT", "mysql", "pool_timeout", 30, float),
+
+    # --- Metrics Config ---
+    "METRICS_PORT": Setting("METRICS_PORT", "metrics", "port", 0, int),
+    "METRICS_HOST": Setting("METRICS_HOST", "metrics", "host", "0.0.0.0"),
+
+    # --- Schedule Config ---
+    "SCHEDULE_CRON": Setting("SCHEDULE_CRON", "schedule", "cron", "0 8 * * *"),
+    "SCHEDULE_ENABLED": Setting("SCHEDULE_ENABLED", "schedule", "enabled", True, _bool),
+    "SCHEDULE_TIMEZONE": Setting("SCHEDULE_TIMEZONE", "schedule", "timezone", "Asia/Ho_Chi_Minh"),
+    "SCHEDULE_MODE": Setting("SCHEDULE_MODE", "schedule", "mode", "single"),
+    "SCHEDULE_EXECUTOR": Setting("SCHEDULE_EXECUTOR", "schedule", "executor", "thread"),
+    "SCHEDULE_MAX_WORKERS": Setting("SCHEDULE_MAX_WORKERS", "schedule", "max_workers", 4, int),
+    "SCHEDULE_MAX_INSTANCES": Setting("SCHEDULE_MAX_INSTANCES", "schedule", "max_instances", 1, int),
+    "SCHEDULE_COALESCE": Setting("SCHEDULE_COALESCE", "schedule", "coalesce", True, _bool),
+    "SCHEDULE_MISFIRE_GRACE_TIME": Setting("SCHEDULE_MISFIRE_GRACE_TIME", "schedule", "misfire_grace_time", 600, int),
+    "SCHEDULE_JOBSTORE_PATH": Setting("SCHEDULE_JOBSTORE_PATH", "schedule", "jobstore_path",
+                                      _in_storage(".scheduler_jobs.sqlite")),
+
+    # --- Email Config ---
+    "MAIL_SENDER": Setting("MAIL_SENDER", None, None),
+    "MAIL_PASSWORD": Setting("MAIL_PASSWORD", None, None),
+    "MAIL_RECEIVER": Setting("MAIL_RECEIVER", None, None),
+    "MAIL_SMTP_HOST": Setting("MAIL_SMTP_HOST", "mail", "smtp_host", "smtp.gmail.com"),
+    "MAIL_SMTP_PORT": Setting("MAIL_SMTP_PORT", "mail", "smtp_port", 587, int),
+    "MAIL_USE_TLS": Setting("MAIL_USE_TLS", "mail", "use_tls", True, _bool),
+    "MAIL_DIGEST_WINDOW": Setting("MAIL_DIGEST_WINDOW", "mail", "digest_window", 5, float),
+}
+
+_values = {}
+_values_version = -1
+_values_lock = threading.RLock()
+
+def _ensure_storage_path(path):
+    # Thư mục storage chỉ được tạo khi có module thực sự dùng tới
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path, exist_ok=True)
+        except Exception as e:
+            print(f"Error creating storage path {path}: {e}")
+
+def __getattr__(name):
+    if name == "cfg":
+        return _file.data()
+    if name == "CONFIG_PATH":
+        _file.data()
+        return _file.path
+    setting = SETTINGS.get(name)
+    if setting is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global _values_version
+    with _values_lock:
+        _file.data()
+        if _values_version != _file.version:
+            # config.yml vừa được (re)load -> bỏ cache các giá trị đã tính
+            _values.clear()
+            _values_version = _file.version
+        if name not in _values:
+            value = setting.resolve()
+            if name == "STORAGE_PATH":
+                _ensure_storage_path(value)
+            _values[name] = value
+        return _values[name]
+
+def __dir__():
+    return sorted(list(globals()) + list(SETTINGS) + ["cfg", "CONFIG_PATH"])
+
+def reload():
+    """Đọc lại config.yml ngay (không chờ kiểm tra mtime)."""
+    _file.force_reload()
 
-# --- Apify Config ---
-APIFY_TOKEN = get_conf("APIFY_TOKEN", "apify", "token")
-APIFY_ACTOR = get_conf("APIFY_ACTOR", "apify", "actor_id")
-
-# --- MySQL Config ---
-MYSQL_HOST = get_conf("MYSQL_HOST", "mysql", "host", "localhost")
-MYSQL_PORT = int(get_conf("MYSQL_PORT", "mysql", "port", 3306))
-MYSQL_USER = get_conf("MYSQL_USER", "mysql", "user", "root")
-MYSQL_PASSWORD = get_conf("MYSQL_PASSWORD", "mysql", "password", "")
-MYSQL_DB = get_conf("MYSQL_DATABASE", "mysql", "database", "metadata_tiktok")
-
-# --- Schedule Config ---
-SCHEDULE_CRON = get_conf("SCHEDULE_CRON", "schedule", "cron", "0 8 * * *")
-_sched_enabled = get_conf("SCHEDULE_ENABLED", "schedule", "enabled", "True")
-SCHEDULE_ENABLED = str(_sched_enabled).lower() in ("true", "1", "yes", "on")
-SCHEDULE_TIMEZONE = get_conf("SCHEDULE_TIMEZONE", "schedule", "timezone", "Asia/Ho_Chi_Minh")
-
-# --- Email Config ---
-MAIL_SENDER = os.getenv("MAIL_SENDER")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-MAIL_RECEIVER = os.getenv("MAIL_RECEIVER")
\ No newline at end of file
+def snapshot():
+    """Giá trị hiện tại của mọi biến cấu hình (dict, đã ép kiểu)."""
+    return {name: __getattr__(name) for name in SETTINGS}
@@ -0,0 +1,69 @@
+# convert_storage.py
+"""
+Chuyển toàn bộ file trong STORAGE_PATH sang định dạng lưu trữ khác (mặc định app.storage_format).
+
+    python convert_storage.py --to ndjson.gz
+
+File gốc chỉ bị xoá sau khi file mới được ghi xong và đủ số item. Trạng thái
+file_log (đã load hay chưa) được chuyển sang tên file mới để loader không load lại;
+nếu không chuyển được, file mới bị xoá và file gốc được giữ nguyên (exit code 1).
+"""
+import os
+import sys
+import argparse
+import config
+from logging_setup import logger
+import db
+import loader
+import storage
+
+def convert_file(src, fmt, page_size=500):
+    """Chuyển một file sang định dạng fmt (streaming). Trả về đường dẫn file mới."""
+    stem, _ = storage.split_format(src)
+    dst = stem + storage.FORMAT_EXTENSIONS[fmt]
+    with storage.StorageWriter(dst, fmt) as writer:
+        page = []
+        for item in storage.iter_items(src):
+            page.append(item)
+            if len(page) >= page_size:
+                writer.write_page(page)
+                page = []
+        writer.write_page(page)
+    return dst, writer.count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--to", dest="fmt", default=config.STORAGE_FORMAT, choices=sorted(storage.FORMAT_EXTENSIONS))
+    args = parser.parse_args()
+
+    files = [f for f in loader.discover_files() if storage.detect_format(f) != args.fmt]
+    logger.info("Converting %d files to %s", len(files), args.fmt)
+    saved = failed = 0
+    for src in files:
+        src_size = os.path.getsize(src)
+        dst, count = convert_file(src, args.fmt)
+        source_count = sum(1 for _ in storage.iter_raw_items(src))
+        if count != source_count:
+            os.remove(dst)
+            logger.error("Item count mismatch for %s (%d != %d), skipped", src, count, source_count)
+            failed += 1
+            continue
+        st = os.stat(dst)
+        try:
+            db.rename_file_state(os.path.basename(src), os.path.basename(dst),
+                                 st.st_size, st.st_mtime, loader.file_hash(dst))
+        except Exception as e:
+            # Giữ file gốc: file mới không có trạng thái file_log sẽ bị loader load lại (trùng staging)
+            os.remove(dst)
+            logger.error("Could not move file_log state for %s, kept the original: %s", src, e)
+            failed += 1
+            continue
+        saved += src_size - st.st_size
+        os.remove(src)
+    logger.info("Done. Saved %.1f MB", saved / 1e6)
+    if failed:
+        logger.error("%d files were not converted", failed)
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,194 @@
+# coordinator.py
+import threading
+import config
+from logging_setup import logger
+import db
+
+WORK_UNIT_TABLE = "metadata_tiktok.crawl_work_unit"
+
+def sync_work_units(hashtags):
+    """Thêm các hashtag cấu hình vào bảng work unit (hashtag đã có thì giữ nguyên trạng thái)."""
+    if not hashtags:
+        return 0
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            return cur.executemany(f"INSERT IGNORE INTO {WORK_UNIT_TABLE} (hashtag) VALUES (%s)",
+                                   [(h,) for h in hashtags])
+
+def claim(device_id, limit, lease_seconds, min_interval_seconds=0):
+    """
+    Nhận tối đa `limit` work unit cho device_id bằng lease theo dòng.
+    SELECT ... FOR UPDATE SKIP LOCKED: các device chạy đồng thời bỏ qua dòng device khác
+    đang khoá thay vì chờ, nên mỗi unit chỉ về một device.
+    - Trước hết lấy lại unit chính device_id còn giữ (lần chạy trước bị crash), để checkpoint
+      của lần chạy dở còn dùng được.
+    - Sau đó lấy unit chưa có lease hoặc lease đã hết hạn (device kia chết), chưa được crawl
+      trong min_interval_seconds. Quét theo khoá chính + READ COMMITTED để chỉ khoá các dòng
+      thực sự nhận, không chặn device khác.
+    Trả về list (id, hashtag) theo id.
+    """
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            conn.begin()
+            cur.execute(
+                f"""
+                SELECT id, hashtag FROM {WORK_UNIT_TABLE}
+                WHERE lease_owner = %s AND is_active = TRUE
+                ORDER BY id LIMIT %s
+                FOR UPDATE
+                """,
+                (device_id, int(limit)),
+            )
+            units = [(row["id"], row["hashtag"]) for row in cur.fetchall()]
+            if len(units) < limit:
+                cur.execute(
+                    f"""
+                    SELECT id, hashtag FROM {WORK_UNIT_TABLE}
+                    WHERE is_active = TRUE
+                      AND (lease_owner IS NULL OR lease_expires_at < NOW())
+                      AND (last_crawled_at IS NULL OR last_crawled_at < NOW() - INTERVAL %s SECOND)
+                    ORDER BY id LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (int(min_interval_seconds), int(limit) - len(units)),
+                )
+                units += [(row["id"], row["hashtag"]) for row in cur.fetchall()]
+            units.sort()
+            if units:
+                placeholders = ",".join(["%s"] * len(units))
+                cur.execute(
+                    f"""
+                    UPDATE {WORK_UNIT_TABLE}
+                    SET lease_owner = %s, lease_expires_at = NOW() + INTERVAL %s SECOND,
+                        attempts = attempts + 1
+                    WHERE id IN ({placeholders})
+                    """,
+                    [device_id, int(lease_seconds)] + [unit_id for unit_id, _ in units],
+                )
+        conn.commit()
+    if units:
+        logger.info("Device %s claimed %d work units: %s", device_id, len(units), [h for _, h in units])
+    return units
+
+def renew(device_id, unit_ids, lease_seconds):
+    """Gia hạn lease cho các unit device còn giữ. Trả về số unit được gia hạn."""
+    if not unit_ids:
+        return 0
+    placeholders = ",".join(["%s"] * len(unit_ids))
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            return cur.execute(
+                f"""
+                UPDATE {WORK_UNIT_TABLE} SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                WHERE lease_owner = %s AND id IN ({placeholders})
+                """,
+                [int(lease_seconds), device_id] + list(unit_ids),
+            )
+
+def finish(device_id, unit_ids, status):
+    """
+    Trả lease. status SUCCESS -> ghi last_crawled_at (unit nghỉ tới min_interval);
+    trạng thái khác -> unit được nhận lại ngay bởi device bất kỳ.
+    Chỉ tác động lên unit device còn giữ (lease đã bị device khác lấy thì bỏ qua).
+    """
+    if not unit_ids:
+        return 0
+    placeholders = ",".join(["%s"] * len(unit_ids))
+    crawled = "NOW()" if status == "SUCCESS" else "last_crawled_at"
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            return cur.execute(
+                f"""
+                UPDATE {WORK_UNIT_TABLE}
+                SET lease_owner = NULL, lease_expires_at = NULL, last_status = %s,
+                    last_crawled_at = {crawled}
+                WHERE lease_owner = %s AND id IN ({placeholders})
+                """,
+                [status, device_id] + list(unit_ids),
+            )
+
+class Lease:
+    """
+    Các work unit đã nhận cho một lần chạy, kèm thread nền gia hạn lease mỗi lease_seconds/3
+    để run dài không bị device khác lấy mất. Device chết -> không gia hạn -> lease hết hạn.
+        lease = coordinator.Lease.acquire(config.DEVICE_ID, 10, 3600).start()
+        try:
+            crawl(lease.hashtags)
+            lease.finish(ok_hashtags, "SUCCESS")
+        finally:
+            lease.close()
+    Unit chưa được finish khi close() được trả về với trạng thái FAILED.
+    """
+
+    def __init__(self, device_id, units, lease_seconds):
+        self.device_id = device_id
+        self.units = dict(units)
+        self.lease_seconds = lease_seconds
+        self._open = set(self.units)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def acquire(cls, device_id, limit, lease_seconds, min_interval_seconds=0):
+        return cls(device_id, claim(device_id, limit, lease_seconds, min_interval_seconds), lease_seconds)
+
+    @property
+    def hashtags(self):
+        return [self.units[i] for i in sorted(self.units)]
+
+    def _heartbeat(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            with self._lock:
+                ids = sorted(self._open)
+            try:
+                renewed = renew(self.device_id, ids, self.lease_seconds)
+                if renewed < len(ids):
+                    logger.warning("Lease renewal: only %d/%d work units still owned", renewed, len(ids))
+            except Exception as e:
+                logger.error("Lease renewal failed: %s", e)
+
+    def finish(self, hashtags, status):
+        """Trả lease cho các hashtag đã xử lý xong với trạng thái status."""
+        hashtags = set(hashtags)
+        with self._lock:
+            ids = sorted(i for i in self._open if self.units[i] in hashtags)
+            self._open.difference_update(ids)
+        finish(self.device_id, ids, status)
+
+    def start(self):
+        """Bật thread gia hạn lease."""
+        if self._open and self._thread is None:
+            self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Dừng gia hạn và trả các unit chưa finish (FAILED) để device khác nhận lại."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            ids = sorted(self._open)
+            self._open.clear()
+        if ids:
+            try:
+                finish(self.device_id, ids, "FAILED")
+            except Exception as e:
+                logger.error("Could not release work units %s: %s", ids, e)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def claim_hashtags(device_id=None):
+    """Lease theo cấu hình: đồng bộ CRAWL_HASHTAGS vào bảng rồi nhận unit cho device này."""
+    device_id = device_id or config.DEVICE_ID
+    sync_work_units(config.CRAWL_HASHTAGS)
+    return Lease.acquire(device_id, config.COORDINATOR_UNITS_PER_RUN, config.COORDINATOR_LEASE_SECONDS,
+                         config.COORDINATOR_MIN_INTERVAL_MINUTES * 60)
@@ -0,0 +1,132 @@
+# crawl_checkpoint.py
+import os
+import json
+import time
+import threading
+import storage
+from logging_setup import logger
+
+class CrawlCheckpoint:
+    """
+    Checkpoint của một lần crawl đang chạy, lưu dạng JSON trong STORAGE_PATH.
+    Ghi lại file đích, vị trí đã ghi xong trong `.part` (số item, số byte) và với mỗi shard:
+    run_id / dataset_id của actor run cùng offset dataset đã lưu xuống đĩa.
+    Nếu container restart giữa chừng, lần chạy sau gắn lại vào các run cũ
+    và tải tiếp từ offset thay vì tạo actor run mới.
+    """
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, file_name, fmt, hashtags, position=(0, 0)):
+        checkpoint = cls(path, {
+            "file_name": file_name,
+            "format": fmt,
+            "hashtags": list(hashtags),
+            "created_at": time.time(),
+            "position": list(position),
+            "duplicates": 0,
+            "unchanged": 0,
+            "shards": {},
+        })
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding="utf-8") as fr:
+                return cls(path, json.load(fr))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable crawl checkpoint %s: %s", path, e)
+            return None
+
+    @property
+    def file_name(self):
+        return self.data["file_name"]
+
+    @property
+    def position(self):
+        return tuple(self.data["position"])
+
+    @staticmethod
+    def _key(shard):
+        return ",".join(shard)
+
+    def shard(self, shard):
+        """Trạng thái shard: {run_id, dataset_id, offset, done} (dict rỗng nếu chưa chạy)."""
+        with self._lock:
+            return dict(self.data["shards"].get(self._key(shard), {}))
+
+    def set_run(self, shard, run_id, dataset_id):
+        with self._lock:
+            self.data["shards"][self._key(shard)] = {
+                "run_id": run_id, "dataset_id": dataset_id, "offset": 0, "done": False}
+            self._save()
+
+    def advance(self, shard, offset, position, duplicates=0, unchanged=0):
+        """Gọi sau khi một trang đã được ghi xuống đĩa: offset dataset tiếp theo + vị trí file."""
+        with self._lock:
+            self.data["shards"][self._key(shard)]["offset"] = offset
+            self.data["position"] = list(position)
+            self.data["duplicates"] += duplicates
+            self.data["unchanged"] += unchanged
+            self._save()
+
+    def finish_shard(self, shard):
+        with self._lock:
+            self.data["shards"][self._key(shard)]["done"] = True
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fw:
+            json.dump(self.data, fw)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def start_or_resume(path, storage_path, file_name, fmt, hashtags, max_age_hours=24):
+    """
+    Trả về (checkpoint, writer, resumed).
+    Có checkpoint hợp lệ (cùng hashtags/định dạng, chưa quá max_age_hours, `.part` còn đủ dữ liệu)
+    -> mở lại writer tại vị trí đã checkpoint; ngược lại tạo checkpoint + file mới tên file_name.
+    """
+    checkpoint = CrawlCheckpoint.load(path)
+    if checkpoint is not None:
+        data = checkpoint.data
+        age_hours = (time.time() - data.get("created_at", 0)) / 3600
+        reason = None
+        if data.get("format") != fmt or data.get("hashtags") != list(hashtags):
+            reason = "crawl config changed"
+        elif age_hours > max_age_hours:
+            reason = f"older than {max_age_hours}h"
+        else:
+            fpath = os.path.join(storage_path, checkpoint.file_name)
+            try:
+                writer = storage.StorageWriter(fpath, fmt, resume_at=checkpoint.position)
+            except (OSError, ValueError) as e:
+                reason = str(e)
+            else:
+                logger.info("Resuming crawl %s from checkpoint: %d items, %d shards started",
+                            checkpoint.file_name, writer.count, len(data["shards"]))
+                return checkpoint, writer, True
+        logger.warning("Discarding crawl checkpoint for %s (%s)", checkpoint.file_name, reason)
+        checkpoint.remove()
+
+    writer = storage.StorageWriter(os.path.join(storage_path, file_name), fmt)
+    # Vị trí ban đầu tính cả phần mở đầu writer đã ghi ("[" của JSON array)
+    return CrawlCheckpoint.create(path, file_name, fmt, hashtags, writer.position), writer, False
@@ -0,0 +1,152 @@
+# crawl_fanout.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from apify_client import ApifyClient
+from logging_setup import logger
+import apify_service
+import codec
+
+def split_shards(hashtags, shard_size):
+    """Chia danh sách hashtag thành các shard, mỗi shard tối đa shard_size hashtag."""
+    shard_size = max(1, int(shard_size))
+    return [hashtags[i:i + shard_size] for i in range(0, len(hashtags), shard_size)]
+
+def _run_shard(actor_id, apify_token, shard, results_per_page, checkpoint=None):
+    """
+    Chạy một actor run cho một shard (chạy trong worker thread, client riêng).
+    Có checkpoint: shard đã có run_id thì gắn lại vào run đó thay vì tạo run mới.
+    """
+    client = ApifyClient(apify_token)
+    if checkpoint is not None:
+        state = checkpoint.shard(shard)
+        if state.get("run_id"):
+            logger.info("Reattaching shard %s to run %s", shard, state["run_id"])
+            return apify_service.wait_for_run(client, state["run_id"])
+    run_input = {"hashtags": shard, "resultsPerPage": results_per_page}
+    on_started = None
+    if checkpoint is not None:
+        on_started = lambda run_id, dataset_id: checkpoint.set_run(shard, run_id, dataset_id)  # noqa: E731
+    return apify_service.start_run(client, actor_id, run_input, on_started=on_started)
+
+class FanoutResult:
+    """Kết quả fan-out: run_id của các shard, shard lỗi và số item trùng bị bỏ."""
+
+    def __init__(self):
+        self.run_ids = []
+        self.failed_shards = []
+        self.duplicates = 0
+        self.unchanged = 0
+
+    def summary(self):
+        lines = [f"Runs: {', '.join(self.run_ids) or '-'}",
+                 f"Duplicates dropped: {self.duplicates}",
+                 f"Unchanged since last run: {self.unchanged}"]
+        for shard, err in self.failed_shards:
+            lines.append(f"Shard {shard} failed (released, will be crawled again from scratch): {err}")
+        return "\n".join(lines)
+
+def crawl_hashtags(actor_id, apify_token, hashtags, writer, results_per_page=3,
+                   shard_size=5, max_concurrency=4, page_size=500, max_items=None,
+                   dedup_index=None, checkpoint=None):
+    """
+    Fan-out: mỗi shard hashtag chạy một actor run song song (tối đa max_concurrency).
+    Shard nào xong trước thì dataset của nó được stream vào `writer` trước,
+    item trùng `id` giữa các shard bị bỏ. Thời gian ~ shard chậm nhất.
+    dedup_index: bỏ thêm các video có counters không đổi so với lần crawl trước. Hàm này chỉ
+    đọc index; caller ghi nhận file vào index (DedupIndex.record_file) sau khi writer.close()
+    đã publish file, nên item chỉ nằm trong `.part` không bao giờ bị coi là "unchanged".
+    checkpoint (crawl_checkpoint.CrawlCheckpoint): lưu run_id / offset sau mỗi trang để
+    lần chạy sau (sau crash) gắn lại vào run cũ và tải tiếp, không crawl lại.
+    Shard lỗi (chạy actor hoặc tải dataset) được ghi vào failed_shards; chỉ văng lỗi khi tất cả
+    shard đều lỗi. Caller trả hashtag của shard lỗi qua lease để lần sau crawl lại từ đầu.
+    """
+    shards = split_shards(hashtags, shard_size)
+    if not shards:
+        raise ValueError("No hashtags configured for crawl")
+
+    logger.info("Fan-out %d hashtags into %d shards (max_concurrency=%d)",
+                len(hashtags), len(shards), max_concurrency)
+
+    result = FanoutResult()
+    seen_ids = set()
+    client = ApifyClient(apify_token)
+
+    pending = shards
+    if checkpoint is not None:
+        result.duplicates = checkpoint.data["duplicates"]
+        result.unchanged = checkpoint.data["unchanged"]
+        pending = []
+        for shard in shards:
+            state = checkpoint.shard(shard)
+            if state.get("done"):
+                result.run_ids.append(state["run_id"])
+            else:
+                pending.append(shard)
+        if writer.count:
+            # Resume: nạp lại id các item đã ghi để tiếp tục bỏ trùng giữa các shard
+            seen_ids.update(codec.loads(raw).get("id") for raw in writer.iter_written())
+        if len(pending) < len(shards):
+            logger.info("Checkpoint: %d/%d shards already merged", len(shards) - len(pending), len(shards))
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_concurrency)),
+                            thread_name_prefix="apify-shard") as pool:
+        futures = {
+            pool.submit(_run_shard, actor_id, apify_token, shard, results_per_page, checkpoint): shard
+            for shard in pending
+        }
+        for fut in as_completed(futures):
+            shard = futures[fut]
+            try:
+                run_id, dataset_id = fut.result()
+            except Exception as e:
+                logger.error("Shard %s failed: %s", shard, e)
+                result.failed_shards.append((shard, str(e)))
+                continue
+
+            result.run_ids.append(run_id)
+            remaining = None if max_items is None else max_items - writer.count
+            if remaining is not None and remaining <= 0:
+                logger.warning("max_items reached, skipping dataset %s", dataset_id)
+                if checkpoint is not None:
+                    checkpoint.finish_shard(shard)
+                continue
+
+            offset = checkpoint.shard(shard).get("offset", 0) if checkpoint is not None else 0
+            if offset:
+                logger.info("Resuming dataset %s from offset %d", dataset_id, offset)
+            try:
+                for page in apify_service.iter_dataset_pages(client, dataset_id, page_size,
+                                                             offset=offset, max_items=remaining):
+                    offset += len(page)
+                    fresh = []
+                    duplicates = 0
+                    for item in page:
+                        item_id = item.get("id")
+                        if item_id is not None:
+                            if item_id in seen_ids:
+                                duplicates += 1
+                                continue
+                            seen_ids.add(item_id)
+                        fresh.append(item)
+                    unchanged = 0
+                    if dedup_index is not None:
+                        fresh, unchanged = dedup_index.filter_new(fresh)
+                    result.duplicates += duplicates
+                    result.unchanged += unchanged
+                    writer.write_page(fresh)
+                    # Checkpoint sau khi trang đã xuống đĩa: crash ở giữa thì trang bị cắt khỏi .part và tải lại
+                    if checkpoint is not None:
+                        checkpoint.advance(shard, offset, writer.position, duplicates, unchanged)
+            except Exception as e:
+                # Các trang đã ghi vẫn nằm trong file được publish. Checkpoint bị xoá khi publish nên
+                # offset không được giữ: hashtag của shard được trả qua lease (FAILED) và crawl lại từ đầu
+                logger.error("Shard %s failed while downloading dataset %s at offset %d: %s",
+                             shard, dataset_id, offset, e)
+                result.failed_shards.append((shard, str(e)))
+                continue
+            if checkpoint is not None:
+                checkpoint.finish_shard(shard)
+            logger.info("Shard %s merged (run %s), total items: %d", shard, run_id, writer.count)
+
+    if len(result.failed_shards) == len(shards):
+        raise RuntimeError(f"All {len(shards)} shards failed. " + result.summary())
+    return result
@@ -1,28 +1,188 @@
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 import pymysql
 import config
 from logging_setup import logger
 
 def get_db_conn():
     """
-    Kết nối Database. Nếu sai pass/host sẽ tự văng lỗi Exception.
+    Kết nối Database (kết nối mới, không qua pool).
+    Thử lại connect_retries lần, chờ connect_retry_backoff * lần thử giữa các lần.
+    Hết số lần thử thì văng Exception cuối cùng ra ngoài.
     """
-    return pymysql.connect(
-        host=config.MYSQL_HOST,
-        port=config.MYSQL_PORT,
-        user=config.MYSQL_USER,
-        password=config.MYSQL_PASSWORD,
-        db="metadata_tiktok",
-        autocommit=True,
-        cursorclass=pymysql.cursors.DictCursor,
-        connect_timeout=10 # Thêm timeout để không treo quá lâu nếu mạng lag
-    )
+    retries = max(1, config.MYSQL_CONNECT_RETRIES)
+    for attempt in range(1, retries + 1):
+        try:
+            return pymysql.connect(
+                host=config.MYSQL_HOST,
+                port=config.MYSQL_PORT,
+                user=config.MYSQL_USER,
+                password=config.MYSQL_PASSWORD,
+                db="metadata_tiktok",
+                autocommit=True,
+                cursorclass=pymysql.cursors.DictCursor,
+                connect_timeout=10 # Thêm timeout để không treo quá lâu nếu mạng lag
+            )
+        except pymysql.err.OperationalError as e:
+            if attempt == retries:
+                raise
+            wait = config.MYSQL_CONNECT_RETRY_BACKOFF * attempt
+            logger.warning("DB connect failed (%d/%d): %s. Retrying in %ss", attempt, retries, e, wait)
+            time.sleep(wait)
+
+class ConnectionPool:
+    """
+    Pool kết nối dùng chung cho cả process.
+    - Tối đa `size` kết nối; hết kết nối rảnh thì chờ (tính vào metric waits).
+      Thread đang chờ được đánh thức cả khi có kết nối trả về lẫn khi một slot được giải phóng
+      (kết nối hỏng bị bỏ, reconnect lỗi, close_all) để tự mở kết nối mới.
+    - Ping kết nối khi checkout, kết nối chết sẽ được mở lại (metric reconnects).
+    """
+
+    def __init__(self, size=5, timeout=30):
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle = []  # LIFO: kết nối vừa trả về được dùng lại trước
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._created = 0
+        self.metrics = {"checkouts": 0, "waits": 0, "reconnects": 0, "created": 0}
+
+    def _inc(self, key):
+        with self._lock:
+            self.metrics[key] += 1
+
+    def _new_conn(self):
+        conn = get_db_conn()
+        self._inc("created")
+        return conn
+
+    def _free_slot(self):
+        """Bỏ một kết nối khỏi pool và đánh thức một thread đang chờ để nó mở kết nối mới."""
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _checkout(self):
+        """(kết nối rảnh, False) hoặc (None, True) khi được giữ một slot để mở kết nối mới."""
+        deadline = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop(), False
+                if self._created < self.size:
+                    self._created += 1
+                    return None, True
+                if deadline is None:
+                    self.metrics["waits"] += 1
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No DB connection available after {self.timeout}s (pool size {self.size})")
+                self._cond.wait(remaining)
+
+    def acquire(self):
+        conn, create = self._checkout()
+        if create:
+            try:
+                conn = self._new_conn()
+            except Exception:
+                self._free_slot()
+                raise
+
+        # Health-check khi checkout
+        try:
+            conn.ping(reconnect=False)
+        except Exception as e:
+            logger.warning("Pooled DB connection is dead (%s), reconnecting...", e)
+            self._inc("reconnects")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            try:
+                conn = self._new_conn()
+            except Exception:
+                self._free_slot()
+                raise
+        self._inc("checkouts")
+        return conn
+
+    def release(self, conn, broken=False):
+        if broken or not conn.open:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._free_slot()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, size=self.size, open=self._created, idle=len(self._idle))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Pool dùng chung của process (khởi tạo lười ở lần gọi đầu tiên)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(config.MYSQL_POOL_SIZE, config.MYSQL_POOL_TIMEOUT)
+    return _pool
+
+@contextmanager
+def connection():
+    """
+    Mượn một kết nối từ pool:
+        with db.connection() as conn:
+            ...
+    Lỗi trong block sẽ rollback (nếu đang mở transaction) rồi trả kết nối về pool.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except pymysql.err.OperationalError:
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        pool.release(conn, broken=broken)
+
+def pool_stats():
+    """Metric của pool: checkouts, waits, reconnects, created, open, idle."""
+    return get_pool().stats()
 
 def save_config_to_db():
     """
     Lưu config. KHÔNG dùng try-except ở đây để lỗi được truyền ra ngoài.
     """
-    conn = get_db_conn() # Nếu lỗi kết nối, nó dừng ngay tại đây -> nhảy về main_job -> gửi mail
-    try:
+    with connection() as conn: # Nếu lỗi kết nối, nó dừng ngay tại đây -> nhảy về main_job -> gửi mail
         with conn.cursor() as cur:
             check_sql = "SELECT id_config FROM config_log WHERE source_name=%s AND source_url=%s"
             cur.execute(check_sql, (config.SOURCE_NAME, config.SOURCE_URL))
@@ -35,26 +195,89 @@ def save_config_to_db():
                 VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
             """
             cur.execute(insert_sql, (
-                config.SOURCE_NAME, config.SOURCE_URL, config.APIFY_ACTOR, 
-                config.STORAGE_PATH, config.FILE_PATTERN, config.DATE_FORMAT, 
+                config.SOURCE_NAME, config.SOURCE_URL, config.APIFY_ACTOR,
+                config.STORAGE_PATH, config.FILE_PATTERN, config.DATE_FORMAT,
                 config.SCHEDULE_CRON, True
             ))
             return cur.lastrowid
-    finally:
-        conn.close()
 
 def log_to_db(status, message, total_record=0, error_message=None, id_config=None):
     """
     Ghi log. Hàm này giữ try-except để nếu ghi log thất bại thì không làm crash luồng gửi mail.
     """
     try:
-        conn = get_db_conn()
-        with conn.cursor() as cur:
-            sql = """
-                INSERT INTO control_log (id_config, file_name, status, extract_time, total_record, error_message)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cur.execute(sql, (id_config, message, status, datetime.now(), total_record, error_message))
-        conn.close()
+        with connection() as conn:
+            with conn.cursor() as cur:
+                sql = """
+                    INSERT INTO control_log (id_config, file_name, status, extract_time, total_record, error_message)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """
+                cur.execute(sql, (id_config, message, status, datetime.now(), total_record, error_message))
+    except Exception as e:
+        logger.error("⚠️ Failed to write to DB control_log: %s", e)
+
+def log_stage_metrics(run_name, stages, id_config=None):
+    """
+    Ghi số đo từng bước của một lần chạy (metrics.StageMetric) vào stage_metrics.
+    Giống log_to_db: lỗi chỉ được log lại.
+    """
+    rows = [(id_config, run_name, m.stage, m.status, m.started_at, m.wall_seconds,
+             m.items, m.items_per_sec, m.bytes, m.peak_rss) for m in stages]
+    if not rows:
+        return
+    try:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany("""
+                    INSERT INTO stage_metrics (id_config, run_name, stage, status, started_at,
+                        wall_seconds, items, items_per_sec, bytes_written, peak_rss_bytes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, rows)
     except Exception as e:
-        logger.error("⚠️ Failed to write to DB control_log: %s", e)
\ No newline at end of file
+        logger.error("⚠️ Failed to write to DB stage_metrics: %s", e)
+
+def get_file_states():
+    """
+    Trạng thái các file đã từng load: {file_name: row}.
+    Một query duy nhất -> loader tra cứu O(1) cho từng file.
+    """
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT file_name, file_size, file_mtime, content_hash, status FROM file_log")
+            return {row["file_name"]: row for row in cur.fetchall()}
+
+def mark_file_state(cur, file_name, status, file_size=None, file_mtime=None,
+                    content_hash=None, total_record=None, id_config=None):
+    """
+    Upsert trạng thái một file vào file_log bằng cursor của caller,
+    để có thể nằm chung transaction với phần insert staging.
+    """
+    sql = """
+        INSERT INTO metadata_tiktok.file_log
+            (id_config, file_name, file_size, file_mtime, content_hash, status, total_record, loaded_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            id_config = COALESCE(VALUES(id_config), id_config),
+            file_size = COALESCE(VALUES(file_size), file_size),
+            file_mtime = COALESCE(VALUES(file_mtime), file_mtime),
+            content_hash = COALESCE(VALUES(content_hash), content_hash),
+            status = VALUES(status),
+            total_record = COALESCE(VALUES(total_record), total_record),
+            loaded_at = COALESCE(VALUES(loaded_at), loaded_at)
+    """
+    loaded_at = datetime.now() if status == "LOADED" else None
+    cur.execute(sql, (id_config, file_name, file_size, file_mtime, content_hash,
+                      status, total_record, loaded_at))
+
+def rename_file_state(old_name, new_name, file_size, file_mtime, content_hash):
+    """Chuyển trạng thái file_log sang tên file mới (sau khi convert định dạng lưu trữ)."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE metadata_tiktok.file_log
+                SET file_name = %s, file_size = %s, file_mtime = %s, content_hash = %s
+                WHERE file_name = %s
+                """,
+                (new_name, file_size, file_mtime, content_hash, old_name),
+            )
@@ -0,0 +1,158 @@
+# dedup_index.py
+import time
+import zlib
+import struct
+import sqlite3
+import threading
+from logging_setup import logger
+import storage
+
+NEW = "new"              # Video chưa từng thấy
+UPDATED = "updated"      # Đã thấy, counters thay đổi -> chỉ là snapshot metrics mới
+UNCHANGED = "unchanged"  # Đã thấy, counters y hệt -> bỏ qua
+
+COUNTER_FIELDS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+
+def _video_id(item):
+    try:
+        return int(item.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+def counters_hash(item):
+    """CRC32 của các counters có thể thay đổi giữa các lần crawl."""
+    values = []
+    for field in COUNTER_FIELDS:
+        try:
+            values.append(int(item.get(field)))
+        except (TypeError, ValueError):
+            values.append(-1)
+    return zlib.crc32(struct.pack("<5q", *values))
+
+class DedupIndex:
+    """
+    Index chống trùng giữa các lần crawl, lưu trong file SQLite cạnh storage.
+    Khoá theo video id + hash counters. Bộ nhớ bị chặn bởi page cache của SQLite
+    (cache_kb) và mmap (mmap_mb); dòng không gặp lại quá max_age_days bị xoá bằng evict().
+    """
+
+    def __init__(self, path, max_age_days=30, cache_kb=8192, mmap_mb=64):
+        self.path = path
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_kb)}")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_mb) * 1024 * 1024}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id INTEGER PRIMARY KEY,
+                counters_hash INTEGER NOT NULL,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL,
+                dim_loaded INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_last_seen ON videos(last_seen)")
+        self._conn.commit()
+
+    def _lookup(self, video_ids, column):
+        """{video_id: column} cho các id có trong index (truy vấn IN theo lô 500)."""
+        found = {}
+        ids = list(video_ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT video_id, {column} FROM videos WHERE video_id IN ({placeholders})", chunk
+            )
+            found.update(rows)
+        return found
+
+    def classify(self, items):
+        """Trạng thái NEW / UPDATED / UNCHANGED cho từng item (cùng thứ tự)."""
+        ids = [_video_id(item) for item in items]
+        with self._lock:
+            known = self._lookup({i for i in ids if i is not None}, "counters_hash")
+        statuses = []
+        for item, vid in zip(items, ids):
+            if vid is None or vid not in known:
+                statuses.append(NEW)
+            elif known[vid] == counters_hash(item):
+                statuses.append(UNCHANGED)
+            else:
+                statuses.append(UPDATED)
+        return statuses
+
+    def filter_new(self, items):
+        """Bỏ item UNCHANGED. Trả về (item giữ lại, số item bị bỏ)."""
+        statuses = self.classify(items)
+        kept = [item for item, status in zip(items, statuses) if status != UNCHANGED]
+        return kept, len(items) - len(kept)
+
+    def record(self, items, now=None):
+        """Ghi nhận các item đã được lưu (cập nhật hash counters và last_seen)."""
+        now = int(now or time.time())
+        rows = [(vid, counters_hash(item), now, now)
+                for item in items for vid in (_video_id(item),) if vid is not None]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO videos (video_id, counters_hash, first_seen, last_seen)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    counters_hash = excluded.counters_hash,
+                    last_seen = excluded.last_seen
+            """, rows)
+            self._conn.commit()
+
+    def record_file(self, fpath, batch_size=1000, now=None):
+        """
+        Ghi nhận mọi item của một file storage đã publish (gọi sau StorageWriter.close()).
+        Đọc streaming, chỉ lấy id + counters. Trả về số item đã ghi nhận.
+        """
+        total = 0
+        batch = []
+        for item in storage.iter_items(fpath, fields=["id", *COUNTER_FIELDS]):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.record(batch, now)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.record(batch, now)
+            total += len(batch)
+        return total
+
+    def unloaded(self, video_ids):
+        """Các video id chưa có dòng dim_videos trong warehouse (theo index)."""
+        video_ids = set(video_ids)
+        with self._lock:
+            loaded = self._lookup(video_ids, "dim_loaded")
+        return {vid for vid in video_ids if not loaded.get(vid)}
+
+    def mark_loaded(self, video_ids, now=None):
+        """Đánh dấu video đã có dòng dim_videos (video chưa có trong index sẽ được thêm)."""
+        now = int(now or time.time())
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO videos (video_id, counters_hash, first_seen, last_seen, dim_loaded)
+                VALUES (?, 0, ?, ?, 1)
+                ON CONFLICT(video_id) DO UPDATE SET dim_loaded = 1
+            """, [(vid, now, now) for vid in video_ids])
+            self._conn.commit()
+
+    def evict(self, max_age_days=None):
+        """Xoá video không gặp lại quá max_age_days. Trả về số dòng đã xoá."""
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        cutoff = int(time.time() - max_age_days * 86400)
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM videos WHERE last_seen < ?", (cutoff,))
+            self._conn.commit()
+        if cur.rowcount:
+            logger.info("Dedup index evicted %d videos older than %d days", cur.rowcount, max_age_days)
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
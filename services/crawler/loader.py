@@ -0,0 +1,193 @@
+# loader.py
+import os
+import glob
+import time
+import hashlib
+import config
+from logging_setup import logger
+import db
+import storage
+import codec
+
+STAGING_TABLE = "staging_tiktok.staging_raw"
+
+def discover_files(storage_path=None, pattern=None):
+    """
+    Danh sách file trong STORAGE_PATH khớp FILE_PATTERN, chỉ giữ định dạng storage đã biết
+    (bỏ file .part đang ghi dở, file checkpoint...).
+    """
+    storage_path = storage_path or config.STORAGE_PATH
+    pattern = pattern or config.FILE_PATTERN
+    files = glob.glob(os.path.join(storage_path, pattern))
+    return sorted(f for f in files if os.path.isfile(f) and storage.detect_format(f) is not None)
+
+def insert_batches(cur, rows, batch_size, table=STAGING_TABLE):
+    """
+    Insert các tuple (device_id, apify_run_id, fetched_at, raw_json, file_path) theo lô.
+    pymysql.executemany gộp mỗi lô thành câu INSERT ... VALUES (...),(...) nhiều dòng.
+    Trả về tổng số dòng đã insert.
+    """
+    sql = f"""
+        INSERT INTO {table} (device_id, apify_run_id, fetched_at, raw_json, file_path)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cur.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        cur.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+def iter_staging_rows(fpath):
+    """Sinh các dòng staging cho một file storage (đọc streaming từng item)."""
+    device_id, run_id, fetched_at = storage.parse_filename(fpath)
+    device_id = device_id or config.DEVICE_ID
+    fetched_at = fetched_at or time.strftime("%Y-%m-%d %H:%M:%S")
+    for raw in storage.iter_raw_items(fpath):
+        yield (device_id, run_id, fetched_at, raw, fpath)
+
+def file_hash(fpath, chunk_size=1 << 20):
+    """SHA-256 nội dung file (đọc theo chunk)."""
+    h = hashlib.sha256()
+    with open(fpath, "rb") as fr:
+        for chunk in iter(lambda: fr.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _item_id(raw):
+    item = codec.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    value = item.get("id") if isinstance(item, dict) else None
+    return None if value is None else str(value)
+
+def processed_item_ids(cur, fpath):
+    """id item (chuỗi) của các dòng staging đã processed (đã có fact) của file."""
+    cur.execute(f"SELECT raw_json FROM {STAGING_TABLE} WHERE file_path = %s AND processed = TRUE", (fpath,))
+    ids = (_item_id(row["raw_json"] if isinstance(row, dict) else row[0]) for row in cur.fetchall())
+    return {i for i in ids if i is not None}
+
+class _SkipProcessed:
+    """Lọc (streaming) các dòng staging có item id nằm trong `done`, đếm số dòng bị bỏ."""
+
+    def __init__(self, rows, done):
+        self.rows = rows
+        self.done = done
+        self.skipped = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            if _item_id(row[3]) in self.done:
+                self.skipped += 1
+            else:
+                yield row
+
+def load_file(conn, fpath, batch_size=None, file_state=None, id_config=None, replace=False):
+    """
+    Load một file vào staging_raw trong một transaction (file vào đủ hoặc không vào dòng nào).
+    - file_state: dict (file_size, file_mtime, content_hash) -> file_log được đánh dấu LOADED
+      trong cùng transaction, nên crash giữa chừng không bao giờ để lại file "LOADED" dở dang.
+    - replace: load lại file PENDING/đổi nội dung: xoá các dòng chưa processed của lần load trước
+      và bỏ qua item đã processed (fact của chúng đã có trong warehouse, nạp lại sẽ bị trùng).
+    Trả về số dòng đã insert.
+    """
+    batch_size = batch_size or config.LOADER_BATCH_SIZE
+    conn.begin()
+    try:
+        with conn.cursor() as cur:
+            rows = iter_staging_rows(fpath)
+            skipped, done = 0, set()
+            if replace:
+                cur.execute(f"DELETE FROM {STAGING_TABLE} WHERE file_path = %s AND processed = FALSE", (fpath,))
+                done = processed_item_ids(cur, fpath)
+                if done:
+                    rows = _SkipProcessed(rows, done)
+            total = insert_batches(cur, rows, batch_size)
+            if done:
+                skipped = rows.skipped
+                logger.info("Reloaded %s: skipped %d already processed items", os.path.basename(fpath), skipped)
+            if file_state is not None:
+                db.mark_file_state(cur, os.path.basename(fpath), "LOADED", total_record=total + skipped,
+                                   id_config=id_config, **file_state)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return total
+
+def plan_incremental(files, states):
+    """
+    Chọn file cần load dựa trên file_log: file đã LOADED và size/mtime không đổi bị bỏ qua
+    (tra dict O(1), không đọc file). Chỉ hash lại khi size/mtime thay đổi.
+    Trả về list (fpath, file_state, replace).
+    """
+    todo = []
+    for fpath in files:
+        name = os.path.basename(fpath)
+        st = os.stat(fpath)
+        prev = states.get(name)
+        if prev and prev["status"] == "LOADED" \
+                and prev["file_size"] == st.st_size and prev["file_mtime"] == st.st_mtime:
+            continue
+        file_state = {"file_size": st.st_size, "file_mtime": st.st_mtime, "content_hash": file_hash(fpath)}
+        if prev and prev["status"] == "LOADED" and prev["content_hash"] == file_state["content_hash"]:
+            # Chỉ bị touch (mtime đổi), nội dung như cũ -> cập nhật watermark, không load lại
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    db.mark_file_state(cur, name, "LOADED", **file_state)
+            continue
+        todo.append((fpath, file_state, prev is not None))
+    return todo
+
+def run_loader(files=None, batch_size=None, id_config=None, incremental=True):
+    """
+    Load các file storage vào staging_tiktok.staging_raw.
+    incremental=True: chỉ load file mới/đổi nội dung theo file_log (chạy lại sau crash
+    chỉ tốn thời gian cho file mới). Mỗi file ghi một dòng control_log (LOADED / LOAD_FAILED).
+    Trả về tổng số dòng đã load.
+    """
+    files = discover_files() if files is None else files
+    if incremental:
+        plan = plan_incremental(files, db.get_file_states())
+        logger.info("Staging load: %d/%d files new or changed", len(plan), len(files))
+    else:
+        plan = [(fpath, None, False) for fpath in files]
+        logger.info("Staging load: %d files", len(plan))
+    total = 0
+    for fpath, file_state, replace in plan:
+        fname = os.path.basename(fpath)
+        start = time.time()
+        try:
+            if file_state is not None:
+                with db.connection() as conn:
+                    with conn.cursor() as cur:
+                        db.mark_file_state(cur, fname, "PENDING", id_config=id_config, **file_state)
+            with db.connection() as conn:
+                rows = load_file(conn, fpath, batch_size, file_state=file_state,
+                                 id_config=id_config, replace=replace)
+        except Exception as e:
+            logger.exception("Staging load failed for %s", fname)
+            if file_state is not None:
+                try:
+                    with db.connection() as conn:
+                        with conn.cursor() as cur:
+                            db.mark_file_state(cur, fname, "FAILED", id_config=id_config)
+                except Exception:
+                    logger.error("Could not mark %s as FAILED in file_log", fname)
+            db.log_to_db("LOAD_FAILED", fname, total_record=0, error_message=str(e), id_config=id_config)
+            continue
+        total += rows
+        elapsed = time.time() - start
+        logger.info("Loaded %s: %d rows in %.2fs (%.0f rows/s)", fname, rows, elapsed, rows / elapsed if elapsed else 0)
+        db.log_to_db("LOADED", fname, total_record=rows, id_config=id_config)
+    return total
+
+if __name__ == "__main__":
+    import sys
+    logger.info(">>> STAGING LOAD STARTED <<<")
+    n = run_loader(incremental="--full" not in sys.argv)
+    logger.info(">>> STAGING LOAD FINISHED: %d rows <<<", n)
@@ -1,16 +1,27 @@
 import os
-import json
 from datetime import datetime
 import config
 from logging_setup import logger
 import db
-import apify_service
+import crawl_fanout
+import dedup_index
+import crawl_checkpoint
+import coordinator
+import storage
 import notification
+import metrics
 
 def job():
-    """Pipeline chính: Lỗi ở bất kỳ đâu cũng sẽ gửi mail."""
+    """
+    Pipeline chính: Lỗi ở bất kỳ đâu cũng sẽ gửi mail.
+    Trả về True nếu đã crawl và lưu file thành công (scheduler dùng để kích hoạt bước load).
+    """
     id_config = None 
     current_step = "Init"
+    index = None
+    checkpoint = None
+    lease = None
+    run = metrics.RunMetrics()
 
     try:
         # --- BƯỚC 1: KẾT NỐI DB & CONFIG ---
@@ -18,50 +29,97 @@ def job():
         logger.info("Job started. Connecting to DB...")
         
         # Nếu DB chết, hàm này sẽ văng lỗi ngay -> Nhảy xuống except -> Gửi mail
-        id_config = db.save_config_to_db() 
+        with run.stage(current_step):
+            id_config = db.save_config_to_db() 
         
-        # --- BƯỚC 2: KẾT NỐI APIFY ---
+        # --- BƯỚC 2: KẾT NỐI APIFY (fan-out theo shard hashtag) ---
         current_step = "Apify Crawl"
         logger.info("Connecting to Apify...")
         
-        run_input = {"hashtags": ["fyp"], "resultsPerPage": 3}
+        hashtags = config.CRAWL_HASHTAGS
+        if config.COORDINATOR_ENABLED:
+            # Nhiều device: chỉ crawl các hashtag nhận được lease trong crawl_work_unit
+            lease = coordinator.claim_hashtags().start()
+            hashtags = lease.hashtags
+            if not hashtags:
+                logger.info("No work units available for device %s, skipping this run.", config.DEVICE_ID)
+                return False
         
-        # Nếu Apify sai token/mạng lỗi, hàm này văng lỗi -> Nhảy xuống except -> Gửi mail
-        run_id, dataset_id, items = apify_service.run_actor(
-            config.APIFY_ACTOR, 
-            config.APIFY_TOKEN, 
-            run_input
-        )
-        logger.info("Apify run success: %s (%d items)", run_id, len(items))
-
-        # --- BƯỚC 3: LƯU FILE ---
-        current_step = "Save File"
         ts = datetime.now().strftime("%d%m%YT%H%M%SZ")
-        fname = f"{config.DEVICE_ID}_run_{ts}.json"
-        fpath = os.path.join(config.STORAGE_PATH, fname)
+        fname = storage.build_filename(config.DEVICE_ID, ts, config.STORAGE_FORMAT)
+        if config.CRAWL_CHECKPOINT_ENABLED:
+            # Lần chạy trước bị gián đoạn -> gắn lại vào các actor run cũ, ghi tiếp vào file cũ
+            checkpoint, writer, _ = crawl_checkpoint.start_or_resume(
+                config.CRAWL_CHECKPOINT_PATH, config.STORAGE_PATH, fname,
+                config.STORAGE_FORMAT, hashtags, config.CRAWL_CHECKPOINT_MAX_AGE_HOURS)
+            fname = checkpoint.file_name
+        else:
+            writer = storage.StorageWriter(os.path.join(config.STORAGE_PATH, fname), config.STORAGE_FORMAT)
+        fpath = writer.fpath
+        if config.DEDUP_ENABLED:
+            index = dedup_index.DedupIndex(config.DEDUP_INDEX_PATH, config.DEDUP_MAX_AGE_DAYS)
         
-        with open(fpath, "w", encoding="utf-8") as fw:
-            json.dump(items, fw, ensure_ascii=False)
+        # Nếu Apify sai token/mạng lỗi (tất cả shard lỗi) -> Nhảy xuống except -> Gửi mail
+        with run.stage(current_step) as m:
+            try:
+                fanout = crawl_fanout.crawl_hashtags(
+                    config.APIFY_ACTOR,
+                    config.APIFY_TOKEN,
+                    hashtags,
+                    writer,
+                    results_per_page=config.CRAWL_RESULTS_PER_PAGE,
+                    shard_size=config.CRAWL_SHARD_SIZE,
+                    max_concurrency=config.CRAWL_MAX_CONCURRENCY,
+                    page_size=config.APIFY_PAGE_SIZE,
+                    max_items=config.MAX_ITEMS_PER_RUN,
+                    dedup_index=index,
+                    checkpoint=checkpoint
+                )
+            except Exception:
+                writer.abort()
+                raise
+            finally:
+                m.items, m.bytes = writer.count, writer.bytes_written
+        logger.info("Apify crawl success: %d runs, %d items", len(fanout.run_ids), writer.count)
+
+        # --- BƯỚC 3: LƯU FILE (các trang đã được stream xuống đĩa) ---
+        current_step = "Save File"
+        with run.stage(current_step) as m:
+            writer.close()
+            total_items = writer.count
+            if checkpoint is not None:
+                checkpoint.remove()
+            if index is not None:
+                # Chỉ ghi nhận vào dedup index khi file đã publish (xem crawl_fanout.crawl_hashtags)
+                index.record_file(fpath)
+                index.evict()
+            m.bytes = os.path.getsize(fpath)
+        if lease is not None:
+            # Hashtag của shard lỗi được trả về (FAILED) khi lease.close() để device khác nhận lại
+            failed = {h for shard, _ in fanout.failed_shards for h in shard}
+            lease.finish([h for h in hashtags if h not in failed], "SUCCESS")
 
         # --- BƯỚC 4: THÔNG BÁO THÀNH CÔNG ---
         current_step = "Success Report"
         
         # Ghi log DB (Nếu lỗi ở đây thì chỉ in log, không gửi mail báo lỗi vì job đã xong rồi)
-        db.log_to_db("SUCCESS", fname, total_record=len(items), id_config=id_config)
-        
-        notification.send_notification(
-            "SUCCESS", 
-            f"Crawl thành công {len(items)} items.", 
-            f"File: {fname}\nRun ID: {run_id}"
-        )
+        with run.stage(current_step):
+            db.log_to_db("SUCCESS", fname, total_record=total_items, id_config=id_config)
+            
+            notification.send_notification(
+                "SUCCESS", 
+                f"Crawl thành công {total_items} items.", 
+                f"File: {fname}\n{fanout.summary()}\n{run.summary()}"
+            )
         logger.info("Job finished successfully.")
+        return True
 
     except Exception as e:
         logger.exception("Job Failed at step: %s", current_step)
         
         # ===> ƯU TIÊN 1: GỬI MAIL BÁO LỖI NGAY LẬP TỨC <===
         error_msg = f"Lỗi nghiêm trọng tại bước: {current_step}"
-        detail = f"Lỗi: {str(e)}\nConfig ID: {id_config}"
+        detail = f"Lỗi: {str(e)}\nConfig ID: {id_config}\n{run.summary()}"
         
         try:
             notification.send_notification("FAILED", error_msg, detail)
@@ -72,4 +130,13 @@ def job():
         try:
             db.log_to_db("FAILED", current_step, total_record=0, error_message=str(e), id_config=id_config)
         except:
-            logger.error("Cũng không thể ghi log lỗi vào DB (có thể do DB sập).")
\ No newline at end of file
+            logger.error("Cũng không thể ghi log lỗi vào DB (có thể do DB sập).")
+        return False
+
+    finally:
+        if index is not None:
+            index.close()
+        if lease is not None:
+            lease.close()
+        # Số đo từng bước -> stage_metrics (lỗi chỉ log)
+        run.save(id_config)
\ No newline at end of file
@@ -0,0 +1,159 @@
+# metrics.py
+import sys
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging_setup import logger
+import db
+
+try:
+    import resource  # Không có trên Windows
+except ImportError:
+    resource = None
+
+def peak_rss_bytes():
+    """Peak RSS của process tính tới hiện tại (ru_maxrss: KB trên Linux, byte trên macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StageMetric:
+    """Số đo của một bước: wall time, số item, số byte đã ghi, peak RSS khi kết thúc bước."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.status = "RUNNING"
+        self.started_at = datetime.now()
+        self.wall_seconds = 0.0
+        self.items = None
+        self.bytes = None
+        self.peak_rss = None
+
+    @property
+    def items_per_sec(self):
+        if not self.items or self.wall_seconds <= 0:
+            return None
+        return self.items / self.wall_seconds
+
+    def __repr__(self):
+        return (f"StageMetric({self.stage!r}, {self.status}, {self.wall_seconds:.3f}s, "
+                f"items={self.items}, bytes={self.bytes}, peak_rss={self.peak_rss})")
+
+class RunMetrics:
+    """
+    Gom số đo các bước của một lần chạy job.
+        with run.stage("Apify Crawl") as m:
+            ...
+            m.items, m.bytes = writer.count, writer.bytes_written
+    """
+
+    def __init__(self, run_name=None):
+        self.run_name = run_name or datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        metric = StageMetric(name)
+        self.stages.append(metric)
+        start = time.perf_counter()
+        try:
+            yield metric
+            metric.status = "SUCCESS"
+        except BaseException:
+            metric.status = "FAILED"
+            raise
+        finally:
+            metric.wall_seconds = time.perf_counter() - start
+            metric.peak_rss = peak_rss_bytes()
+            REGISTRY.observe(metric)
+            logger.info("Stage %s: %s in %.3fs (items=%s, bytes=%s)",
+                        name, metric.status, metric.wall_seconds, metric.items, metric.bytes)
+
+    def summary(self):
+        return "\n".join(
+            f"{m.stage}: {m.wall_seconds:.2f}s"
+            + (f", {m.items} items ({m.items_per_sec:.1f}/s)" if m.items_per_sec else "")
+            + (f", {m.bytes} bytes" if m.bytes is not None else "")
+            for m in self.stages
+        )
+
+    def save(self, id_config=None):
+        """Ghi số đo vào metadata_tiktok.stage_metrics (lỗi chỉ log, không làm hỏng job)."""
+        db.log_stage_metrics(self.run_name, self.stages, id_config=id_config)
+
+class _Registry:
+    """Giá trị mới nhất theo từng bước, dùng cho endpoint Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}
+        self._runs = {}
+
+    def observe(self, metric):
+        with self._lock:
+            self._last[metric.stage] = metric
+            key = (metric.stage, metric.status)
+            self._runs[key] = self._runs.get(key, 0) + 1
+
+    def render(self):
+        """Text exposition format của Prometheus."""
+        with self._lock:
+            last = list(self._last.values())
+            runs = dict(self._runs)
+        lines = []
+
+        def gauge(name, help_text, getter):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for m in last:
+                value = getter(m)
+                if value is not None:
+                    lines.append(f'{name}{{stage="{m.stage}"}} {value}')
+
+        gauge("crawler_stage_duration_seconds", "Wall time of the last run of the stage.",
+              lambda m: m.wall_seconds)
+        gauge("crawler_stage_items", "Items processed in the last run of the stage.", lambda m: m.items)
+        gauge("crawler_stage_items_per_second", "Throughput of the last run of the stage.",
+              lambda m: m.items_per_sec)
+        gauge("crawler_stage_bytes", "Bytes written in the last run of the stage.", lambda m: m.bytes)
+        gauge("crawler_stage_peak_rss_bytes", "Process peak RSS at the end of the stage.",
+              lambda m: m.peak_rss)
+        gauge("crawler_stage_last_success", "1 if the last run of the stage succeeded.",
+              lambda m: int(m.status == "SUCCESS"))
+        lines.append("# HELP crawler_stage_runs_total Stage runs by status.")
+        lines.append("# TYPE crawler_stage_runs_total counter")
+        for (stage, status), count in sorted(runs.items()):
+            lines.append(f'crawler_stage_runs_total{{stage="{stage}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+REGISTRY = _Registry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def start_http_server(port, host="0.0.0.0"):
+    """Mở endpoint /metrics (Prometheus) trong một daemon thread. port <= 0 -> tắt."""
+    global _server
+    if _server is not None or not port or port <= 0:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics endpoint listening on %s:%d/metrics", host, port)
+    return _server
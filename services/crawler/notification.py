@@ -1,36 +1,31 @@
 # notification.py
+import time
+import queue
+import atexit
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime  # <--- 1. Thêm dòng này
+from datetime import datetime
 import config
 from logging_setup import logger
 
-def send_notification(status, message, detail_info=None):
-    """
-    Gửi email thông báo trạng thái Job (Success/Failed).
-    """
-    if not config.MAIL_SENDER or not config.MAIL_PASSWORD:
-        logger.warning("Email config missing. Skipping email notification.")
-        return
-
-    # 2. Lấy thời gian hiện tại và format theo cấu hình
+def _format_time(now):
+    # Lấy thời gian hiện tại và format theo cấu hình
     try:
-        current_time = datetime.now().strftime(config.DATE_FORMAT)
-    except:
+        return now.strftime(config.DATE_FORMAT)
+    except Exception:
         # Fallback nếu config sai format
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return now.strftime("%Y-%m-%d %H:%M:%S")
 
-    # Xác định màu sắc và tiêu đề
+def _build_section(status, message, detail_info, current_time):
+    # Xác định màu sắc theo trạng thái
     color = "green" if status == "SUCCESS" else "red"
-    subject = f"[{status}] Crawler Report - {config.DEVICE_ID}"
-
-    # Soạn nội dung HTML (Sử dụng biến current_time vừa tạo)
-    body = f"""
+    return f"""
     <h3 style="color: {color};">Báo cáo trạng thái: {status}</h3>
     <ul>
         <li><b>Device ID:</b> {config.DEVICE_ID}</li>
-        <li><b>Time:</b> {current_time}</li> 
+        <li><b>Time:</b> {current_time}</li>
         <li><b>Message:</b> {message}</li>
     </ul>
     <hr>
@@ -38,20 +33,178 @@ def send_notification(status, message, detail_info=None):
     <pre>{detail_info if detail_info else 'No details provided.'}</pre>
     """
 
-    msg = MIMEMultipart()
-    msg['From'] = config.MAIL_SENDER
-    msg['To'] = config.MAIL_RECEIVER
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'html'))
+class NotificationDispatcher:
+    """
+    Gửi email từ một worker thread nền để job không bị chặn bởi SMTP.
+    - Thông báo được đưa vào hàng đợi; các thông báo đến trong cùng digest_window
+      giây được gộp thành một email digest.
+    - Kết nối SMTP (STARTTLS + login) được giữ lại và dùng lại giữa các lần gửi,
+      tự đóng khi rảnh quá idle_timeout giây.
+    - Gửi lỗi thì mở kết nối mới và thử lại (tổng cộng send_attempts lần) trước khi bỏ email;
+      số thông báo bị bỏ được đếm trong `failed` và flush() trả về False.
+    """
 
-    # Gửi mail
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(config.MAIL_SENDER, config.MAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(config.MAIL_SENDER, config.MAIL_RECEIVER, text)
-        server.quit()
-        logger.info(f"Email notification ({status}) sent successfully.")
-    except Exception as e:
-        logger.error("Failed to send email notification: %s", e)
\ No newline at end of file
+    def __init__(self, host, port, use_tls=True, digest_window=5.0, idle_timeout=60.0, send_attempts=2):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.digest_window = digest_window
+        self.idle_timeout = idle_timeout
+        self.send_attempts = max(1, send_attempts)
+        self._queue = queue.Queue()
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self._failed_flushed = 0
+
+    def submit(self, status, message, detail_info=None):
+        """Đưa một thông báo vào hàng đợi (không chặn)."""
+        self._queue.put((status, message, detail_info, datetime.now()))
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_with_retry(self, batch):
+        for attempt in range(1, self.send_attempts + 1):
+            try:
+                self._send(batch)
+                return
+            except Exception as e:
+                # Kết nối có thể đã bị server đóng: bỏ nó, lần thử sau mở kết nối mới
+                self._disconnect()
+                if attempt < self.send_attempts:
+                    logger.warning("Email notification failed (attempt %d/%d), reconnecting: %s",
+                                   attempt, self.send_attempts, e)
+                else:
+                    self.failed += len(batch)
+                    logger.error("Failed to send email notification after %d attempts, dropping %d report(s): %s",
+                                 self.send_attempts, len(batch), e)
+
+    def _connection(self):
+        """Dùng lại kết nối SMTP nếu còn sống (NOOP), không thì mở kết nối mới."""
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except Exception:
+                pass
+            self._disconnect()
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.use_tls:
+            server.starttls()
+        if config.MAIL_PASSWORD and server.has_extn("auth"):
+            server.login(config.MAIL_SENDER, config.MAIL_PASSWORD)
+        self._server = server
+        return server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _send(self, batch):
+        if len(batch) == 1:
+            status, message, detail_info, ts = batch[0]
+            subject = f"[{status}] Crawler Report - {config.DEVICE_ID}"
+            body = _build_section(status, message, detail_info, _format_time(ts))
+        else:
+            statuses = [b[0] for b in batch]
+            overall = "FAILED" if "FAILED" in statuses else statuses[-1]
+            subject = f"[{overall}] Crawler Digest ({len(batch)} reports) - {config.DEVICE_ID}"
+            body = "".join(_build_section(s, m, d, _format_time(ts)) for s, m, d, ts in batch)
+
+        msg = MIMEMultipart()
+        msg['From'] = config.MAIL_SENDER
+        msg['To'] = config.MAIL_RECEIVER
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html'))
+
+        server = self._connection()
+        server.sendmail(config.MAIL_SENDER, config.MAIL_RECEIVER, msg.as_string())
+        self.sent += 1
+        logger.info("Email notification %s sent successfully (%d report(s)).", subject, len(batch))
+
+    def flush(self, timeout=30.0):
+        """
+        Chờ hàng đợi gửi hết (tối đa timeout giây). Trả về True nếu đã gửi hết và không có
+        thông báo nào bị bỏ vì lỗi gửi kể từ lần flush() trước.
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                logger.warning("Notification flush timed out with %d pending.", self._queue.unfinished_tasks)
+                return False
+            time.sleep(0.05)
+        failed, self._failed_flushed = self.failed - self._failed_flushed, self.failed
+        if failed:
+            logger.warning("Notification flush: %d report(s) could not be sent.", failed)
+            return False
+        return True
+
+    def close(self, timeout=30.0):
+        self.flush(timeout)
+        self._disconnect()
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    """Dispatcher dùng chung của process (khởi tạo lười)."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher(
+                    config.MAIL_SMTP_HOST, config.MAIL_SMTP_PORT,
+                    use_tls=config.MAIL_USE_TLS, digest_window=config.MAIL_DIGEST_WINDOW,
+                )
+                atexit.register(_dispatcher.close)
+    return _dispatcher
+
+def send_notification(status, message, detail_info=None):
+    """
+    Gửi email thông báo trạng thái Job (Success/Failed).
+    Chỉ đưa vào hàng đợi; email được gửi nền bởi NotificationDispatcher.
+    """
+    if not config.MAIL_SENDER or not config.MAIL_RECEIVER:
+        logger.warning("Email config missing. Skipping email notification.")
+        return
+    get_dispatcher().submit(status, message, detail_info)
+
+def flush(timeout=30.0):
+    """Chờ các email đang xếp hàng được gửi xong. False nếu hết thời gian hoặc có email gửi lỗi."""
+    if _dispatcher is not None:
+        return _dispatcher.flush(timeout)
+    return True
@@ -0,0 +1,303 @@
+# storage.py
+import io
+import os
+import re
+import gzip
+import json
+from datetime import datetime
+from logging_setup import logger
+import codec
+
+try:
+    import zstandard
+except ImportError:  # zstd là tuỳ chọn
+    zstandard = None
+
+# Định dạng file lưu trữ -> phần mở rộng
+FORMAT_EXTENSIONS = {
+    "json": ".json",              # JSON array (tương thích với các file cũ trong storage/)
+    "ndjson": ".ndjson",          # Mỗi dòng một item
+    "ndjson.gz": ".ndjson.gz",    # NDJSON nén gzip (mỗi trang một gzip member)
+    "ndjson.zst": ".ndjson.zst",  # NDJSON nén zstd (mỗi trang một frame), cần package zstandard
+}
+
+# File JSON array nhỏ hơn mức này được iter_items decode một lần cả file (nhanh hơn tách từng
+# phần tử bằng JSONDecoder.raw_decode); file lớn hơn đọc streaming, RAM chỉ giữ một item
+WHOLE_FILE_MAX_BYTES = 1 << 20
+
+def _check_format(fmt):
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported storage format: {fmt}")
+    if fmt == "ndjson.zst" and zstandard is None:
+        raise ValueError("Storage format ndjson.zst requires the 'zstandard' package")
+
+def build_filename(device_id, ts, fmt="json"):
+    """Tên file theo quy ước <device>_run_<ts><ext>."""
+    _check_format(fmt)
+    return f"{device_id}_run_{ts}{FORMAT_EXTENSIONS[fmt]}"
+
+def detect_format(fpath):
+    """Định dạng của file theo phần mở rộng (None nếu không phải file storage)."""
+    # Ưu tiên phần mở rộng dài (.ndjson.gz trước .json)
+    for fmt, ext in sorted(FORMAT_EXTENSIONS.items(), key=lambda kv: -len(kv[1])):
+        if fpath.endswith(ext):
+            return fmt
+    return None
+
+def split_format(fpath):
+    """Tách (đường dẫn không có phần mở rộng, định dạng)."""
+    fmt = detect_format(fpath)
+    if fmt is None:
+        return fpath, None
+    return fpath[:-len(FORMAT_EXTENSIONS[fmt])], fmt
+
+# <device>_run_[<apify_run_id>_]<ts>.<ext>
+_FILENAME_RE = re.compile(r"^(?P<device>.+?)_run_(?:(?P<run_id>[A-Za-z0-9]+)_)?(?P<ts>\d{8}T\d{6})Z")
+
+def parse_filename(fname):
+    """
+    Tách (device_id, apify_run_id, fetched_at) từ tên file.
+    File cũ có dạng <device>_run_<runId>_<YYYYmmddTHHMMSS>Z, file mới <device>_run_<ddmmYYYYTHHMMSS>Z.
+    Trả về None cho phần không xác định được.
+    """
+    m = _FILENAME_RE.match(os.path.basename(fname))
+    if not m:
+        return None, None, None
+    formats = ("%Y%m%dT%H%M%S", "%d%m%YT%H%M%S")
+    if not m.group("run_id"):
+        formats = formats[::-1]
+    fetched_at = None
+    for fmt in formats:
+        try:
+            fetched_at = datetime.strptime(m.group("ts"), fmt)
+            break
+        except ValueError:
+            continue
+    return m.group("device"), m.group("run_id"), fetched_at
+
+def _iter_json_array(fr, chunk_size=1 << 20, decoded=False):
+    """
+    Đọc JSON array theo từng chunk, yield text JSON gốc của từng phần tử
+    (không load cả file vào RAM, không serialize lại). decoded=True: yield object đã parse.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = fr.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Storage file is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = fr.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj if decoded else buf[pos:end]
+        pos = end
+
+def _open_text(fpath, fmt):
+    """Mở file storage ở chế độ text, giải nén streaming nếu cần."""
+    if fmt == "ndjson.gz":
+        return gzip.open(fpath, "rt", encoding="utf-8")
+    if fmt == "ndjson.zst":
+        _check_format(fmt)
+        raw = open(fpath, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(fpath, "r", encoding="utf-8")
+
+def iter_raw_items(fpath):
+    """Yield text JSON của từng item trong file storage (mọi định dạng trong FORMAT_EXTENSIONS)."""
+    fmt = detect_format(fpath) or "json"
+    with _open_text(fpath, fmt) as fr:
+        if fmt == "json":
+            yield from _iter_json_array(fr)
+        else:
+            for line in fr:
+                line = line.strip()
+                if line:
+                    yield line
+
+def _project(item, fields):
+    """Chỉ giữ các field cần dùng; hỗ trợ đường dẫn lồng dạng "authorMeta.id"."""
+    out = {}
+    for field in fields:
+        value = item
+        for key in field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+            if value is None:
+                break
+        out[field] = value
+    return out
+
+def _iter_decoded(fpath):
+    """
+    Yield item đã parse. JSON array <= WHOLE_FILE_MAX_BYTES: decode một lần bằng codec;
+    file lớn hơn và NDJSON: từng phần tử một (streaming).
+    """
+    fmt = detect_format(fpath) or "json"
+    if fmt != "json":
+        for raw in iter_raw_items(fpath):
+            yield codec.loads(raw)
+        return
+    if os.path.getsize(fpath) <= WHOLE_FILE_MAX_BYTES:
+        with open(fpath, "rb") as fr:
+            items = codec.loads(fr.read())
+        if not isinstance(items, list):
+            raise ValueError("Storage file is not a JSON array")
+        items.reverse()
+        while items:
+            yield items.pop()  # bỏ tham chiếu ngay để item đã dùng được giải phóng
+        return
+    with _open_text(fpath, fmt) as fr:
+        yield from _iter_json_array(fr, decoded=True)
+
+def iter_items(fpath, fields=None):
+    """
+    Yield từng item (dict) trong file storage.
+    fields: list field cần lấy (vd ["id", "playCount", "authorMeta.id"]) -> mỗi item được chiếu
+    ngay khi parse xong, trước khi đọc item tiếp theo (file lớn chỉ giữ một item đầy đủ trong RAM).
+    """
+    for item in _iter_decoded(fpath):
+        yield item if fields is None else _project(item, fields)
+
+class _Terminated:
+    """Bọc file JSON array đang ghi dở (chưa có "]"): trả thêm "]" khi hết dữ liệu."""
+
+    def __init__(self, fr):
+        self._fr = fr
+        self._closed = False
+
+    def read(self, size=-1):
+        data = self._fr.read(size)
+        if not data and not self._closed:
+            self._closed = True
+            return "]"
+        return data
+
+class StorageWriter:
+    """
+    Ghi item ra đĩa theo từng trang (streaming), không giữ cả dataset trong RAM.
+    Dữ liệu được ghi vào file tạm `<fpath>.part` và chỉ đổi tên thành fpath
+    khi close() thành công, nên loader không bao giờ đọc phải file dở dang.
+    Với định dạng nén, mỗi trang là một gzip member / zstd frame độc lập.
+    resume_at=(count, bytes_written): mở lại `.part` của lần chạy bị gián đoạn, cắt về
+    đúng vị trí đã checkpoint (ranh giới trang) rồi ghi tiếp.
+    """
+
+    def __init__(self, fpath, fmt="json", resume_at=None):
+        _check_format(fmt)
+        self.fpath = fpath
+        self.fmt = fmt
+        self.part_path = fpath + ".part"
+        self.count = 0
+        self.bytes_written = 0
+        self._zstd = zstandard.ZstdCompressor() if fmt == "ndjson.zst" else None
+        if resume_at is None:
+            self._fw = open(self.part_path, "wb")
+            if fmt == "json":
+                self._write(b"[")
+            return
+        count, nbytes = resume_at
+        size = os.path.getsize(self.part_path)
+        if size < nbytes:
+            raise ValueError(f"{self.part_path} is shorter ({size} bytes) than its checkpoint ({nbytes} bytes)")
+        self._fw = open(self.part_path, "r+b")
+        self._fw.truncate(nbytes)
+        self._fw.seek(nbytes)
+        self.count, self.bytes_written = count, nbytes
+        if size > nbytes:
+            logger.info("Truncated %s from %d to %d bytes (pages after checkpoint)", self.part_path, size, nbytes)
+        if fmt == "json" and nbytes == 0:
+            # Checkpoint cũ lưu vị trí (0, 0): ghi lại "[" đã bị cắt mất
+            self._write(b"[")
+
+    @property
+    def position(self):
+        """(số item, số byte) đã ghi xong - dùng để checkpoint."""
+        return self.count, self.bytes_written
+
+    def iter_written(self):
+        """Yield text JSON các item đã ghi trong `.part` (dùng khi resume)."""
+        self._fw.flush()
+        with _open_text(self.part_path, self.fmt) as fr:
+            if self.fmt == "json":
+                yield from _iter_json_array(_Terminated(fr))
+            else:
+                for line in fr:
+                    line = line.strip()
+                    if line:
+                        yield line
+
+    def _write(self, data):
+        self._fw.write(data)
+        self.bytes_written += len(data)
+
+    def _encode_page(self, items):
+        if self.fmt == "json":
+            data = b",".join(codec.dumps(item) for item in items)
+            if self.count and data:
+                data = b"," + data
+            return data
+        return b"".join(codec.dumps(item) + b"\n" for item in items)
+
+    def write_page(self, items):
+        """Ghi một trang item, trả về số item đã ghi."""
+        if not items:
+            return 0
+        data = self._encode_page(items)
+        if self.fmt == "ndjson.gz":
+            data = gzip.compress(data)
+        elif self._zstd is not None:
+            data = self._zstd.compress(data)
+        self._write(data)
+        self.count += len(items)
+        self._fw.flush()
+        return len(items)
+
+    def close(self):
+        """Đóng file và đổi tên .part -> file chính thức."""
+        if self._fw.closed:
+            return
+        if self.fmt == "json":
+            self._write(b"]")
+        self._fw.close()
+        os.replace(self.part_path, self.fpath)
+        logger.info("Saved %d items (%d bytes) to %s", self.count, self.bytes_written, self.fpath)
+
+    def abort(self):
+        """Đóng file nhưng giữ lại .part (không công bố file dở dang)."""
+        if not self._fw.closed:
+            self._fw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,42 @@
+# test_checkpoint_resume.py
+import os
+import json
+import tempfile
+import crawl_checkpoint
+
+# Crawl bị dừng trước trang đầu tiên, chạy lại (resume) rồi close: file JSON phải đọc được
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "crawl_checkpoint.json")
+    hashtags = ["a", "b"]
+
+    checkpoint, writer, resumed = crawl_checkpoint.start_or_resume(path, tmp, "out.json", "json", hashtags)
+    assert not resumed
+    writer._fw.close()  # mô phỏng container chết trước advance() đầu tiên
+
+    checkpoint, writer, resumed = crawl_checkpoint.start_or_resume(path, tmp, "out.json", "json", hashtags)
+    assert resumed, "checkpoint phải được dùng lại"
+    writer.write_page([{"id": "1"}, {"id": "2"}])
+    writer.close()
+
+    with open(os.path.join(tmp, "out.json"), encoding="utf-8") as fr:
+        items = json.load(fr)
+    assert [item["id"] for item in items] == ["1", "2"], items
+    print("✅ Resume trước trang đầu tiên vẫn cho JSON hợp lệ:", items)
+
+# Checkpoint cũ lưu position (0, 0): writer ghi lại "[" khi resume
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "crawl_checkpoint.json")
+    checkpoint, writer, _ = crawl_checkpoint.start_or_resume(path, tmp, "old.json", "json", ["a"])
+    writer._fw.close()
+    checkpoint.data["position"] = [0, 0]
+    checkpoint.save()
+
+    checkpoint, writer, resumed = crawl_checkpoint.start_or_resume(path, tmp, "old.json", "json", ["a"])
+    assert resumed
+    writer.write_page([{"id": "3"}])
+    writer.close()
+
+    with open(os.path.join(tmp, "old.json"), encoding="utf-8") as fr:
+        items = json.load(fr)
+    assert [item["id"] for item in items] == ["3"], items
+    print("✅ Checkpoint cũ (0, 0) vẫn cho JSON hợp lệ:", items)
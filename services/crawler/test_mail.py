@@ -12,7 +12,11 @@ try:
         message="Đây là email kiểm tra kết nối.", 
         detail_info="Nếu bạn nhận được mail này, cấu hình SMTP đã đúng."
     )
-    print("✅ Đã gửi lệnh gửi mail. Hãy kiểm tra inbox/spam.")
+    # Mail được gửi nền -> chờ hàng đợi gửi xong trước khi thoát
+    if notification.flush(timeout=60):
+        print("✅ Đã gửi mail. Hãy kiểm tra inbox/spam.")
+    else:
+        print("❌ Gửi mail lỗi hoặc hết thời gian chờ, xem log để biết lỗi.")
 except Exception as e:
     print("❌ Lỗi gửi mail:")
     print(e)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# transform_stage.py
+"""
+Bước transform của pipeline (staging -> warehouse).
+
+    python transform_stage.py
+    python transform_stage.py --backfill-hashtags   # dựng lại bridge_video_hashtag từ dim_videos
+
+Nâng cấp warehouse có từ trước khi có dim_hashtag / bridge_video_hashtag: sau khi chạy phần
+schema mới (init_db/schema.sql), lần transform đầu tiên thấy bridge rỗng mà dim_videos có dữ liệu
+sẽ tự gọi hashtags.backfill_bridge() một lần. Chạy --backfill-hashtags để làm bước này thủ công
+(vd trước khi bật lại scheduler, hoặc khi bridge chỉ có một phần video).
+"""
+import os
+import sys
+import time
+import config
+from logging_setup import logger
+import db
+import dedup_index
+
+try:
+    import transformer
+except ImportError:
+    # Chạy từ source tree: services/transformer nằm cạnh services/crawler
+    sys.path.insert(0, os.path.dirname(config.BASE_DIR))
+    import transformer
+
+def run_transform(id_config=None):
+    """Transform staging -> warehouse bằng transformer engine, ghi kết quả vào control_log."""
+    start = time.time()
+    index = dedup_index.DedupIndex(config.DEDUP_INDEX_PATH, config.DEDUP_MAX_AGE_DAYS) if config.DEDUP_ENABLED else None
+    try:
+        with db.connection() as conn:
+            try:
+                # Partition tháng tới của fact_video_snapshot (+ bỏ partition hết hạn); lỗi không chặn transform
+                transformer.snapshots.maintain(conn, config.SNAPSHOT_PARTITIONS_AHEAD,
+                                               config.SNAPSHOT_RETENTION_MONTHS, config.SNAPSHOT_ARCHIVE)
+            except Exception as e:
+                logger.warning("Snapshot partition maintenance failed: %s", e)
+            if transformer.hashtags.bridge_missing(conn):
+                # Warehouse cũ: video không đổi sẽ không qua engine nên bridge phải dựng từ dim_videos
+                logger.info("Hashtag bridge is empty, backfilling it from dim_videos")
+                transformer.hashtags.backfill_bridge(conn)
+            stats = transformer.run_transform(conn, chunk_size=config.TRANSFORM_CHUNK_SIZE,
+                                              cache_size=config.TRANSFORM_CACHE_SIZE,
+                                              date_range=(config.DIM_DATE_START_YEAR, config.DIM_DATE_END_YEAR),
+                                              video_index=index,
+                                              refresh_rollups=config.TRANSFORM_REFRESH_ROLLUPS)
+    except Exception as e:
+        logger.exception("Transform failed")
+        db.log_to_db("TRANSFORM_FAILED", "transform", total_record=0, error_message=str(e), id_config=id_config)
+        raise
+    finally:
+        if index is not None:
+            index.close()
+    logger.info("Transform done in %.2fs: %s", time.time() - start, stats)
+    db.log_to_db("TRANSFORMED", "transform", total_record=stats["rows"], id_config=id_config)
+    return stats
+
+def backfill_hashtags():
+    """Dựng lại bridge_video_hashtag cho mọi video trong dim_videos rồi tính lại rollup hashtag."""
+    with db.connection() as conn:
+        videos = transformer.hashtags.backfill_bridge(conn)
+        dates = transformer.rollups.refresh(conn) if config.TRANSFORM_REFRESH_ROLLUPS else 0
+    logger.info("Hashtag backfill done: %d videos, rollups refreshed: %s", videos, dates)
+    return videos
+
+if __name__ == "__main__":
+    if "--backfill-hashtags" in sys.argv:
+        logger.info(">>> HASHTAG BACKFILL STARTED <<<")
+        backfill_hashtags()
+        logger.info(">>> HASHTAG BACKFILL FINISHED <<<")
+    else:
+        logger.info(">>> TRANSFORM STARTED <<<")
+        run_transform()
+        logger.info(">>> TRANSFORM FINISHED <<<")
@@ -0,0 +1,13 @@
+# transformer: nạp staging_tiktok.staging_raw -> warehouse_tiktok bằng Python
+# (song song với transform.sql chạy trong MySQL).
+from .engine import LRUCache, TransformEngine, run_transform
+from .dates import date_key, date_keys, generate_dim_date, populate_dim_date
+from .flatten import ColumnBatch, flatten_items
+from .rollups import refresh as refresh_rollups, top_authors, top_hashtags
+from .models import TikTokItem
+from . import hashtags, models, snapshots
+
+__all__ = ["LRUCache", "TransformEngine", "run_transform",
+           "date_key", "date_keys", "generate_dim_date", "populate_dim_date",
+           "ColumnBatch", "flatten_items", "TikTokItem", "models",
+           "refresh_rollups", "top_authors", "top_hashtags", "hashtags", "snapshots"]
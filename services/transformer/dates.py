@@ -0,0 +1,83 @@
+# dates.py
+from datetime import date, timedelta
+
+SECONDS_PER_DAY = 86400
+
+def civil_from_days(days):
+    """
+    Số ngày kể từ 1970-01-01 -> (year, month, day) bằng số học nguyên thuần
+    (thuật toán civil_from_days của H. Hinnant). Chạy được với int hoặc mảng NumPy
+    (vectorized), không cần datetime hay tra bảng.
+    """
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 - 12 * (mp >= 10)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+def date_keys(epoch_seconds, utc_offset_seconds=0):
+    """
+    Epoch giây (createTime) -> dateKey YYYYMMDD. Nhận int hoặc mảng NumPy int64.
+    Mặc định theo UTC, giống transform.sql.
+    """
+    days = (epoch_seconds + utc_offset_seconds) // SECONDS_PER_DAY
+    year, month, day = civil_from_days(days)
+    return year * 10000 + month * 100 + day
+
+def date_key(epoch_seconds, utc_offset_seconds=0):
+    """Bản scalar của date_keys; None -> None."""
+    if epoch_seconds is None:
+        return None
+    return int(date_keys(int(epoch_seconds), utc_offset_seconds))
+
+def key_of(value):
+    """date / datetime / chuỗi 'YYYY-MM-DD...' -> dateKey YYYYMMDD (None -> None)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.year * 10000 + value.month * 100 + value.day
+
+def to_date(key):
+    """dateKey YYYYMMDD -> date."""
+    return date(key // 10000, key // 100 % 100, key % 100)
+
+def generate_dim_date(start_year, end_year):
+    """Các dòng (dateKey, day, date) cho mọi ngày từ 01/01/start_year tới 31/12/end_year."""
+    current = date(start_year, 1, 1)
+    last = date(end_year, 12, 31)
+    rows = []
+    while current <= last:
+        rows.append((current.year * 10000 + current.month * 100 + current.day,
+                     current.strftime("%A"), current))
+        current += timedelta(days=1)
+    return rows
+
+def populate_dim_date(conn, start_year, end_year):
+    """
+    Điền sẵn warehouse_tiktok.dim_date cho cả khoảng năm bằng một lần bulk insert.
+    Bỏ qua nếu khoảng này đã đủ ngày. Trả về số dòng đã insert.
+    """
+    rows = generate_dim_date(start_year, end_year)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) AS n FROM warehouse_tiktok.dim_date WHERE dateKey BETWEEN %s AND %s",
+            (rows[0][0], rows[-1][0]),
+        )
+        row = cur.fetchone()
+        existing = row["n"] if isinstance(row, dict) else row[0]
+        if existing >= len(rows):
+            return 0
+        conn.begin()
+        try:
+            cur.executemany("INSERT IGNORE INTO warehouse_tiktok.dim_date (dateKey, day, date) VALUES (%s, %s, %s)", rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(rows) - existing
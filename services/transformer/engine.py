@@ -0,0 +1,337 @@
+# engine.py
+import logging
+from collections import OrderedDict
+import numpy as np
+from . import dates, flatten, hashtags, models, rollups, snapshots
+
+logger = logging.getLogger("crawler.transformer")
+
+STAGING_TABLE = "staging_tiktok.staging_raw"
+# Số id mỗi câu UPDATE ... WHERE id IN (...) khi đánh dấu processed
+MARK_BATCH_SIZE = 1000
+
+class LRUCache:
+    """Cache key -> value giới hạn số phần tử, bỏ phần tử ít dùng nhất khi đầy."""
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+def _stable_url(url):
+    """URL avatar của TikTok đổi chữ ký (x-expires, x-signature) mỗi lần crawl -> so sánh phần trước '?'."""
+    return url.split("?", 1)[0] if url else url
+
+class TransformEngine:
+    """
+    Đọc staging_raw theo chunk, parse JSON bằng Python và nạp vào warehouse_tiktok.
+    Giữ cache authorID / videoID / dateKey đã có trong warehouse để chỉ upsert
+    dimension mới hoặc thay đổi; fact_videos được ghi theo lô lớn, kèm
+    fact_video_snapshot (một dòng mỗi video mỗi ngày crawl).
+    Hashtag của video mới/thay đổi vào dim_hashtag + bridge_video_hashtag (cache name -> hashtagID).
+    Cache chỉ được cập nhật sau khi chunk commit thành công.
+    """
+
+    def __init__(self, conn, chunk_size=5000, cache_size=100_000, date_range=None, video_index=None,
+                 refresh_rollups=True):
+        self.conn = conn
+        # refresh_rollups: cuối run() tính lại agg_*_daily cho các dateKey vừa có fact mới
+        self.refresh_rollups = refresh_rollups
+        # video_index (tuỳ chọn, vd dedup_index.DedupIndex của crawler): cho biết video nào
+        # đã có dim_videos -> dòng của video đó chỉ là snapshot metrics, không cần upsert dim.
+        self.video_index = video_index
+        self.chunk_size = chunk_size
+        self.authors = LRUCache(cache_size)
+        self.videos = LRUCache(cache_size)
+        self.hashtags = LRUCache(cache_size)
+        # dim_date đã được điền sẵn cho date_range=(start_year, end_year): dateKey trong
+        # khoảng này không cần insert/tra cứu; chỉ ngày ngoài khoảng mới vào date_keys.
+        self.date_key_range = None
+        if date_range:
+            self.date_key_range = (date_range[0] * 10000 + 101, date_range[1] * 10000 + 1231)
+        self.date_keys = set()
+        self.stats = {"rows": 0, "chunks": 0, "facts": 0,
+                      "authors_upserted": 0, "authors_skipped": 0,
+                      "videos_upserted": 0, "videos_skipped": 0, "videos_snapshot_only": 0,
+                      "dates_inserted": 0, "snapshots": 0, "hashtags_inserted": 0, "bridge_rows": 0,
+                      "rollup_dates": 0}
+
+    # ---------- đọc staging ----------
+    def _max_staging_id(self):
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT MAX(id) AS max_id FROM {STAGING_TABLE}")
+            row = cur.fetchone()
+        return _row_value(row, "max_id")
+
+    def _fetch_chunk(self, after_id, max_id):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id, fetched_at, raw_json FROM {STAGING_TABLE}
+                WHERE processed = FALSE AND id > %s AND id <= %s
+                ORDER BY id LIMIT %s
+                """,
+                (after_id, max_id, self.chunk_size),
+            )
+            return cur.fetchall()
+
+    def run(self):
+        """Xử lý toàn bộ staging chưa processed tại thời điểm bắt đầu. Trả về stats."""
+        max_id = self._max_staging_id()
+        if max_id is None:
+            return self.stats
+        after_id = 0
+        while True:
+            rows = self._fetch_chunk(after_id, max_id)
+            if not rows:
+                break
+            ids = [_row_value(row, "id") for row in rows]
+            records = []
+            for row in rows:
+                raw = _row_value(row, "raw_json")
+                item = models.decode(raw) if isinstance(raw, (str, bytes)) else raw
+                records.append((_row_value(row, "fetched_at"), item))
+            self.load_items(records, staging_ids=ids)
+            after_id = ids[-1]
+        if self.refresh_rollups:
+            self.stats["rollup_dates"] = rollups.refresh(self.conn)
+        logger.info("Transform finished: %s", self.stats)
+        return self.stats
+
+    def _date_known(self, date_key):
+        rng = self.date_key_range
+        if rng is not None and rng[0] <= date_key <= rng[1]:
+            return True
+        return date_key in self.date_keys
+
+    def _existing_videos(self, video_ids):
+        """Các video_ids đang có trong dim_videos (cache trước, còn lại một câu SELECT)."""
+        found = {vid for vid in video_ids if vid in self.videos}
+        missing = [vid for vid in video_ids if vid not in found]
+        if missing:
+            placeholders = ",".join(["%s"] * len(missing))
+            with self.conn.cursor() as cur:
+                cur.execute(f"SELECT videoID FROM warehouse_tiktok.dim_videos WHERE videoID IN ({placeholders})",
+                            missing)
+                found.update(_row_value(row, "videoID") for row in cur.fetchall())
+        return found
+
+    # ---------- cache warm-up ----------
+    def _warm_cache(self, cache, table, key_col, columns, keys):
+        missing = [k for k in keys if k not in cache]
+        if not missing:
+            return
+        placeholders = ",".join(["%s"] * len(missing))
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {key_col}, {', '.join(columns)} FROM warehouse_tiktok.{table} "
+                f"WHERE {key_col} IN ({placeholders})",
+                missing,
+            )
+            for row in cur.fetchall():
+                values = tuple(_row_value(row, c, i + 1) for i, c in enumerate(columns))
+                cache.put(_row_value(row, key_col, 0), values)
+
+    # ---------- nạp một lô ----------
+    def load_items(self, records, staging_ids=None):
+        """
+        Nạp một lô (fetched_at, item) vào warehouse trong một transaction.
+        staging_ids: id staging đã đọc -> chỉ đánh dấu processed đúng các dòng này (dòng loader khác
+        commit muộn vào cùng khoảng id vẫn chờ chunk sau).
+        """
+        batch = flatten.flatten_items([item for _, item in records],
+                                      fetched_at=[fetched_at for fetched_at, _ in records])
+        self.load_batch(batch, staging_ids=staging_ids, rows=len(records))
+
+    def load_batch(self, batch, staging_ids=None, rows=None, before_commit=None):
+        """
+        Nạp một flatten.ColumnBatch (đã làm phẳng) vào warehouse trong một transaction.
+        before_commit: callable(cur) chạy cuối cùng trong cùng transaction (vd ghi staging của backfill).
+        """
+        authors = {row[0]: row for row in batch.rows(batch.authors, flatten.AUTHOR_COLUMNS)}
+        video_cols = dict(batch.videos)
+        video_ids = video_cols["videoID"].tolist()
+        create_dt = flatten.epoch_to_datetime(video_cols.pop("createTime"))
+        videos = {}
+        for vid, row, dt in zip(video_ids, batch.rows(video_cols, ("videoID", "authorID", "textContent",
+                                                                  "duration", "webVideoUrl", "hashtagList")),
+                                create_dt):
+            videos[vid] = (row[0], row[1], row[2], row[3], dt, row[4], row[5])
+        facts = batch.rows(batch.interactions, flatten.INTERACTION_COLUMNS)
+        snapshot_rows = snapshots.snapshot_rows(facts)
+        date_col = batch.interactions["dateKey"]
+        fact_dates = np.unique(date_col[date_col != flatten.NULL_INT]).tolist()
+        new_dates = {k for k in fact_dates if not self._date_known(k)}
+
+        if self.video_index is not None and videos:
+            # dim_loaded của index (nằm trên device) chỉ là gợi ý: warehouse có thể đã bị reset /
+            # rebuild, nên xác nhận video còn trong dim_videos trước khi bỏ upsert (FK của fact_videos)
+            hinted = set(videos) - self.video_index.unloaded(videos)
+            snapshot_only = self._existing_videos(hinted)
+            if len(snapshot_only) < len(hinted):
+                logger.info("%d videos marked loaded in the dedup index are missing from dim_videos",
+                            len(hinted) - len(snapshot_only))
+            for vid in snapshot_only:
+                del videos[vid]
+            self.stats["videos_snapshot_only"] += len(snapshot_only)
+
+        self._warm_cache(self.authors, "dim_authors", "authorID", ("authorName", "avatarUrl"), list(authors))
+        self._warm_cache(self.videos, "dim_videos", "videoID",
+                         ("authorID", "textContent", "duration", "createTime", "webVideoUrl", "hashtagList"),
+                         list(videos))
+
+        author_rows = []
+        for author_id, row in authors.items():
+            cached = self.authors.get(author_id)
+            if cached is not None and cached[0] == row[1] and _stable_url(cached[1]) == _stable_url(row[2]):
+                self.stats["authors_skipped"] += 1
+                continue
+            author_rows.append(row)
+        video_rows = []
+        for video_id, row in videos.items():
+            if self.videos.get(video_id) == row[1:]:
+                self.stats["videos_skipped"] += 1
+                continue
+            video_rows.append(row)
+        # Bridge chỉ ghi cho video vừa upsert; video đã có trong warehouse thì thay bridge cũ
+        upserted = {row[0] for row in video_rows}
+        changed_videos = [vid for vid in upserted if self.videos.get(vid) is not None]
+        tag_pairs = list(dict.fromkeys(
+            (vid, name)
+            for vid, name in zip(batch.hashtags["videoID"].tolist(),
+                                 map(hashtags.normalize, batch.hashtags["name"].tolist()))
+            if vid in upserted and name))
+        tag_ids = {name: self.hashtags.get(name) for _, name in tag_pairs}
+        missing = [name for name, hashtag_id in tag_ids.items() if hashtag_id is None]
+        if missing:
+            with self.conn.cursor() as cur:
+                for name, hashtag_id in hashtags.lookup_ids(cur, missing).items():
+                    tag_ids[name] = hashtag_id
+                    self.hashtags.put(name, hashtag_id)
+        date_rows = []
+        for k in sorted(new_dates):
+            d = dates.to_date(k)
+            date_rows.append((k, d.strftime("%A"), d))
+
+        self.conn.begin()
+        try:
+            with self.conn.cursor() as cur:
+                if author_rows:
+                    cur.executemany(
+                        """
+                        INSERT INTO warehouse_tiktok.dim_authors (authorID, authorName, avatarUrl)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE authorName = VALUES(authorName), avatarUrl = VALUES(avatarUrl)
+                        """,
+                        author_rows,
+                    )
+                if video_rows:
+                    cur.executemany(
+                        """
+                        INSERT INTO warehouse_tiktok.dim_videos
+                            (videoID, authorID, textContent, duration, createTime, webVideoUrl, hashtagList)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            authorID = VALUES(authorID), textContent = VALUES(textContent),
+                            duration = VALUES(duration), webVideoUrl = VALUES(webVideoUrl),
+                            hashtagList = VALUES(hashtagList)
+                        """,
+                        video_rows,
+                    )
+                new_tags = hashtags.insert_ids(cur, [n for n, hashtag_id in tag_ids.items() if hashtag_id is None])
+                tag_ids.update(new_tags)
+                if tag_pairs or changed_videos:
+                    hashtags.replace_bridge(cur, [(tag_ids[n], vid) for vid, n in tag_pairs], changed_videos)
+                if date_rows:
+                    cur.executemany(
+                        "INSERT IGNORE INTO warehouse_tiktok.dim_date (dateKey, day, date) VALUES (%s, %s, %s)",
+                        date_rows,
+                    )
+                if facts:
+                    cur.executemany(
+                        """
+                        INSERT INTO warehouse_tiktok.fact_videos
+                            (videoID, authorID, dateKey, diggCount, shareCount, playCount,
+                             commentCount, collectCount, createdAt)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        """,
+                        facts,
+                    )
+                    rollups.mark_dirty(cur, fact_dates)
+                snapshots.write(cur, snapshot_rows)
+                if staging_ids:
+                    _mark_processed(cur, staging_ids)
+                if before_commit is not None:
+                    before_commit(cur)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        for row in author_rows:
+            self.authors.put(row[0], row[1:])
+        for row in video_rows:
+            self.videos.put(row[0], row[1:])
+        for name, hashtag_id in new_tags.items():
+            self.hashtags.put(name, hashtag_id)
+        self.date_keys.update(k for k, _, _ in date_rows)
+        if self.video_index is not None and videos:
+            self.video_index.mark_loaded(list(videos))
+
+        self.stats["rows"] += len(batch) if rows is None else rows
+        self.stats["chunks"] += 1
+        self.stats["facts"] += len(facts)
+        self.stats["authors_upserted"] += len(author_rows)
+        self.stats["videos_upserted"] += len(video_rows)
+        self.stats["dates_inserted"] += len(date_rows)
+        self.stats["snapshots"] += len(snapshot_rows)
+        self.stats["hashtags_inserted"] += len(new_tags)
+        self.stats["bridge_rows"] += len(tag_pairs)
+
+def _mark_processed(cur, ids):
+    for i in range(0, len(ids), MARK_BATCH_SIZE):
+        part = ids[i:i + MARK_BATCH_SIZE]
+        cur.execute(
+            f"UPDATE {STAGING_TABLE} SET processed = TRUE WHERE id IN ({','.join(['%s'] * len(part))})",
+            part,
+        )
+
+def _row_value(row, key, index=0):
+    """Lấy giá trị từ row DictCursor hoặc tuple cursor."""
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row[key]
+    return row[index]
+
+def run_transform(conn, chunk_size=5000, cache_size=100_000, date_range=None, video_index=None,
+                  refresh_rollups=True):
+    """
+    Chạy transform staging -> warehouse trên kết nối `conn`. Trả về stats.
+    date_range=(start_year, end_year): điền sẵn dim_date cho khoảng này trước khi nạp.
+    refresh_rollups=False: chỉ ghi agg_dirty_date, để rollups.refresh() chạy sau.
+    """
+    if date_range:
+        inserted = dates.populate_dim_date(conn, *date_range)
+        if inserted:
+            logger.info("dim_date pre-filled %d-%d: %d rows", date_range[0], date_range[1], inserted)
+    return TransformEngine(conn, chunk_size, cache_size, date_range=date_range,
+                           video_index=video_index, refresh_rollups=refresh_rollups).run()
@@ -0,0 +1,147 @@
+# flatten.py
+import numpy as np
+from . import dates, models
+
+# Giá trị NULL cho cột số nguyên (int64 không có NaN)
+NULL_INT = np.iinfo(np.int64).min
+
+AUTHOR_COLUMNS = ("authorID", "authorName", "avatarUrl")
+VIDEO_COLUMNS = ("videoID", "authorID", "textContent", "duration", "createTime", "webVideoUrl", "hashtagList")
+INTERACTION_COLUMNS = ("videoID", "authorID", "dateKey", "diggCount", "shareCount", "playCount",
+                       "commentCount", "collectCount", "fetchedAt")
+HASHTAG_COLUMNS = ("videoID", "name")
+
+_INT_COLUMNS = {"authorID", "videoID", "duration", "createTime", "dateKey", "diggCount",
+                "shareCount", "playCount", "commentCount", "collectCount"}
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NULL_INT
+
+def _column(name, values):
+    if name in _INT_COLUMNS:
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=object)
+
+class ColumnBatch:
+    """
+    Một lô item TikTok đã được làm phẳng thành cột NumPy theo từng bảng đích:
+    - authors / videos: mỗi authorID / videoID một dòng (bản ghi cuối cùng trong lô thắng)
+    - interactions: mỗi item một dòng (snapshot counters)
+    - hashtags: (videoID, name) đã explode, không lặp trong một video
+    Cột số nguyên là int64, NULL = NULL_INT; cột chuỗi là mảng object.
+    """
+
+    def __init__(self, authors, videos, interactions, hashtags):
+        self.authors = authors
+        self.videos = videos
+        self.interactions = interactions
+        self.hashtags = hashtags
+
+    def __len__(self):
+        return len(self.interactions["videoID"])
+
+    @staticmethod
+    def rows(table, columns=None):
+        """Chuyển bảng cột -> list tuple để executemany; NULL_INT/NaT -> None."""
+        columns = columns or tuple(table)
+        converted = []
+        for name in columns:
+            col = table[name]
+            if col.dtype == np.int64:
+                values = col.tolist()
+                converted.append([None if v == NULL_INT else v for v in values])
+            else:
+                converted.append(col.tolist())
+        return list(zip(*converted))
+
+def flatten_items(items, fetched_at=None, utc_offset_seconds=0):
+    """
+    Làm phẳng list item (models.TikTokItem hoặc dict Apify) trong một lượt duyệt duy nhất.
+    fetched_at: giá trị chung cho cả lô hoặc list cùng độ dài với items.
+    """
+    per_item_fetch = isinstance(fetched_at, (list, tuple))
+
+    a_cols = {c: [] for c in AUTHOR_COLUMNS}
+    a_pos = {}
+    v_cols = {c: [] for c in VIDEO_COLUMNS}
+    v_pos = {}
+    i_cols = {c: [] for c in INTERACTION_COLUMNS if c != "dateKey"}
+    create_times = []
+    h_video, h_name = [], []
+    tagged = set()
+
+    for idx, item in enumerate(items):
+        item = models.as_item(item)
+        video_id = _to_int(item.id)
+        if video_id == NULL_INT:
+            continue
+        author = item.authorMeta
+        author_id = _to_int(author.id) if author is not None else NULL_INT
+        create_time = _to_int(item.createTime)
+        names = [h.name for h in item.hashtags or () if h.name]
+
+        if author_id != NULL_INT:
+            values = (author_id, author.name, author.avatar)
+            pos = a_pos.get(author_id)
+            if pos is None:
+                a_pos[author_id] = len(a_cols["authorID"])
+                for c, v in zip(AUTHOR_COLUMNS, values):
+                    a_cols[c].append(v)
+            else:
+                for c, v in zip(AUTHOR_COLUMNS, values):
+                    a_cols[c][pos] = v
+
+        duration = _to_int(item.videoMeta.duration) if item.videoMeta is not None else NULL_INT
+        values = (video_id, author_id, item.text, duration,
+                  create_time, item.webVideoUrl, ",".join(names) or None)
+        pos = v_pos.get(video_id)
+        if pos is None:
+            v_pos[video_id] = len(v_cols["videoID"])
+            for c, v in zip(VIDEO_COLUMNS, values):
+                v_cols[c].append(v)
+        else:
+            for c, v in zip(VIDEO_COLUMNS, values):
+                v_cols[c][pos] = v
+
+        if video_id not in tagged:
+            tagged.add(video_id)
+            for name in dict.fromkeys(names):
+                h_video.append(video_id)
+                h_name.append(name)
+
+        i_cols["videoID"].append(video_id)
+        i_cols["authorID"].append(author_id)
+        i_cols["diggCount"].append(_to_int(item.diggCount))
+        i_cols["shareCount"].append(_to_int(item.shareCount))
+        i_cols["playCount"].append(_to_int(item.playCount))
+        i_cols["commentCount"].append(_to_int(item.commentCount))
+        i_cols["collectCount"].append(_to_int(item.collectCount))
+        i_cols["fetchedAt"].append(fetched_at[idx] if per_item_fetch else fetched_at)
+        create_times.append(create_time)
+
+    interactions = {c: _column(c, v) for c, v in i_cols.items()}
+    ct = np.array(create_times, dtype=np.int64)
+    valid = ct != NULL_INT
+    date_key = np.full(len(ct), NULL_INT, dtype=np.int64)
+    date_key[valid] = dates.date_keys(ct[valid], utc_offset_seconds)
+    interactions["dateKey"] = date_key
+    interactions = {c: interactions[c] for c in INTERACTION_COLUMNS}
+
+    return ColumnBatch(
+        authors={c: _column(c, v) for c, v in a_cols.items()},
+        videos={c: _column(c, v) for c, v in v_cols.items()},
+        interactions=interactions,
+        hashtags={"videoID": np.array(h_video, dtype=np.int64), "name": np.array(h_name, dtype=object)},
+    )
+
+def epoch_to_datetime(col):
+    """Cột epoch giây int64 -> list datetime (NULL_INT -> None)."""
+    valid = col != NULL_INT
+    out = [None] * len(col)
+    converted = col[valid].astype("datetime64[s]").tolist()
+    for i, v in zip(np.flatnonzero(valid).tolist(), converted):
+        out[i] = v
+    return out
@@ -0,0 +1,155 @@
+# hashtags.py
+"""
+Hashtag chuẩn hoá: warehouse_tiktok.dim_hashtag (hashtagID, name) và bảng nối
+bridge_video_hashtag (hashtagID, videoID). Tra cứu theo hashtag đi qua khoá chính
+(hashtagID, videoID) thay vì LIKE trên dim_videos.hashtagList.
+Tên hashtag được lower-case (TikTok không phân biệt hoa thường).
+"""
+import logging
+
+logger = logging.getLogger("crawler.transformer")
+
+DIM_TABLE = "warehouse_tiktok.dim_hashtag"
+BRIDGE_TABLE = "warehouse_tiktok.bridge_video_hashtag"
+COUNTER_COLUMNS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+
+def normalize(name):
+    name = (name or "").strip().lower()
+    return name[:255] or None
+
+def _value(row, key, index):
+    return row[key] if isinstance(row, dict) else row[index]
+
+def lookup_ids(cur, names):
+    """name -> hashtagID cho các tên đã có trong dim_hashtag."""
+    if not names:
+        return {}
+    placeholders = ",".join(["%s"] * len(names))
+    cur.execute(f"SELECT hashtagID, name FROM {DIM_TABLE} WHERE name IN ({placeholders})", list(names))
+    return {_value(row, "name", 1): _value(row, "hashtagID", 0) for row in cur.fetchall()}
+
+def insert_ids(cur, names):
+    """Thêm các tên mới (bỏ qua tên đã có) rồi trả về name -> hashtagID của chúng."""
+    if not names:
+        return {}
+    cur.executemany(f"INSERT IGNORE INTO {DIM_TABLE} (name) VALUES (%s)", [(n,) for n in names])
+    return lookup_ids(cur, names)
+
+def replace_bridge(cur, rows, existing_videos=()):
+    """
+    Ghi bridge (hashtagID, videoID). existing_videos: video đã có trong warehouse mà danh sách
+    hashtag có thể đã đổi -> xoá bridge cũ của chúng trước. Trả về số dòng bridge ghi.
+    """
+    existing_videos = list(existing_videos)
+    if existing_videos:
+        placeholders = ",".join(["%s"] * len(existing_videos))
+        cur.execute(f"DELETE FROM {BRIDGE_TABLE} WHERE videoID IN ({placeholders})", existing_videos)
+    if rows:
+        cur.executemany(f"INSERT IGNORE INTO {BRIDGE_TABLE} (hashtagID, videoID) VALUES (%s, %s)", rows)
+    return len(rows)
+
+def bridge_missing(conn):
+    """True nếu warehouse có video nhưng bridge còn rỗng (warehouse có từ trước khi có dim_hashtag)."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT 1 AS found FROM {BRIDGE_TABLE} LIMIT 1")
+        if cur.fetchone() is not None:
+            return False
+        cur.execute("SELECT 1 AS found FROM warehouse_tiktok.dim_videos LIMIT 1")
+        return cur.fetchone() is not None
+
+def backfill_bridge(conn, batch_size=10000):
+    """
+    Dựng bridge cho video đã nạp trước khi có dim_hashtag, từ dim_videos.hashtagList.
+    Duyệt dim_videos theo videoID, mỗi lô một transaction; dateKey của các video này được
+    ghi vào agg_dirty_date để rollup hashtag tính lại. Trả về số video đã xử lý.
+    """
+    after_id, total = -1, 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT videoID, hashtagList FROM warehouse_tiktok.dim_videos
+                WHERE videoID > %s ORDER BY videoID LIMIT %s
+                """,
+                (after_id, batch_size),
+            )
+            videos = [(_value(r, "videoID", 0), _value(r, "hashtagList", 1)) for r in cur.fetchall()]
+        if not videos:
+            break
+        pairs = []
+        for video_id, tag_list in videos:
+            names = (normalize(n) for n in (tag_list or "").split(","))
+            pairs.extend((video_id, n) for n in dict.fromkeys(n for n in names if n))
+        video_ids = [v for v, _ in videos]
+        placeholders = ",".join(["%s"] * len(video_ids))
+        conn.begin()
+        try:
+            with conn.cursor() as cur:
+                names = sorted({n for _, n in pairs})
+                ids = lookup_ids(cur, names)
+                ids.update(insert_ids(cur, [n for n in names if n not in ids]))
+                replace_bridge(cur, [(ids[n], v) for v, n in pairs], video_ids)
+                cur.execute(
+                    f"""
+                    INSERT IGNORE INTO warehouse_tiktok.agg_dirty_date (dateKey)
+                    SELECT DISTINCT dateKey FROM warehouse_tiktok.fact_videos
+                    WHERE videoID IN ({placeholders}) AND dateKey IS NOT NULL
+                    """,
+                    video_ids,
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(videos)
+        after_id = video_ids[-1]
+    logger.info("Hashtag bridge backfilled for %d videos", total)
+    return total
+
+# ---------- truy vấn ----------
+def _check_metric(metric):
+    if metric not in COUNTER_COLUMNS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {COUNTER_COLUMNS}")
+
+# Snapshot mới nhất của từng video gắn hashtag (bridge theo PK -> index videoID của fact_videos)
+_LATEST = f"""
+    SELECT MAX(f.interactionID) AS interactionID
+    FROM {BRIDGE_TABLE} b
+    JOIN warehouse_tiktok.fact_videos f ON f.videoID = b.videoID
+    WHERE b.hashtagID = (SELECT hashtagID FROM {DIM_TABLE} WHERE name = %s)
+    GROUP BY f.videoID
+"""
+
+def top_videos(conn, hashtag, metric="playCount", limit=10):
+    """Top video gắn `hashtag` theo counter `metric` ở snapshot mới nhất."""
+    _check_metric(metric)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT f.videoID, f.authorID, v.webVideoUrl, f.{metric} AS total
+            FROM ({_LATEST}) latest
+            JOIN warehouse_tiktok.fact_videos f ON f.interactionID = latest.interactionID
+            JOIN warehouse_tiktok.dim_videos v ON v.videoID = f.videoID
+            ORDER BY total DESC LIMIT %s
+            """,
+            (normalize(hashtag), int(limit)),
+        )
+        return cur.fetchall()
+
+def top_authors(conn, hashtag, metric="playCount", limit=10):
+    """Top tác giả theo tổng `metric` (snapshot mới nhất) của các video gắn `hashtag`."""
+    _check_metric(metric)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT f.authorID, a.authorName, COUNT(*) AS videoCount, SUM(f.{metric}) AS total
+            FROM ({_LATEST}) latest
+            JOIN warehouse_tiktok.fact_videos f ON f.interactionID = latest.interactionID
+            LEFT JOIN warehouse_tiktok.dim_authors a ON a.authorID = f.authorID
+            WHERE f.authorID IS NOT NULL
+            GROUP BY f.authorID, a.authorName
+            ORDER BY total DESC LIMIT %s
+            """,
+            (normalize(hashtag), int(limit)),
+        )
+        return cur.fetchall()
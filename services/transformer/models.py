@@ -0,0 +1,125 @@
+# models.py
+"""
+Item TikTok dạng typed, chỉ gồm các field warehouse dùng (author, video, counters, hashtag,
+createTime). Các key khác của Apify (originalAvatarUrl, playUrl có chữ ký, subtitleLinks...)
+bị bỏ ngay lúc decode, nên mỗi item trong RAM nhỏ hơn nhiều so với dict gốc.
+- Có msgspec: Struct (gc=False) decode thẳng từ JSON, key không khai báo được bỏ qua khi parse
+- Không có msgspec: class __slots__, parse bằng orjson / json rồi chiếu field ngay
+decode(raw) và from_dict(item) trả về TikTokItem trong cả hai trường hợp.
+"""
+import json
+from typing import List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:  # msgspec là tuỳ chọn
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn, giống crawler/codec.py
+    orjson = None
+
+COUNTER_FIELDS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+
+if msgspec is not None:
+    class Author(msgspec.Struct, gc=False):
+        id: Union[int, str, None] = None
+        name: Optional[str] = None
+        avatar: Optional[str] = None
+
+    class VideoMeta(msgspec.Struct, gc=False):
+        duration: Optional[float] = None
+
+    class Hashtag(msgspec.Struct, gc=False):
+        name: Optional[str] = None
+
+    class TikTokItem(msgspec.Struct, gc=False):
+        id: Union[int, str, None] = None
+        text: Optional[str] = None
+        createTime: Union[int, str, None] = None
+        webVideoUrl: Optional[str] = None
+        authorMeta: Optional[Author] = None
+        videoMeta: Optional[VideoMeta] = None
+        hashtags: Optional[List[Hashtag]] = None
+        diggCount: Optional[int] = None
+        shareCount: Optional[int] = None
+        playCount: Optional[int] = None
+        commentCount: Optional[int] = None
+        collectCount: Optional[int] = None
+
+    _decoder = msgspec.json.Decoder(TikTokItem)
+else:
+    class _Record:
+        """Bản ghi __slots__ tối giản: khởi tạo theo tên field, field thiếu là None."""
+        __slots__ = ()
+
+        def __init__(self, **values):
+            for name in self.__slots__:
+                setattr(self, name, values.pop(name, None))
+            if values:
+                raise TypeError(f"Unexpected fields for {type(self).__name__}: {sorted(values)}")
+
+        def __eq__(self, other):
+            return type(self) is type(other) and all(
+                getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+        def __repr__(self):
+            fields = ", ".join(f"{n}={getattr(self, n)!r}" for n in self.__slots__)
+            return f"{type(self).__name__}({fields})"
+
+    class Author(_Record):
+        __slots__ = ("id", "name", "avatar")
+
+    class VideoMeta(_Record):
+        __slots__ = ("duration",)
+
+    class Hashtag(_Record):
+        __slots__ = ("name",)
+
+    class TikTokItem(_Record):
+        __slots__ = ("id", "text", "createTime", "webVideoUrl", "authorMeta", "videoMeta",
+                     "hashtags") + COUNTER_FIELDS
+
+    _decoder = None
+
+def _loads(raw):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # NaN / Infinity... thử lại bằng stdlib
+    return json.loads(raw)
+
+def from_dict(item):
+    """dict item Apify -> TikTokItem (không kiểm tra kiểu, chỉ chiếu field)."""
+    author = item.get("authorMeta")
+    video_meta = item.get("videoMeta")
+    return TikTokItem(
+        id=item.get("id"),
+        text=item.get("text"),
+        createTime=item.get("createTime"),
+        webVideoUrl=item.get("webVideoUrl"),
+        authorMeta=Author(id=author.get("id"), name=author.get("name"), avatar=author.get("avatar"))
+        if isinstance(author, dict) else None,
+        videoMeta=VideoMeta(duration=video_meta.get("duration")) if isinstance(video_meta, dict) else None,
+        hashtags=[Hashtag(name=h.get("name")) for h in item.get("hashtags") or () if isinstance(h, dict)],
+        **{name: item.get(name) for name in COUNTER_FIELDS},
+    )
+
+def decode(raw):
+    """
+    Text / bytes JSON của một item -> TikTokItem.
+    msgspec kiểm tra kiểu khi decode; item lệch schema (vd counter kiểu float) được đọc lại
+    bằng đường dict -> from_dict thay vì làm hỏng cả lô.
+    """
+    if _decoder is not None:
+        try:
+            return _decoder.decode(raw)
+        except msgspec.ValidationError:
+            pass
+    return from_dict(_loads(raw))
+
+def as_item(item):
+    """TikTokItem giữ nguyên, dict được chiếu thành TikTokItem."""
+    return from_dict(item) if isinstance(item, dict) else item
@@ -0,0 +1,122 @@
+# rollups.py
+"""
+Bảng tổng hợp theo ngày trong warehouse_tiktok, cập nhật incremental:
+- agg_author_daily  (dateKey, authorID)
+- agg_hashtag_daily (dateKey, hashtag)
+Mỗi dòng cộng counters của snapshot mới nhất (interactionID lớn nhất) của từng video
+có dateKey (ngày đăng video) tương ứng, kèm videoCount.
+
+Transform ghi dateKey của mỗi chunk vào agg_dirty_date trong cùng transaction với
+fact_videos; refresh() chỉ tính lại các dateKey đó rồi xoá khỏi agg_dirty_date.
+Transform bị dừng giữa chừng thì lần refresh sau vẫn thấy các ngày chưa cập nhật.
+"""
+import logging
+
+logger = logging.getLogger("crawler.transformer")
+
+DIRTY_TABLE = "warehouse_tiktok.agg_dirty_date"
+COUNTER_COLUMNS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+METRICS = COUNTER_COLUMNS + ("videoCount",)
+
+_SUMS = ", ".join(f"COALESCE(SUM(f.{c}), 0)" for c in COUNTER_COLUMNS)
+_COLUMNS = "videoCount, " + ", ".join(COUNTER_COLUMNS)
+
+# Snapshot mới nhất của mỗi video thuộc các dateKey cần tính lại
+# (dùng index (dateKey, videoID) của fact_videos).
+_LATEST = """
+    SELECT MAX(interactionID) AS interactionID FROM warehouse_tiktok.fact_videos
+    WHERE dateKey IN ({keys}) GROUP BY videoID
+"""
+
+ROLLUPS = {
+    "agg_author_daily": f"""
+        INSERT INTO warehouse_tiktok.agg_author_daily (dateKey, authorID, {_COLUMNS}, refreshedAt)
+        SELECT f.dateKey, f.authorID, COUNT(*), {_SUMS}, NOW()
+        FROM warehouse_tiktok.fact_videos f
+        JOIN ({_LATEST}) latest ON latest.interactionID = f.interactionID
+        WHERE f.authorID IS NOT NULL
+        GROUP BY f.dateKey, f.authorID
+    """,
+    "agg_hashtag_daily": f"""
+        INSERT INTO warehouse_tiktok.agg_hashtag_daily (dateKey, hashtag, {_COLUMNS}, refreshedAt)
+        SELECT f.dateKey, h.name, COUNT(*), {_SUMS}, NOW()
+        FROM warehouse_tiktok.fact_videos f
+        JOIN ({_LATEST}) latest ON latest.interactionID = f.interactionID
+        JOIN warehouse_tiktok.bridge_video_hashtag b ON b.videoID = f.videoID
+        JOIN warehouse_tiktok.dim_hashtag h ON h.hashtagID = b.hashtagID
+        GROUP BY f.dateKey, h.name
+    """,
+}
+
+def mark_dirty(cur, date_keys):
+    """Ghi các dateKey vừa có fact mới (gọi trong transaction của chunk)."""
+    if date_keys:
+        cur.executemany(f"INSERT IGNORE INTO {DIRTY_TABLE} (dateKey) VALUES (%s)", [(k,) for k in date_keys])
+
+def dirty_date_keys(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT dateKey FROM {DIRTY_TABLE} ORDER BY dateKey")
+        return [row["dateKey"] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+
+def refresh(conn, date_keys=None, batch_size=100):
+    """
+    Tính lại các bảng rollup cho date_keys (mặc định: mọi dateKey trong agg_dirty_date).
+    Mỗi lô batch_size ngày: xoá dòng cũ + insert lại + xoá khỏi agg_dirty_date trong một
+    transaction. Trả về số dateKey đã refresh.
+    """
+    if date_keys is None:
+        date_keys = dirty_date_keys(conn)
+    date_keys = sorted(set(date_keys))
+    for i in range(0, len(date_keys), batch_size):
+        keys = date_keys[i:i + batch_size]
+        placeholders = ",".join(["%s"] * len(keys))
+        conn.begin()
+        try:
+            with conn.cursor() as cur:
+                for table, sql in ROLLUPS.items():
+                    cur.execute(f"DELETE FROM warehouse_tiktok.{table} WHERE dateKey IN ({placeholders})", keys)
+                    cur.execute(sql.format(keys=placeholders), keys)
+                cur.execute(f"DELETE FROM {DIRTY_TABLE} WHERE dateKey IN ({placeholders})", keys)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if date_keys:
+        logger.info("Rollups refreshed for %d dateKeys (%s..%s)", len(date_keys), date_keys[0], date_keys[-1])
+    return len(date_keys)
+
+def _check_metric(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+
+def top_authors(conn, start_key, end_key, metric="playCount", limit=10):
+    """Top tác giả theo tổng `metric` của video đăng trong [start_key, end_key] (dateKey)."""
+    _check_metric(metric)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT t.authorID, a.authorName, t.total FROM (
+                SELECT authorID, SUM({metric}) AS total FROM warehouse_tiktok.agg_author_daily
+                WHERE dateKey BETWEEN %s AND %s
+                GROUP BY authorID ORDER BY total DESC LIMIT %s
+            ) t
+            LEFT JOIN warehouse_tiktok.dim_authors a ON a.authorID = t.authorID
+            ORDER BY t.total DESC
+            """,
+            (start_key, end_key, int(limit)),
+        )
+        return cur.fetchall()
+
+def top_hashtags(conn, start_key, end_key, metric="playCount", limit=10):
+    """Top hashtag theo tổng `metric` của video đăng trong [start_key, end_key] (dateKey)."""
+    _check_metric(metric)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT hashtag, SUM({metric}) AS total FROM warehouse_tiktok.agg_hashtag_daily
+            WHERE dateKey BETWEEN %s AND %s
+            GROUP BY hashtag ORDER BY total DESC LIMIT %s
+            """,
+            (start_key, end_key, int(limit)),
+        )
+        return cur.fetchall()
@@ -0,0 +1,198 @@
+# snapshots.py
+"""
+Snapshot counters theo ngày crawl: warehouse_tiktok.fact_video_snapshot, khoá
+(snapshotDateKey, videoID), chỉ append (cùng ngày crawl lại thì bản sau ghi đè bản trước).
+Bảng được partition RANGE theo snapshotDateKey, mỗi tháng một partition:
+- ensure_partitions(): tách pmax thành các partition tháng tới trước khi dữ liệu đến
+- drop_partitions_before(): bỏ partition cũ bằng DROP PARTITION (không DELETE từng dòng),
+  tuỳ chọn EXCHANGE sang bảng archive trước khi bỏ
+Truy vấn theo snapshotDateKey (growth) chỉ đọc các partition liên quan.
+"""
+import logging
+from datetime import date, timedelta
+from . import dates
+
+logger = logging.getLogger("crawler.transformer")
+
+SCHEMA = "warehouse_tiktok"
+TABLE = "fact_video_snapshot"
+COUNTER_COLUMNS = ("diggCount", "shareCount", "playCount", "commentCount", "collectCount")
+COLUMNS = ("snapshotDateKey", "videoID", "authorID", "dateKey") + COUNTER_COLUMNS + ("capturedAt",)
+
+def snapshot_rows(facts):
+    """
+    Dòng fact (videoID, authorID, dateKey, 5 counters, fetchedAt) -> dòng snapshot theo COLUMNS.
+    Một video có nhiều bản trong cùng ngày crawl thì giữ bản sau cùng; dòng không có fetchedAt bị bỏ.
+    """
+    rows = {}
+    key_cache = {}
+    for fact in facts:
+        fetched_at = fact[-1]
+        if fetched_at is None:
+            continue
+        snapshot_key = key_cache.get(fetched_at)
+        if snapshot_key is None:
+            snapshot_key = key_cache[fetched_at] = dates.key_of(fetched_at)
+        rows[(snapshot_key, fact[0])] = (snapshot_key,) + tuple(fact)
+    return list(rows.values())
+
+def write(cur, rows):
+    if not rows:
+        return 0
+    placeholders = ", ".join(["%s"] * len(COLUMNS))
+    updates = ", ".join(f"{c} = VALUES({c})" for c in COLUMNS[2:])
+    cur.executemany(
+        f"""
+        INSERT INTO {SCHEMA}.{TABLE} ({", ".join(COLUMNS)})
+        VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE {updates}
+        """,
+        rows,
+    )
+    return len(rows)
+
+# ---------- partition ----------
+def _month_start(key):
+    return key // 100 * 100 + 1
+
+def _add_months(key, months):
+    """dateKey -> dateKey ngày 1 của tháng cách đó `months` tháng."""
+    index = key // 10000 * 12 + key // 100 % 100 - 1 + months
+    return index // 12 * 10000 + index % 12 * 100 + 101
+
+def partitions(conn, table=TABLE):
+    """[(tên partition, cận trên dạng int hoặc None nếu MAXVALUE)] theo thứ tự."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound
+            FROM INFORMATION_SCHEMA.PARTITIONS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (SCHEMA, table),
+        )
+        rows = cur.fetchall()
+    result = []
+    for row in rows:
+        name, bound = (row["name"], row["bound"]) if isinstance(row, dict) else row
+        result.append((name, None if bound == "MAXVALUE" else int(bound)))
+    return result
+
+def ensure_partitions(conn, months_ahead=3, today=None):
+    """
+    Đảm bảo có partition tháng cho tới hết tháng hiện tại + months_ahead, bằng cách
+    REORGANIZE pmax (rỗng nếu chạy đều đặn nên gần như không tốn gì). Trả về tên partition mới.
+    """
+    existing = partitions(conn)
+    if not existing or existing[-1][1] is not None:
+        logger.warning("%s.%s has no MAXVALUE partition, skipping partition maintenance", SCHEMA, TABLE)
+        return []
+    last_bound = max((b for _, b in existing if b is not None), default=None)
+    today = today or date.today()
+    target = _add_months(dates.key_of(today), months_ahead + 1)
+    start = last_bound if last_bound is not None else _month_start(dates.key_of(today))
+    new = []
+    while start < target:
+        bound = _add_months(start, 1)
+        new.append((f"p{start // 100}", bound))
+        start = bound
+    if not new:
+        return []
+    definitions = ", ".join(f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in new)
+    pmax = existing[-1][0]
+    with conn.cursor() as cur:
+        cur.execute(
+            f"ALTER TABLE {SCHEMA}.{TABLE} REORGANIZE PARTITION {pmax} INTO "
+            f"({definitions}, PARTITION {pmax} VALUES LESS THAN MAXVALUE)"
+        )
+    names = [name for name, _ in new]
+    logger.info("Added %s partitions: %s", TABLE, names)
+    return names
+
+def _prepare_archive(conn, name):
+    """
+    Tạo bảng archive rỗng, không partition cho partition `name`. Trả về tên bảng, hoặc None nếu
+    bảng đã có dữ liệu (EXCHANGE sẽ đổi các dòng đã archive ngược vào bảng snapshot).
+    """
+    archive_table = f"{TABLE}_{name}"
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{archive_table} LIKE {SCHEMA}.{TABLE}")
+    # Bảng vừa tạo bằng LIKE mang theo partitioning; bảng từ lần chạy trước thì đã bỏ rồi
+    if partitions(conn, archive_table):
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {SCHEMA}.{archive_table} REMOVE PARTITIONING")
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT 1 AS found FROM {SCHEMA}.{archive_table} LIMIT 1")
+        if cur.fetchone() is not None:
+            logger.error("Archive table %s.%s already holds rows; keeping partition %s of %s "
+                         "(move or drop the archive table, then re-run)", SCHEMA, archive_table, name, TABLE)
+            return None
+    return f"{SCHEMA}.{archive_table}"
+
+def drop_partitions_before(conn, cutoff_key, archive=False):
+    """
+    Bỏ các partition chỉ chứa snapshot trước cutoff_key (cận trên <= cutoff_key).
+    archive=True: EXCHANGE partition sang bảng fact_video_snapshot_<partition> (đổi metadata,
+    không copy dữ liệu) rồi mới DROP; partition có bảng archive không rỗng được giữ lại.
+    Trả về tên các partition đã bỏ.
+    """
+    dropped = []
+    for name, bound in partitions(conn):
+        if bound is None or bound > cutoff_key:
+            break
+        if archive:
+            archive_table = _prepare_archive(conn, name)
+            if archive_table is None:
+                continue
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE {SCHEMA}.{TABLE} EXCHANGE PARTITION {name} WITH TABLE {archive_table}")
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {SCHEMA}.{TABLE} DROP PARTITION {name}")
+        dropped.append(name)
+    if dropped:
+        logger.info("Dropped %s partitions before %s%s: %s", TABLE, cutoff_key,
+                    " (archived)" if archive else "", dropped)
+    return dropped
+
+def maintain(conn, months_ahead=3, retention_months=0, archive=False, today=None):
+    """ensure_partitions + bỏ partition quá retention_months tháng (0 = giữ tất cả)."""
+    added = ensure_partitions(conn, months_ahead, today)
+    dropped = []
+    if retention_months > 0:
+        cutoff = _add_months(dates.key_of(today or date.today()), -retention_months)
+        dropped = drop_partitions_before(conn, cutoff, archive)
+    return added, dropped
+
+# ---------- truy vấn ----------
+def latest_snapshot_key(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MAX(snapshotDateKey) AS k FROM {SCHEMA}.{TABLE}")
+        row = cur.fetchone()
+    return row["k"] if isinstance(row, dict) else (row[0] if row else None)
+
+def growth(conn, metric="playCount", days=1, as_of=None, limit=20):
+    """
+    Video tăng `metric` nhiều nhất giữa snapshot ngày as_of (mặc định: ngày mới nhất) và
+    snapshot `days` ngày trước đó. Chỉ đọc hai partition chứa hai ngày này.
+    """
+    if metric not in COUNTER_COLUMNS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {COUNTER_COLUMNS}")
+    as_of = as_of or latest_snapshot_key(conn)
+    if as_of is None:
+        return []
+    since = dates.key_of(dates.to_date(as_of) - timedelta(days=days))
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT cur.videoID, cur.authorID, cur.{metric} AS current,
+                   cur.{metric} - prev.{metric} AS gained
+            FROM {SCHEMA}.{TABLE} cur
+            JOIN {SCHEMA}.{TABLE} prev
+              ON prev.snapshotDateKey = %s AND prev.videoID = cur.videoID
+            WHERE cur.snapshotDateKey = %s
+            ORDER BY gained DESC LIMIT %s
+            """,
+            (since, as_of, int(limit)),
+        )
+        return cur.fetchall()
@@ -1,39 +1,192 @@
 -- transforms.sql
-USE dwh_tiktok;
-
--- Simple transform: extract videos and creators from staging_raw JSON
-INSERT INTO creators (creator_id, name, followers, extra)
-SELECT
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.creator.id')) AS creator_id,
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.creator.name')) AS name,
-  CAST(JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.creator.followers')) AS UNSIGNED) AS followers,
-  JSON_EXTRACT(raw_json, '$.creator') AS extra
-FROM staging_raw
-WHERE processed = FALSE
-  AND JSON_EXTRACT(raw_json, '$.creator.id') IS NOT NULL
-ON DUPLICATE KEY UPDATE
-  name = VALUES(name),
-  followers = VALUES(followers),
-  extra = VALUES(extra);
-
-INSERT INTO videos (video_id, creator_id, title, description, created_at, duration_seconds, stats, raw_json)
-SELECT
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.id')) AS video_id,
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.creator.id')) AS creator_id,
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.title')) AS title,
-  JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.description')) AS description,
-  STR_TO_DATE(JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.create_time')), '%Y-%m-%dT%H:%i:%s') AS created_at,
-  CAST(JSON_UNQUOTE(JSON_EXTRACT(raw_json, '$.duration')) AS UNSIGNED) AS duration_seconds,
-  JSON_EXTRACT(raw_json, '$.stats') AS stats,
-  raw_json
-FROM staging_raw
-WHERE processed = FALSE
-  AND JSON_EXTRACT(raw_json, '$.id') IS NOT NULL
-ON DUPLICATE KEY UPDATE
-  title = VALUES(title),
-  description = VALUES(description),
-  stats = VALUES(stats),
-  raw_json = VALUES(raw_json);
-
--- mark processed
-UPDATE staging_raw SET processed = TRUE WHERE processed = FALSE;
+-- Transform staging_tiktok.staging_raw (payload Apify TikTok) -> warehouse_tiktok
+-- (dim_authors, dim_videos, dim_date, dim_hashtag, bridge_video_hashtag, fact_videos,
+-- fact_video_snapshot).
+--
+-- - Xử lý theo từng khoảng id (chunk) để chạy được trên hàng triệu dòng staging.
+-- - Mỗi raw_json chỉ được parse 1 lần (JSON_TABLE vào bảng tạm tmp_chunk).
+-- - Chỉ đánh dấu processed đúng các dòng đã đọc vào chunk (tmp_chunk_ids); dòng đến sau
+--   khi procedure bắt đầu (id > v_max) hoặc commit muộn trong khoảng id của chunk để lại
+--   cho chunk / lần chạy sau.
+-- - Thời gian (createTime) quy đổi theo UTC, dateKey = YYYYMMDD.
+--
+-- Chạy: mysql < transform.sql   (tạo procedure và gọi với chunk 5000 dòng)
+USE warehouse_tiktok;
+
+DROP PROCEDURE IF EXISTS sp_transform_staging;
+
+DELIMITER //
+CREATE PROCEDURE sp_transform_staging(IN p_chunk_size INT)
+BEGIN
+  DECLARE v_lo BIGINT;
+  DECLARE v_hi BIGINT;
+  DECLARE v_max BIGINT;
+  DECLARE v_tz VARCHAR(64) DEFAULT @@session.time_zone;
+
+  DECLARE EXIT HANDLER FOR SQLEXCEPTION
+  BEGIN
+    ROLLBACK;
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_ids;
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk;
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tags;
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tag_pairs;
+    SET SESSION time_zone = v_tz;
+    RESIGNAL;
+  END;
+
+  SET SESSION time_zone = '+00:00';
+
+  -- Biên trên cố định tại thời điểm bắt đầu
+  SELECT MAX(id) INTO v_max FROM staging_tiktok.staging_raw;
+  SELECT MIN(id) INTO v_lo FROM staging_tiktok.staging_raw WHERE processed = FALSE;
+
+  WHILE v_lo IS NOT NULL AND v_lo <= v_max DO
+    SET v_hi = LEAST(v_lo + p_chunk_size - 1, v_max);
+
+    START TRANSACTION;
+
+    -- 1. Chốt danh sách dòng của chunk: bước 4 chỉ đánh dấu các dòng này, nên dòng do loader
+    --    khác commit muộn vào cùng khoảng id không bị đánh dấu khi chưa được transform
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_ids;
+    CREATE TEMPORARY TABLE tmp_chunk_ids (stagingID BIGINT PRIMARY KEY) AS
+    SELECT id AS stagingID
+    FROM staging_tiktok.staging_raw
+    WHERE id BETWEEN v_lo AND v_hi AND processed = FALSE;
+
+    -- Parse JSON một lần cho cả chunk
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk;
+    CREATE TEMPORARY TABLE tmp_chunk AS
+    SELECT
+      s.id AS stagingID,
+      s.fetched_at,
+      jt.videoID, jt.textContent, jt.createTime, jt.webVideoUrl, jt.duration,
+      jt.authorID, jt.authorName, jt.avatarUrl,
+      jt.diggCount, jt.shareCount, jt.playCount, jt.commentCount, jt.collectCount,
+      jt.hashtags
+    FROM tmp_chunk_ids i
+      JOIN staging_tiktok.staging_raw s ON s.id = i.stagingID,
+      JSON_TABLE(s.raw_json, '$' COLUMNS (
+        videoID      BIGINT       PATH '$.id',
+        textContent  TEXT         PATH '$.text',
+        createTime   BIGINT       PATH '$.createTime',
+        webVideoUrl  TEXT         PATH '$.webVideoUrl',
+        duration     INT          PATH '$.videoMeta.duration',
+        authorID     BIGINT       PATH '$.authorMeta.id',
+        authorName   VARCHAR(255) PATH '$.authorMeta.name',
+        avatarUrl    TEXT         PATH '$.authorMeta.avatar',
+        diggCount    BIGINT       PATH '$.diggCount',
+        shareCount   BIGINT       PATH '$.shareCount',
+        playCount    BIGINT       PATH '$.playCount',
+        commentCount BIGINT       PATH '$.commentCount',
+        collectCount BIGINT       PATH '$.collectCount',
+        hashtags     JSON         PATH '$.hashtags'
+      )) AS jt
+    WHERE jt.videoID IS NOT NULL;
+
+    -- hashtagList: tên hashtag (bỏ rỗng) nối bằng dấu phẩy
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tags;
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tag_pairs;
+    CREATE TEMPORARY TABLE tmp_chunk_tags AS
+    SELECT c.stagingID, GROUP_CONCAT(h.name ORDER BY h.ord SEPARATOR ',') AS hashtagList
+    FROM tmp_chunk c,
+      JSON_TABLE(c.hashtags, '$[*]' COLUMNS (
+        ord  FOR ORDINALITY,
+        name VARCHAR(255) PATH '$.name'
+      )) AS h
+    WHERE h.name IS NOT NULL AND h.name <> ''
+    GROUP BY c.stagingID;
+
+    -- 2. Dimensions (upsert hàng loạt)
+    INSERT INTO dim_authors (authorID, authorName, avatarUrl)
+    SELECT authorID, authorName, avatarUrl
+    FROM tmp_chunk
+    WHERE authorID IS NOT NULL
+    ON DUPLICATE KEY UPDATE
+      authorName = VALUES(authorName),
+      avatarUrl = VALUES(avatarUrl);
+
+    INSERT INTO dim_videos (videoID, authorID, textContent, duration, createTime, webVideoUrl, hashtagList)
+    SELECT c.videoID, c.authorID, c.textContent, c.duration,
+           FROM_UNIXTIME(c.createTime), c.webVideoUrl, t.hashtagList
+    FROM tmp_chunk c
+    LEFT JOIN tmp_chunk_tags t ON t.stagingID = c.stagingID
+    ON DUPLICATE KEY UPDATE
+      authorID = VALUES(authorID),
+      textContent = VALUES(textContent),
+      duration = VALUES(duration),
+      webVideoUrl = VALUES(webVideoUrl),
+      hashtagList = VALUES(hashtagList);
+
+    -- Hashtag (lower-case) + bridge; bridge cũ của video trong chunk được thay mới
+    DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tag_pairs;
+    CREATE TEMPORARY TABLE tmp_chunk_tag_pairs AS
+    SELECT DISTINCT c.videoID, LOWER(TRIM(h.name)) AS name
+    FROM tmp_chunk c,
+      JSON_TABLE(c.hashtags, '$[*]' COLUMNS (name VARCHAR(255) PATH '$.name')) AS h
+    WHERE h.name IS NOT NULL AND TRIM(h.name) <> '';
+
+    INSERT IGNORE INTO dim_hashtag (name)
+    SELECT DISTINCT name FROM tmp_chunk_tag_pairs;
+
+    DELETE FROM bridge_video_hashtag
+    WHERE videoID IN (SELECT videoID FROM tmp_chunk);
+
+    INSERT IGNORE INTO bridge_video_hashtag (hashtagID, videoID)
+    SELECT d.hashtagID, p.videoID
+    FROM tmp_chunk_tag_pairs p
+    JOIN dim_hashtag d ON d.name = p.name;
+
+    INSERT IGNORE INTO dim_date (dateKey, day, date)
+    SELECT DISTINCT
+      CAST(DATE_FORMAT(d, '%Y%m%d') AS UNSIGNED), DAYNAME(d), d
+    FROM (SELECT DATE(FROM_UNIXTIME(createTime)) AS d FROM tmp_chunk WHERE createTime IS NOT NULL) AS x;
+
+    -- 3. Facts
+    INSERT INTO fact_videos (videoID, authorID, dateKey, diggCount, shareCount, playCount,
+                             commentCount, collectCount, createdAt)
+    SELECT videoID, authorID,
+           CAST(DATE_FORMAT(FROM_UNIXTIME(createTime), '%Y%m%d') AS UNSIGNED),
+           diggCount, shareCount, playCount, commentCount, collectCount, fetched_at
+    FROM tmp_chunk;
+
+    -- Snapshot theo ngày crawl: cùng (ngày, video) thì bản sau cùng thắng
+    INSERT INTO fact_video_snapshot (snapshotDateKey, videoID, authorID, dateKey, diggCount, shareCount,
+                                     playCount, commentCount, collectCount, capturedAt)
+    SELECT CAST(DATE_FORMAT(fetched_at, '%Y%m%d') AS UNSIGNED), videoID, authorID,
+           CAST(DATE_FORMAT(FROM_UNIXTIME(createTime), '%Y%m%d') AS UNSIGNED),
+           diggCount, shareCount, playCount, commentCount, collectCount, fetched_at
+    FROM tmp_chunk
+    WHERE fetched_at IS NOT NULL
+    ORDER BY stagingID
+    ON DUPLICATE KEY UPDATE
+      authorID = VALUES(authorID), dateKey = VALUES(dateKey),
+      diggCount = VALUES(diggCount), shareCount = VALUES(shareCount), playCount = VALUES(playCount),
+      commentCount = VALUES(commentCount), collectCount = VALUES(collectCount),
+      capturedAt = VALUES(capturedAt);
+
+    -- Ngày có fact mới -> rollup (agg_*_daily) được tính lại ở lần transformer.rollups.refresh sau
+    INSERT IGNORE INTO agg_dirty_date (dateKey)
+    SELECT DISTINCT CAST(DATE_FORMAT(FROM_UNIXTIME(createTime), '%Y%m%d') AS UNSIGNED)
+    FROM tmp_chunk WHERE createTime IS NOT NULL;
+
+    -- 4. Chỉ đánh dấu các dòng đã chốt ở bước 1 (kể cả dòng không có id video -> bỏ qua)
+    UPDATE staging_tiktok.staging_raw s
+    JOIN tmp_chunk_ids i ON i.stagingID = s.id
+    SET s.processed = TRUE;
+
+    COMMIT;
+
+    SELECT MIN(id) INTO v_lo
+    FROM staging_tiktok.staging_raw
+    WHERE processed = FALSE AND id > v_hi AND id <= v_max;
+  END WHILE;
+
+  DROP TEMPORARY TABLE IF EXISTS tmp_chunk_ids;
+  DROP TEMPORARY TABLE IF EXISTS tmp_chunk;
+  DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tags;
+  DROP TEMPORARY TABLE IF EXISTS tmp_chunk_tag_pairs;
+  SET SESSION time_zone = v_tz;
+END //
+DELIMITER ;
+
+CALL sp_transform_staging(5000);